@@ -0,0 +1,50 @@
+"""Access checks for a single upload, resolved in the database.
+
+The detail and download views used to load the upload by pk and then
+compare ``obj.user != request.user``. That fetched the owner's CustomUser
+row just to compare ids, and read the whole upload before knowing whether
+the caller may see it. These helpers fold the ownership and visibility rules
+into the lookup itself. That is one query on (id, user_id, visibility),
+selecting only the columns the caller uses. The primary key lookup finds the
+single row; user_id and visibility are then checked on that row, so no
+further index is needed.
+
+Every helper returns None both when the upload does not exist and when the
+user may not see it, so responses do not reveal which.
+"""
+from django.db.models import Q
+
+from .models import UploadedFile
+from .serializers import UploadedFileSerializer
+
+# What UploadedFileSerializer reads, and what serve_upload reads.
+DETAIL_COLUMNS = tuple(UploadedFileSerializer.columns_for(UploadedFileSerializer.Meta.fields))
+DOWNLOAD_COLUMNS = ("id", "file", "filename", "content_hash", "file_updated_at", "created_at")
+
+
+def owned_uploads(user):
+    """Uploads ``user`` owns."""
+    return UploadedFile.objects.filter(user_id=user.pk)
+
+
+def downloadable_uploads(user):
+    """Uploads ``user`` may download: their own, plus everyone's public ones."""
+    return UploadedFile.objects.filter(Q(user_id=user.pk) | Q(visibility="public"))
+
+
+def own_upload(user, pk, columns=DETAIL_COLUMNS):
+    """``user``'s upload ``pk`` with only ``columns`` loaded, or None."""
+    return owned_uploads(user).filter(pk=pk).only(*columns).first()
+
+
+def downloadable_upload(user, pk, columns=DOWNLOAD_COLUMNS):
+    """Upload ``pk`` if ``user`` may download it, with only ``columns`` loaded, or None."""
+    return downloadable_uploads(user).filter(pk=pk).only(*columns).first()
+
+
+async def aown_upload(user, pk, columns=DETAIL_COLUMNS):
+    return await owned_uploads(user).filter(pk=pk).only(*columns).afirst()
+
+
+async def adownloadable_upload(user, pk, columns=DOWNLOAD_COLUMNS):
+    return await downloadable_uploads(user).filter(pk=pk).only(*columns).afirst()
@@ -13,7 +13,7 @@ class CustomUserAdmin(UserAdmin):
 	list_editable = ("public_visibility",)
 	list_display_links = ("username",)
 	fieldsets = UserAdmin.fieldsets + (
-		("Profile", {"fields": ("public_visibility", "birth_year", "age", "address")} ),
+		("Profile", {"fields": ("public_visibility", "birth_year", "address")} ),
 	)
 	add_fieldsets = UserAdmin.add_fieldsets + (
 		("Profile", {"fields": ("public_visibility", "birth_year", "address")} ),
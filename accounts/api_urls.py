@@ -1,11 +1,40 @@
+from django.conf import settings
 from django.urls import path
-from .api_views import MyUploadsList, MyUploadDetail, MyUploadDownload, LoginAndMyFiles
+from . import async_views
+from .api_views import (
+    MyUploadsList,
+    MyUploadDetail,
+    MyUploadDownload,
+    LoginAndMyFiles,
+    PublicUserList,
+    PublicCatalogue,
+    ChunkedUploadCreate,
+    ChunkedUploadDetail,
+    ChunkedUploadFinalize,
+)
 
 app_name = "api"
 
+if getattr(settings, "ASYNC_VIEWS", False):
+    # Async variants of the read paths, for deployments served over ASGI
+    my_uploads_view = async_views.my_uploads_list
+    my_upload_detail_view = async_views.my_upload_detail
+    my_upload_download_view = async_views.my_upload_download
+else:
+    my_uploads_view = MyUploadsList.as_view()
+    my_upload_detail_view = MyUploadDetail.as_view()
+    my_upload_download_view = MyUploadDownload.as_view()
+
 urlpatterns = [
-    path("uploads/", MyUploadsList.as_view(), name="my_uploads"),
-    path("uploads/<int:pk>/", MyUploadDetail.as_view(), name="my_upload_detail"),
-    path("uploads/<int:pk>/download/", MyUploadDownload.as_view(), name="my_upload_download"),
+    path("uploads/", my_uploads_view, name="my_uploads"),
+    path("uploads/<int:pk>/", my_upload_detail_view, name="my_upload_detail"),
+    path("uploads/<int:pk>/download/", my_upload_download_view, name="my_upload_download"),
+    # Resumable chunked uploads: init, PUT chunks, finalize
+    path("uploads/chunked/", ChunkedUploadCreate.as_view(), name="chunked_upload_create"),
+    path("uploads/chunked/<uuid:upload_id>/", ChunkedUploadDetail.as_view(), name="chunked_upload"),
+    path("uploads/chunked/<uuid:upload_id>/finalize/", ChunkedUploadFinalize.as_view(), name="chunked_upload_finalize"),
     path("auth/login-and-files/", LoginAndMyFiles.as_view(), name="login_and_files"),
+    path("authors-sellers/", PublicUserList.as_view(), name="authors_sellers"),
+    # Public books, browsable anonymously
+    path("catalogue/", PublicCatalogue.as_view(), name="catalogue"),
 ]
@@ -2,55 +2,99 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
-import mimetypes
+from django.core.files import File
+from django.conf import settings
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.utils.urls import replace_query_param
+from django.utils.cache import patch_cache_control
+import hashlib
+import re
 
-from .models import UploadedFile
-from .serializers import UploadedFileSerializer
+from .models import UploadedFile, ChunkedUpload
+from .serializers import (
+    UploadedFileSerializer,
+    UploadedFileFastSerializer,
+    PublicUserSerializer,
+    ChunkedUploadInitSerializer,
+    ChunkedUploadSerializer,
+    CatalogueFilterSerializer,
+)
+from .forms import UploadedFileForm, DirectoryFilterForm
+from .pagination import KeysetPaginator, InvalidCursor
+from .views import public_users_page
+from .access import own_upload, downloadable_upload
+from .downloads import serve_upload
+from .query_budget import query_budget
+from . import ratelimit
+from .caching import get_or_compute
+from .streaming import STREAMING_RENDERER_CLASSES, wants_stream, iter_serialized, ndjson_response
 
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
 
+
+@query_budget(2)
 class MyUploadsList(APIView):
+    """
+    The authenticated user's uploads, newest first.
+
+    GET ?fields=id,title,... limits the returned fields; ?cursor=... fetches
+    the page linked from `next`.
+    Response: {"next": "<url or null>", "results": [ ... ]}
+
+    With ?stream=1 (or Accept: application/x-ndjson) every upload is streamed
+    unpaginated as NDJSON, one object per line.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = STREAMING_RENDERER_CLASSES
 
     def get(self, request):
-        qs = UploadedFile.objects.filter(user=request.user).order_by("-created_at")
-        serializer = UploadedFileSerializer(qs, many=True, context={"request": request})
-        return Response(serializer.data)
+        fields = UploadedFileSerializer.parse_fields(request.query_params.get("fields"))
+        serializer = UploadedFileFastSerializer(fields)
+        qs = serializer.values(UploadedFile.objects.filter(user=request.user))
+        if wants_stream(request):
+            return ndjson_response(iter_serialized(qs.order_by("-created_at", "-id"), serializer))
+        page_size = getattr(settings, "MY_UPLOADS_PAGE_SIZE", 50)
+        try:
+            page = KeysetPaginator(qs, ("-created_at", "-id"), page_size).page(request.query_params.get("cursor"))
+        except InvalidCursor:
+            return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        next_url = None
+        if page.next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), "cursor", page.next_cursor)
+        return Response({"next": next_url, "results": [serializer.to_representation(row) for row in page]})
 
 
+@query_budget(2)
 class MyUploadDetail(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
-        obj = get_object_or_404(UploadedFile, pk=pk)
         # Only allow owner to access specific file
-        if obj.user != request.user:
+        obj = own_upload(request.user, pk)
+        if obj is None:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
         serializer = UploadedFileSerializer(obj, context={"request": request})
         return Response(serializer.data)
 
 
+@query_budget(2)
 class MyUploadDownload(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
-        obj = get_object_or_404(UploadedFile, pk=pk)
         # Allow owner; optionally allow public visibility files
-        if obj.user != request.user and obj.visibility != "public":
+        obj = downloadable_upload(request.user, pk)
+        if obj is None:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
         if not obj.file:
             return Response({"detail": "File not available."}, status=status.HTTP_404_NOT_FOUND)
 
-        file_handle = obj.file.open("rb")
-        content_type, _ = mimetypes.guess_type(obj.file.name)
-        response = FileResponse(file_handle, content_type=content_type or "application/octet-stream")
-        response["Content-Disposition"] = f"attachment; filename={obj.file.name.split('/')[-1]}"
-        return response
+        return serve_upload(request, obj)
 
 
+@query_budget(2)
 class LoginAndMyFiles(APIView):
     """
     Combined endpoint: authenticate with username/password, issue JWT tokens,
@@ -58,8 +102,15 @@ class LoginAndMyFiles(APIView):
 
     Request: POST {"username": "...", "password": "..."}
     Response: {"access": "...", "refresh": "...", "files": [ ... ]}
+
+    With ?stream=1 (or Accept: application/x-ndjson) the response is NDJSON:
+    a first line {"access": "...", "refresh": "..."} followed by one line per file.
+
+    Too many failed attempts from one IP or for one username get a 429 with
+    Retry-After, before any password is checked (see accounts/ratelimit.py).
     """
     permission_classes = [permissions.AllowAny]
+    renderer_classes = STREAMING_RENDERER_CLASSES
 
     def post(self, request):
         username = request.data.get("username")
@@ -67,8 +118,17 @@ class LoginAndMyFiles(APIView):
         if not username or not password:
             return Response({"detail": "username and password are required"}, status=status.HTTP_400_BAD_REQUEST)
 
+        wait = ratelimit.check_login(request, username)
+        if wait:
+            return Response(
+                {"detail": f"Too many failed login attempts. Try again in {wait} seconds."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(wait)},
+            )
+
         user = authenticate(request, username=username, password=password)
         if user is None or not getattr(user, "is_active", True):
+            ratelimit.record_failure(request, username)
             return Response({"detail": "No active account found with the given credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
         # Issue JWT tokens
@@ -77,10 +137,242 @@ class LoginAndMyFiles(APIView):
 
         # Return user's files
         qs = UploadedFile.objects.filter(user=user).order_by("-created_at")
-        serializer = UploadedFileSerializer(qs, many=True, context={"request": request})
+        serializer = UploadedFileFastSerializer()
+        if wants_stream(request):
+            return ndjson_response(
+                iter_serialized(serializer.values(qs), serializer),
+                header={"access": str(access), "refresh": str(refresh)},
+            )
 
         return Response({
             "access": str(access),
             "refresh": str(refresh),
-            "files": serializer.data,
+            "files": serializer.serialize(qs),
         })
+
+
+@query_budget(1)
+class PublicUserList(APIView):
+    """
+    Public Authors & Sellers directory as JSON.
+
+    GET ?q=... returns the best search matches; without `q` results are
+    paginated newest-first and `next` links to the following page.
+    ?min_age=&max_age= filter by age and ?sort=age|-age orders by it.
+    Response: {"next": "<url or null>", "results": [ ... ]}
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        q = request.query_params.get("q", "").strip()
+        filter_form = DirectoryFilterForm(request.query_params)
+        if not filter_form.is_valid():
+            return Response(filter_form.errors, status=status.HTTP_400_BAD_REQUEST)
+        filters = filter_form.cleaned_data
+        try:
+            page = public_users_page(
+                q,
+                request.query_params.get("cursor"),
+                min_age=filters["min_age"],
+                max_age=filters["max_age"],
+                sort=filters["sort"],
+            )
+        except InvalidCursor:
+            return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        next_url = None
+        if page.next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), "cursor", page.next_cursor)
+        serializer = PublicUserSerializer(page.items, many=True)
+        return Response({"next": next_url, "results": serializer.data})
+
+
+@query_budget(1)
+class PublicCatalogue(APIView):
+    """
+    Browse every public upload, newest first. Open to anonymous clients.
+
+    GET ?year_min=&year_max=&cost_min=&cost_max= filter by inclusive ranges;
+    ?fields=id,title,... limits the returned fields; ?cursor=... fetches the
+    page linked from `next`.
+    Response: {"next": "<url or null>", "results": [ ... ]}
+
+    Pages are cached for CATALOGUE_CACHE_TTL seconds with stampede protection
+    and sent with a matching public Cache-Control so proxies can share them.
+    """
+    permission_classes = [permissions.AllowAny]
+    # Anonymous reads: skip parsing tokens altogether.
+    authentication_classes = []
+
+    def get(self, request):
+        filters = CatalogueFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        fields = UploadedFileSerializer.parse_fields(request.query_params.get("fields"))
+        cursor = request.query_params.get("cursor")
+        ttl = getattr(settings, "CATALOGUE_CACHE_TTL", 30)
+
+        def build_page():
+            serializer = UploadedFileFastSerializer(fields)
+            qs = filters.filter(serializer.values(UploadedFile.objects.filter(visibility="public")))
+            page_size = getattr(settings, "CATALOGUE_PAGE_SIZE", 50)
+            page = KeysetPaginator(qs, ("-created_at", "-id"), page_size).page(cursor)
+            return {"next_cursor": page.next_cursor, "results": [serializer.to_representation(row) for row in page]}
+
+        params = sorted((name, str(value)) for name, value in filters.validated_data.items())
+        key = "catalogue:" + hashlib.sha256(repr((params, fields, cursor)).encode()).hexdigest()
+        try:
+            page = get_or_compute(key, build_page, ttl)
+        except InvalidCursor:
+            return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        next_url = None
+        if page["next_cursor"]:
+            next_url = replace_query_param(request.build_absolute_uri(), "cursor", page["next_cursor"])
+        response = Response({"next": next_url, "results": page["results"]})
+        patch_cache_control(response, public=True, max_age=ttl)
+        return response
+
+
+class _AssembledFile(File):
+    """A finished chunked upload on disk.
+
+    `temporary_file_path` lets FileSystemStorage move the file into place
+    instead of copying it; `content_type` is what UploadedFileForm validates.
+    """
+
+    def __init__(self, upload):
+        super().__init__(open(upload.temp_path, "rb"), name=upload.filename)
+        self.content_type = upload.content_type
+        self._path = upload.temp_path
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def _own_chunked_upload(request, upload_id):
+    return get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+
+
+@query_budget(2)
+class ChunkedUploadCreate(APIView):
+    """
+    Start a resumable upload.
+
+    Request: POST {"filename", "content_type", "total_size", "sha256"?,
+                   "title", "description", "visibility", "cost", "year_published"}
+    Response: 201 {"id", "offset", ...}; then PUT chunks to /api/uploads/chunked/<id>/
+    and POST /api/uploads/chunked/<id>/finalize/.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        protocol = ChunkedUploadInitSerializer(data=request.data)
+        protocol.is_valid(raise_exception=True)
+        # Validate book metadata with the same rules as the Upload Books form.
+        metadata = {name: request.data.get(name) for name in UploadedFileForm.Meta.fields if name != "file"}
+        metadata = {name: value for name, value in metadata.items() if value is not None}
+        form = UploadedFileForm(metadata)
+        form.fields["file"].required = False
+        if not form.is_valid():
+            return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
+        upload = ChunkedUpload.objects.create(user=request.user, metadata=metadata, **protocol.validated_data)
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+
+@query_budget(3)
+class ChunkedUploadDetail(APIView):
+    """
+    GET: current `offset`, to resume after an interruption.
+    PUT: append raw bytes at the current offset. Send `Content-Range: bytes
+    start-end/total` (start must equal the offset) or just a body, which is
+    appended at the offset. Responds 409 with the server offset on mismatch.
+    DELETE: abort the upload.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, upload_id):
+        return Response(ChunkedUploadSerializer(_own_chunked_upload(request, upload_id)).data)
+
+    def put(self, request, upload_id):
+        upload = _own_chunked_upload(request, upload_id)
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length <= 0:
+            return Response({"detail": "Empty chunk."}, status=status.HTTP_400_BAD_REQUEST)
+        start = upload.offset
+        content_range = request.META.get("HTTP_CONTENT_RANGE")
+        if content_range:
+            match = _CONTENT_RANGE_RE.match(content_range.strip())
+            if not match or int(match[3]) != upload.total_size or int(match[2]) - int(match[1]) + 1 != length:
+                return Response({"detail": "Invalid Content-Range."}, status=status.HTTP_400_BAD_REQUEST)
+            start = int(match[1])
+        if start != upload.offset:
+            return Response(
+                {"detail": "Chunk does not start at the current offset.", "offset": upload.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if start + length > upload.total_size:
+            return Response({"detail": "Chunk exceeds total_size."}, status=status.HTTP_400_BAD_REQUEST)
+
+        written = upload.append(request.stream, start, length)
+        # Only advance if nobody else moved the offset meanwhile.
+        advanced = ChunkedUpload.objects.filter(pk=upload.pk, offset=start).update(offset=start + written)
+        if not advanced:
+            upload.refresh_from_db()
+            return Response(
+                {"detail": "Upload was modified concurrently.", "offset": upload.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        upload.offset = start + written
+        return Response(ChunkedUploadSerializer(upload).data)
+
+    def delete(self, request, upload_id):
+        _own_chunked_upload(request, upload_id).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@query_budget(14)
+class ChunkedUploadFinalize(APIView):
+    """
+    Verify the assembled file and create the UploadedFile.
+
+    Request: POST {"sha256": "..."} (optional if given when the upload started)
+    Response: 201 with the new upload. On checksum mismatch the upload is
+    reset to offset 0 so it can be sent again.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, upload_id):
+        upload = _own_chunked_upload(request, upload_id)
+        if upload.offset != upload.total_size:
+            return Response(
+                {"detail": "Upload is incomplete.", "offset": upload.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        expected = (request.data.get("sha256") or upload.sha256 or "").lower()
+        if not expected:
+            return Response({"detail": "sha256 is required."}, status=status.HTTP_400_BAD_REQUEST)
+        digest = upload.compute_sha256()
+        if digest != expected:
+            upload.discard_file()
+            upload.offset = 0
+            upload.save(update_fields=["offset"])
+            return Response(
+                {"detail": "Checksum mismatch; the upload was reset.", "offset": 0},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        assembled = _AssembledFile(upload)
+        try:
+            form = UploadedFileForm(upload.metadata, {"file": assembled})
+            if not form.is_valid():
+                return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
+            obj = form.save(commit=False)
+            obj.user = request.user
+            obj.content_hash = digest
+            obj.save()
+        finally:
+            assembled.close()
+        upload.delete()
+        serializer = UploadedFileSerializer(obj, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def _ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import ensure_search_index
+
+    ensure_search_index(connections[using])
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .middleware import install_query_recorder
+
+        connection_created.connect(install_query_recorder, dispatch_uid="accounts.record_query")
+
+        post_migrate.connect(_ensure_search_index, sender=self)
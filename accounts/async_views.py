@@ -0,0 +1,133 @@
+"""Async variants of the read-only upload views, for running under ASGI.
+
+With ASYNC_VIEWS = True the URLconfs route the uploads list, detail and
+download endpoints, and the session download, here instead of to the DRF
+views. The responses are the same. Queries use the async ORM and file bytes
+are streamed from an async iterator (see ``downloads.aserve_upload``), so a
+slow client holds a coroutine on the event loop rather than a whole worker.
+
+DRF's APIView is sync-only, so JWT authentication and the error bodies are
+reproduced here with simplejwt directly.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .access import adownloadable_upload, aown_upload
+from .downloads import aserve_upload
+from .models import UploadedFile
+from .query_budget import query_budget
+from .pagination import KeysetPaginator, InvalidCursor
+from .serializers import UploadedFileSerializer, UploadedFileFastSerializer
+from .streaming import NDJSON_CONTENT_TYPE, aiter_serialized, ndjson_response
+
+_authenticator = JWTAuthentication()
+
+
+def _json(data, status=200):
+    return JsonResponse(
+        data,
+        status=status,
+        safe=False,
+        encoder=JSONEncoder,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+def _error(exc):
+    # Same body as DRF's exception handler.
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}
+    response = _json(data, status=exc.status_code)
+    if exc.status_code == 401:
+        response["WWW-Authenticate"] = _authenticator.authenticate_header(None)
+    return response
+
+
+def jwt_required(view):
+    """Authenticate the request with a JWT access token, as the API's IsAuthenticated views do."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await sync_to_async(_authenticator.authenticate)(request)
+            if result is None:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as exc:
+            return _error(exc)
+        request.user, request.auth = result
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _wants_stream(request):
+    if request.GET.get("stream", "").lower() in {"1", "true", "yes"}:
+        return True
+    return request.GET.get("format") == "ndjson" or NDJSON_CONTENT_TYPE in request.headers.get("Accept", "")
+
+
+@query_budget(2)
+@require_safe
+@jwt_required
+async def my_uploads_list(request):
+    """Async MyUploadsList: the same paged (or NDJSON streamed) listing."""
+    try:
+        fields = UploadedFileSerializer.parse_fields(request.GET.get("fields"))
+    except exceptions.ValidationError as exc:
+        return _error(exc)
+    serializer = UploadedFileFastSerializer(fields)
+    qs = serializer.values(UploadedFile.objects.filter(user=request.user))
+    if _wants_stream(request):
+        return ndjson_response(aiter_serialized(qs.order_by("-created_at", "-id"), serializer))
+    page_size = getattr(settings, "MY_UPLOADS_PAGE_SIZE", 50)
+    try:
+        page = await KeysetPaginator(qs, ("-created_at", "-id"), page_size).apage(request.GET.get("cursor"))
+    except InvalidCursor:
+        return _json({"detail": "Invalid cursor."}, status=400)
+    next_url = None
+    if page.next_cursor:
+        next_url = replace_query_param(request.build_absolute_uri(), "cursor", page.next_cursor)
+    return _json({"next": next_url, "results": [serializer.to_representation(row) for row in page]})
+
+
+@query_budget(2)
+@require_safe
+@jwt_required
+async def my_upload_detail(request, pk):
+    # Only allow owner to access specific file
+    obj = await aown_upload(request.user, pk)
+    if obj is None:
+        return _json({"detail": "Not found."}, status=404)
+    return _json(UploadedFileSerializer(obj, context={"request": request}).data)
+
+
+@query_budget(2)
+@require_safe
+@jwt_required
+async def my_upload_download(request, pk):
+    # Allow owner; optionally allow public visibility files
+    obj = await adownloadable_upload(request.user, pk)
+    if obj is None:
+        return _json({"detail": "Not found."}, status=404)
+    if not obj.file:
+        return _json({"detail": "File not available."}, status=404)
+    return await aserve_upload(request, obj)
+
+
+@query_budget(3)
+@login_required
+async def download_my_book(request, pk):
+    """Async views.download_my_book for the My Books page."""
+    obj = await adownloadable_upload(await request.auser(), pk)
+    if obj is None:
+        raise Http404("No upload matches the given query.")
+    if not obj.file:
+        return HttpResponseRedirect(reverse("accounts:my_books"))
+    return await aserve_upload(request, obj)
@@ -0,0 +1,111 @@
+"""Helpers shared by the ``bench_*`` management commands.
+
+Benchmarks never touch the configured database: they run against a throwaway
+test database created for the duration of the run.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+FIRST_NAMES = ["alice", "bruno", "chen", "divya", "emeka", "fatima", "goran", "hana", "ivan", "julia"]
+LAST_NAMES = ["smith", "garcia", "kumar", "nguyen", "okafor", "rossi", "sato", "schmidt", "silva", "weber"]
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Run the body against a freshly migrated test database.
+
+    The test environment is set up too, so the test ``Client`` works and mail
+    goes to the in-memory backend.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def seed_users(count, start=0, batch_size=10000):
+    """Bulk insert ``count`` public users numbered from ``start``.
+
+    Passwords are left unusable so seeding does not pay for password hashing.
+    """
+    User = get_user_model()
+    now = timezone.now()
+    created = 0
+    while created < count:
+        batch = []
+        for i in range(start + created, start + min(count, created + batch_size)):
+            first = FIRST_NAMES[i % len(FIRST_NAMES)]
+            last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+            batch.append(User(
+                username=f"{first}{i}",
+                first_name=first.title(),
+                last_name=last.title(),
+                email=f"{first}.{last}{i}@example.com",
+                password="!",
+                date_joined=now - timezone.timedelta(seconds=i),
+            ))
+        with transaction.atomic():
+            User.objects.bulk_create(batch, batch_size=batch_size)
+        created += len(batch)
+    return created
+
+
+def seed_uploads(user, count, batch_size=5000):
+    """Bulk insert ``count`` upload rows for ``user``; the file names point at no real file."""
+    from .models import UploadedFile
+
+    description = "A benchmark book description. " * 6
+    created = 0
+    while created < count:
+        batch = [
+            UploadedFile(
+                user=user,
+                title=f"Benchmark book {i}",
+                description=description,
+                visibility="public" if i % 2 else "private",
+                cost=i % 50,
+                year_published=1950 + i % 75,
+                file=f"uploads/bench/book{i}.pdf",
+            )
+            for i in range(created, min(count, created + batch_size))
+        ]
+        with transaction.atomic():
+            UploadedFile.objects.bulk_create(batch, batch_size=batch_size)
+        created += len(batch)
+    # bulk_create skips the signal that maintains the denormalized count.
+    get_user_model().objects.filter(pk=user.pk).update(upload_count=F("upload_count") + created)
+    user.refresh_from_db(fields=["upload_count"])
+    return created
+
+
+def time_call(func, repeat=5):
+    """Call ``func`` ``repeat`` times and return the wall-clock samples in seconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def median_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def percentiles_ms(samples, points=(50, 95, 99)):
+    """The given percentiles of ``samples`` (seconds), in milliseconds."""
+    if len(samples) < 2:
+        return {f"p{p}": (samples[0] if samples else 0.0) * 1000 for p in points}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {f"p{p}": cuts[p - 1] * 1000 for p in points}
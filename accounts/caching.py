@@ -0,0 +1,127 @@
+"""Per-user, versioned fragment caching for the uploads listings.
+
+The rendered uploads list on My Books and Upload Books is cached per user
+under a version token. Any save or delete of one of the user's UploadedFile
+rows replaces the token once the transaction commits (see accounts.signals),
+which orphans every cached fragment for that user at once; stale entries
+simply age out. The token is random rather than a counter, so an evicted
+version key can never resurrect an old fragment.
+
+Hits and misses are counted in the cache and reported by ``stats()``.
+
+``get_or_compute`` caches shared, anonymous results (the public catalogue)
+for a short TTL with stampede protection. Once an entry goes stale, one
+caller takes a lock and recomputes it while everyone else keeps getting the
+stale value, so an expiry never sends a burst of identical queries to the
+database.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.safestring import mark_safe
+
+_STATS_KEYS = ("hits", "misses")
+
+
+def _cache():
+    return caches[getattr(settings, "FRAGMENT_CACHE_ALIAS", "default")]
+
+
+def _version_key(user_id):
+    return f"uploads:version:{user_id}"
+
+
+def uploads_version(user_id):
+    """The current version token for ``user_id``'s uploads."""
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_uploads_version(user_id):
+    """Invalidate every cached uploads fragment of ``user_id``."""
+    _cache().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def cached_uploads_fragment(request, template_name, context):
+    """Render ``template_name`` for ``request.user``, or return the cached rendering.
+
+    Querysets in ``context`` should be lazy so a hit never touches the database.
+    """
+    key = ":".join([
+        "uploads:fragment",
+        template_name,
+        str(request.user.pk),
+        uploads_version(request.user.pk),
+        translation.get_language() or "",
+        timezone.get_current_timezone_name(),
+    ])
+    cache = _cache()
+    html = cache.get(key)
+    if html is not None:
+        _bump("hits")
+        return mark_safe(html)
+    _bump("misses")
+    html = render_to_string(template_name, context, request=request)
+    cache.set(key, str(html), timeout=getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 3600))
+    return html
+
+
+def _bump(name):
+    cache = _cache()
+    key = f"uploads:stats:{name}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def stats():
+    """Hit/miss counters since the cache was last cleared."""
+    values = _cache().get_many([f"uploads:stats:{name}" for name in _STATS_KEYS])
+    counts = {name: values.get(f"uploads:stats:{name}", 0) for name in _STATS_KEYS}
+    total = counts["hits"] + counts["misses"]
+    counts["hit_ratio"] = round(counts["hits"] / total, 4) if total else None
+    return counts
+
+
+def get_or_compute(key, compute, ttl, stale_ttl=None, lock_timeout=10):
+    """Return the cached value for ``key``, recomputing it with ``compute()`` when stale.
+
+    Values are served fresh for ``ttl`` seconds and then, while one caller
+    recomputes, stale for up to ``stale_ttl`` more (default: ``ttl``). Callers
+    finding nothing cached while another recomputes wait up to a second for
+    its result before computing it themselves.
+    """
+    cache = _cache()
+    stale_ttl = ttl if stale_ttl is None else stale_ttl
+    entry = cache.get(key)
+    if entry is not None and entry["fresh_until"] > time.time():
+        return entry["value"]
+
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, timeout=lock_timeout)
+    if not locked:
+        if entry is not None:
+            return entry["value"]
+        for _ in range(20):
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry["value"]
+    try:
+        value = compute()
+        cache.set(key, {"value": value, "fresh_until": time.time() + ttl}, timeout=ttl + stale_ttl)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,225 @@
+"""Serving uploaded files for the session and JWT download views.
+
+Responses carry a strong ETag (the stored SHA-256 of the content),
+Last-Modified and Accept-Ranges, and conditional requests are answered with
+304 before any file is touched. The bytes themselves are sent by the backend
+named in the DOWNLOAD_BACKEND setting: FileResponseBackend streams them from
+Python (serving single byte ranges with 206), while XAccelRedirectBackend and
+XSendfileBackend hand the transfer off to the front proxy.
+
+``aserve_upload`` is the variant for async views: FileResponseBackend then
+streams from an async iterator whose reads run in worker threads, so under
+ASGI a slow client holds a coroutine rather than a thread.
+"""
+import mimetypes
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import filepath_to_uri
+from django.utils.module_loading import import_string
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .models import UploadedFile
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 64 * 1024
+
+
+def upload_etag(obj):
+    """Strong ETag for ``obj``; hashes and stores the content on first use for older rows."""
+    if not obj.content_hash:
+        obj.content_hash = obj.compute_content_hash()
+        UploadedFile.objects.filter(pk=obj.pk).update(content_hash=obj.content_hash)
+    return quote_etag(obj.content_hash)
+
+
+def _requested_range(request, size, etag, last_modified):
+    """Return (start, end) inclusive for a satisfiable single range, None to send
+    the whole file, or False when the range cannot be satisfied."""
+    header = request.META.get("HTTP_RANGE", "")
+    if not header or request.method not in ("GET", "HEAD"):
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range:
+        if if_range.startswith(('"', "W/")):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: serve the full representation.
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return False
+    elif last:
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        start, end = max(size - suffix, 0), size - 1
+    else:
+        return None
+    return start, end
+
+
+def _iter_range(open_file, start, length):
+    """Yield ``length`` bytes from ``start`` of the file ``open_file()`` returns.
+
+    The file is only opened once the body starts being sent, so a response
+    closed before that (the client went away) leaves no handle open.
+    """
+    handle = open_file()
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+async def _aiter_range(open_file, start, length):
+    # Blocking reads go to the default executor rather than the thread that
+    # runs the sync ORM calls, so downloads don't queue behind each other.
+    handle = await sync_to_async(open_file, thread_sensitive=False)()
+    read = sync_to_async(handle.read, thread_sensitive=False)
+    try:
+        await sync_to_async(handle.seek, thread_sensitive=False)(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(handle.close, thread_sensitive=False)()
+
+
+def _range_response(request, size, byte_range, open_body):
+    """Build the 200/206/416 response; ``open_body(start, length)`` returns the streamed content."""
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+    if request.method == "HEAD":
+        response = HttpResponse()
+    else:
+        response = StreamingHttpResponse(open_body(start, length))
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(length)
+    return response
+
+
+class FileResponseBackend:
+    """Stream the file through the Python worker. The development default."""
+
+    def serve(self, request, obj, etag, last_modified):
+        size = obj.file.size
+        byte_range = _requested_range(request, size, etag, last_modified)
+        return _range_response(
+            request, size, byte_range, lambda start, length: _iter_range(lambda: obj.file.open("rb"), start, length)
+        )
+
+    async def aserve(self, request, obj, etag, last_modified):
+        size = await sync_to_async(lambda: obj.file.size, thread_sensitive=False)()
+        byte_range = _requested_range(request, size, etag, last_modified)
+        return _range_response(
+            request, size, byte_range, lambda start, length: _aiter_range(lambda: obj.file.open("rb"), start, length)
+        )
+
+
+class XAccelRedirectBackend:
+    """Hand the transfer to nginx with X-Accel-Redirect.
+
+    DOWNLOAD_ACCEL_REDIRECT_PREFIX must name an `internal` nginx location that
+    aliases MEDIA_ROOT, e.g. "/protected-media/". nginx then serves the bytes,
+    including range requests, without holding a worker.
+    """
+
+    def serve(self, request, obj, etag, last_modified):
+        prefix = getattr(settings, "DOWNLOAD_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + filepath_to_uri(obj.file.name)
+        return response
+
+
+class XSendfileBackend:
+    """Hand the transfer to Apache (mod_xsendfile) or lighttpd with X-Sendfile."""
+    header = "X-Sendfile"
+
+    def serve(self, request, obj, etag, last_modified):
+        response = HttpResponse()
+        response[self.header] = obj.file.path
+        return response
+
+
+def get_download_backend():
+    """Instantiate the backend named by the DOWNLOAD_BACKEND setting."""
+    path = getattr(settings, "DOWNLOAD_BACKEND", "accounts.downloads.FileResponseBackend")
+    return import_string(path)()
+
+
+def _validators(obj, etag):
+    last_modified = int((obj.file_updated_at or obj.created_at).timestamp())
+    return last_modified, {"ETag": etag, "Last-Modified": http_date(last_modified)}
+
+
+def _not_modified(request, etag, last_modified, validators):
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        for header, value in validators.items():
+            conditional.headers.setdefault(header, value)
+    return conditional
+
+
+def _finish(response, obj, validators):
+    if response.status_code != 416:
+        content_type, _ = mimetypes.guess_type(obj.download_name)
+        response["Content-Type"] = content_type or "application/octet-stream"
+        response["Content-Disposition"] = content_disposition_header(True, obj.download_name)
+    response["Accept-Ranges"] = "bytes"
+    for header, value in validators.items():
+        response[header] = value
+    return response
+
+
+def serve_upload(request, obj):
+    """Return the download response for ``obj``, whose access was already checked."""
+    etag = upload_etag(obj)
+    last_modified, validators = _validators(obj, etag)
+    conditional = _not_modified(request, etag, last_modified, validators)
+    if conditional is not None:
+        return conditional
+    response = get_download_backend().serve(request, obj, etag, last_modified)
+    return _finish(response, obj, validators)
+
+
+async def aserve_upload(request, obj):
+    """Async ``serve_upload`` for async views."""
+    etag = quote_etag(obj.content_hash) if obj.content_hash else await sync_to_async(upload_etag)(obj)
+    last_modified, validators = _validators(obj, etag)
+    conditional = _not_modified(request, etag, last_modified, validators)
+    if conditional is not None:
+        return conditional
+    backend = get_download_backend()
+    if hasattr(backend, "aserve"):
+        response = await backend.aserve(request, obj, etag, last_modified)
+    else:
+        response = await sync_to_async(backend.serve)(request, obj, etag, last_modified)
+    return _finish(response, obj, validators)
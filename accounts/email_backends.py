@@ -0,0 +1,159 @@
+"""SMTP email backend that reuses authenticated connections.
+
+Django's SMTP backend connects, runs STARTTLS and logs in for every
+``send_mail`` call, then quits. PooledSMTPBackend keeps those connections in a
+per-process pool instead: ``open()`` checks out an idle connection when one is
+available and ``close()`` hands it back rather than quitting.
+
+- Connections idle for longer than EMAIL_POOL_HEALTHCHECK_AFTER seconds are
+  probed with NOOP before reuse; dead ones are dropped.
+- Connections idle for longer than EMAIL_POOL_IDLE_TIMEOUT seconds are quit,
+  well before typical SMTP servers time them out.
+- At most EMAIL_POOL_SIZE idle connections are kept per server and account.
+- A connection that failed mid-conversation is never returned to the pool.
+
+Enable it with EMAIL_BACKEND = "accounts.email_backends.PooledSMTPBackend".
+"""
+import atexit
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _quit(connection):
+    try:
+        connection.quit()
+    except Exception:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _is_alive(connection):
+    try:
+        return connection.noop()[0] == 250
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    """Idle SMTP connections for one server and account, most recently used first."""
+
+    def __init__(self):
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def acquire(self, idle_timeout, healthcheck_after):
+        """Return a usable idle connection, or None when a new one must be opened."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, released_at = self._idle.pop()
+            idle = time.monotonic() - released_at
+            if idle > idle_timeout or (idle > healthcheck_after and not _is_alive(connection)):
+                _quit(connection)
+                continue
+            return connection
+
+    def release(self, connection, max_size, idle_timeout):
+        """Keep ``connection`` for reuse; return False when the pool is full."""
+        now = time.monotonic()
+        with self._lock:
+            stale = []
+            while self._idle and now - self._idle[0][1] > idle_timeout:
+                stale.append(self._idle.popleft()[0])
+            kept = len(self._idle) < max_size
+            if kept:
+                self._idle.append((connection, now))
+        for old in stale:
+            _quit(old)
+        return kept
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            _quit(connection)
+
+    def __len__(self):
+        return len(self._idle)
+
+
+def get_pool(key):
+    """The pool for ``key`` in this process; pools inherited across fork() are dropped."""
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._pid != os.getpid():
+            # Sockets inherited from a parent process must not be shared; just forget them.
+            pool = _pools[key] = ConnectionPool()
+        return pool
+
+
+def close_pooled_connections():
+    """Quit every idle pooled connection in this process."""
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool._pid == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.clear()
+
+
+atexit.register(close_pooled_connections)
+
+
+class PooledSMTPBackend(EmailBackend):
+    """Drop-in replacement for django.core.mail.backends.smtp.EmailBackend."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = getattr(settings, "EMAIL_POOL_SIZE", 4)
+        self.idle_timeout = getattr(settings, "EMAIL_POOL_IDLE_TIMEOUT", 60)
+        self.healthcheck_after = getattr(settings, "EMAIL_POOL_HEALTHCHECK_AFTER", 5)
+        self._broken = False
+
+    @property
+    def pool(self):
+        return get_pool((self.host, self.port, self.username, self.use_tls, self.use_ssl))
+
+    def open(self):
+        if self.connection:
+            return False
+        connection = self.pool.acquire(self.idle_timeout, self.healthcheck_after)
+        if connection is not None:
+            self.connection = connection
+            # Report a new connection so send_messages() calls close(), which releases it.
+            return True
+        return super().open()
+
+    def close(self):
+        # smtplib drops .sock once the server has hung up.
+        if self.connection is not None and not self._broken and self.connection.sock is not None:
+            if self.pool.release(self.connection, self.pool_size, self.idle_timeout):
+                self.connection = None
+        self._broken = False
+        super().close()
+
+    def _send(self, email_message):
+        try:
+            sent = super()._send(email_message)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The server answered, so the session is still usable.
+            raise
+        except Exception:
+            self._broken = True
+            raise
+        if not sent and email_message.recipients():
+            # fail_silently swallowed an SMTP error; keep the session only if it still answers.
+            self._broken = self._broken or not _is_alive(self.connection)
+        return sent
@@ -1,10 +1,43 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.utils import validate_file_name
 from .models import UploadedFile
+from .sniffing import sniff, UnsupportedContent
 from django.utils import timezone
 
 
+# Field rules shared by the web forms and `manage.py import_data`.
+def validate_birth_year(birth_year):
+    if birth_year is None:
+        return
+    # simple sanity bounds; adjust as needed
+    if birth_year < 1900:
+        raise forms.ValidationError("Birth year must be >= 1900")
+    if birth_year > timezone.localdate().year:
+        raise forms.ValidationError("Birth year cannot be in the future.")
+
+
+def validate_year_published(y):
+    if y is None:
+        return
+    if y < 1500:
+        raise forms.ValidationError("Please enter a reasonable publication year (>= 1500).")
+    current_year = timezone.now().year
+    if y > current_year:
+        raise forms.ValidationError(f"Publication year cannot be in the future (<= {current_year}).")
+
+
+def validate_cost(c):
+    if c is None:
+        return
+    if c < 0:
+        raise forms.ValidationError("Cost must be a non-negative amount.")
+
+
 class CustomUserCreationForm(UserCreationForm):
     """User creation form bound to the custom user model.
 
@@ -25,11 +58,7 @@ class CustomUserCreationForm(UserCreationForm):
 
     def clean_birth_year(self):
         birth_year = self.cleaned_data.get("birth_year")
-        if birth_year is None:
-            return birth_year
-        # simple sanity bounds; adjust as needed
-        if birth_year < 1900:
-            raise forms.ValidationError("Birth year must be >= 1900")
+        validate_birth_year(birth_year)
         return birth_year
 
 
@@ -81,32 +110,95 @@ class UploadedFileForm(forms.ModelForm):
         f = self.cleaned_data.get("file")
         if not f:
             return f
-        content_type = getattr(f, "content_type", None)
-        allowed = {"application/pdf", "image/jpeg"}
-        if content_type not in allowed:
+        # Don't trust the client-supplied content_type: check the magic bytes,
+        # reading only the head of the file, and keep the extracted metadata.
+        try:
+            info = sniff(f)
+        except UnsupportedContent:
             raise forms.ValidationError("Only PDF and JPEG files are allowed.")
+        self.instance.apply_file_info(info)
         return f
 
     def clean_year_published(self):
         y = self.cleaned_data.get("year_published")
-        if y is None:
-            return y
-        if y < 1500:
-            raise forms.ValidationError("Please enter a reasonable publication year (>= 1500).")
-        current_year = timezone.now().year
-        if y > current_year:
-            raise forms.ValidationError(f"Publication year cannot be in the future (<= {current_year}).")
+        validate_year_published(y)
         return y
 
     def clean_cost(self):
         c = self.cleaned_data.get("cost")
-        if c is None:
-            return c
-        if c < 0:
-            raise forms.ValidationError("Cost must be a non-negative amount.")
+        validate_cost(c)
         return c
 
 
+def validate_password_hash(password):
+    try:
+        identify_hasher(password)
+    except ValueError:
+        raise forms.ValidationError("Must be an encoded password hash, not a raw password.")
+
+
+def validate_storage_name(name):
+    """A relative name inside upload storage: no absolute path, no `..` component."""
+    try:
+        validate_file_name(name, allow_relative_path=True)
+    except SuspiciousFileOperation:
+        raise forms.ValidationError("Must be a relative path inside upload storage.")
+
+
+# The import forms are applied field by field (without instantiating a form per
+# row), so their rules live in field validators rather than clean_<field> methods.
+class UserImportForm(forms.Form):
+    """One user row for `manage.py import_data`, checked with the registration rules.
+
+    `password` is optional and must already be an encoded hash (as stored by
+    Django); users imported without one get an unusable password.
+    """
+    username = forms.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = forms.EmailField(required=False)
+    first_name = forms.CharField(max_length=150, required=False)
+    last_name = forms.CharField(max_length=150, required=False)
+    public_visibility = forms.NullBooleanField(required=False)
+    birth_year = forms.IntegerField(required=False, validators=[validate_birth_year])
+    address = forms.CharField(required=False)
+    password = forms.CharField(required=False, validators=[validate_password_hash])
+
+
+class UploadImportForm(forms.Form):
+    """One book row for `manage.py import_data`, checked with the UploadedFileForm rules.
+
+    `username` names the owner. `file` is optional: the name of a file already
+    in upload storage.
+    """
+    username = forms.CharField(max_length=150)
+    title = forms.CharField(max_length=200)
+    description = forms.CharField(required=False)
+    visibility = forms.ChoiceField(choices=UploadedFile.VISIBILITY_CHOICES, required=False)
+    cost = forms.DecimalField(max_digits=8, decimal_places=2, required=False, validators=[validate_cost])
+    year_published = forms.IntegerField(required=False, validators=[validate_year_published])
+    file = forms.CharField(max_length=100, required=False, validators=[validate_storage_name])
+
+
+class DirectoryFilterForm(forms.Form):
+    """Age filters and sort order for the Authors & Sellers directory (web page and API)."""
+    SORT_CHOICES = [
+        ("", "Newest members"),
+        ("age", "Youngest first"),
+        ("-age", "Oldest first"),
+    ]
+
+    # Bounded above too: age_between subtracts them from the current year in SQL.
+    min_age = forms.IntegerField(required=False, min_value=0, max_value=150, label="Min age")
+    max_age = forms.IntegerField(required=False, min_value=0, max_value=150, label="Max age")
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        min_age, max_age = cleaned.get("min_age"), cleaned.get("max_age")
+        if min_age is not None and max_age is not None and min_age > max_age:
+            raise forms.ValidationError("Min age must not exceed max age.")
+        return cleaned
+
+
 class TwoStepLoginForm(forms.Form):
     username = forms.CharField(label="Username")
     password = forms.CharField(label="Password", widget=forms.PasswordInput)
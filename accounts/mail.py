@@ -0,0 +1,164 @@
+"""Durable outbound mail queue.
+
+Views call ``enqueue_mail`` instead of ``send_mail`` so a slow SMTP server
+never stalls a login request; the ``send_queued_mail`` management command
+delivers queued messages in batches, one SMTP connection per batch, retrying
+failures with exponential backoff. Delivery goes through the configured
+EMAIL_BACKEND, so the console, file and locmem backends work for development
+and tests. With MAIL_QUEUE_EAGER = True messages are delivered right after the
+enqueuing transaction commits, without a worker.
+
+Bodies can hold secrets such as login codes, so a message's body is blanked
+once it is sent, and ``purge_mail`` (the ``purge_sent_mail`` command) deletes
+finished messages after MAIL_QUEUE_RETENTION_DAYS. A message enqueued with a
+``ttl`` is failed instead of retried once that many seconds have passed.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None, ttl=None):
+    """Queue a plain-text message for delivery and return the OutboundEmail row.
+
+    A message with a ``ttl`` (seconds) is given up on once it is that old.
+    """
+    queued = OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or "",
+        recipients=list(recipient_list),
+        expires_at=timezone.now() + timezone.timedelta(seconds=ttl) if ttl is not None else None,
+    )
+    if _setting("MAIL_QUEUE_EAGER", False):
+        transaction.on_commit(lambda: deliver([queued]))
+    return queued
+
+
+def claim_batch(batch_size=None):
+    """Mark up to ``batch_size`` due messages as sending and return them.
+
+    A claim is a lease: if the worker dies, the messages become due again once
+    MAIL_QUEUE_LEASE_SECONDS have passed.
+    """
+    batch_size = batch_size or _setting("MAIL_QUEUE_BATCH_SIZE", 50)
+    now = timezone.now()
+    expire_mail(now)
+    due = OutboundEmail.objects.filter(
+        Q(status=OutboundEmail.STATUS_QUEUED) | Q(status=OutboundEmail.STATUS_SENDING),
+        next_attempt_at__lte=now,
+    ).order_by("next_attempt_at")
+    lease_until = now + timezone.timedelta(seconds=_setting("MAIL_QUEUE_LEASE_SECONDS", 300))
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list("pk", flat=True)[:batch_size])
+        # The status/time filter makes the claim safe even without row locks.
+        OutboundEmail.objects.filter(pk__in=ids, next_attempt_at__lte=now).exclude(
+            status__in=[OutboundEmail.STATUS_SENT, OutboundEmail.STATUS_FAILED]
+        ).update(status=OutboundEmail.STATUS_SENDING, next_attempt_at=lease_until)
+    return list(OutboundEmail.objects.filter(pk__in=ids, next_attempt_at=lease_until))
+
+
+def expire_mail(now=None):
+    """Fail unsent messages whose ``expires_at`` has passed, blanking their bodies; return how many."""
+    expired = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.STATUS_QUEUED, OutboundEmail.STATUS_SENDING],
+        expires_at__lte=now or timezone.now(),
+    ).update(status=OutboundEmail.STATUS_FAILED, body="", last_error="Expired before it could be sent.")
+    if expired:
+        logger.warning("Dropped %s queued message(s) that expired before delivery", expired)
+    return expired
+
+
+def purge_mail(days=None):
+    """Delete sent and failed messages older than ``days`` (MAIL_QUEUE_RETENTION_DAYS); return how many."""
+    days = _setting("MAIL_QUEUE_RETENTION_DAYS", 7) if days is None else days
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    deleted, _ = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.STATUS_SENT, OutboundEmail.STATUS_FAILED], created_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def _retry_delay(attempts):
+    base = _setting("MAIL_QUEUE_RETRY_BASE_SECONDS", 30)
+    cap = _setting("MAIL_QUEUE_RETRY_MAX_SECONDS", 3600)
+    return min(base * 2 ** (attempts - 1), cap)
+
+
+def deliver(batch):
+    """Send ``batch`` over a single backend connection; return the number sent."""
+    if not batch:
+        return 0
+    max_attempts = _setting("MAIL_QUEUE_MAX_ATTEMPTS", 5)
+    sent = 0
+    smtp = get_connection(fail_silently=False)
+    try:
+        smtp.open()
+    except Exception as exc:
+        logger.warning("Could not open mail connection: %s", exc)
+        for queued in batch:
+            _record_failure(queued, exc, max_attempts)
+        return 0
+    try:
+        for queued in batch:
+            email = EmailMessage(
+                subject=queued.subject,
+                body=queued.body,
+                from_email=queued.from_email or None,
+                to=queued.recipients,
+                connection=smtp,
+            )
+            try:
+                email.send()
+            except Exception as exc:
+                logger.warning("Sending queued mail %s failed: %s", queued.pk, exc)
+                _record_failure(queued, exc, max_attempts)
+            else:
+                OutboundEmail.objects.filter(pk=queued.pk).update(
+                    status=OutboundEmail.STATUS_SENT,
+                    body="",
+                    attempts=queued.attempts + 1,
+                    sent_at=timezone.now(),
+                    last_error="",
+                )
+                sent += 1
+    finally:
+        smtp.close()
+    return sent
+
+
+def _record_failure(queued, exc, max_attempts):
+    attempts = queued.attempts + 1
+    now = timezone.now()
+    next_attempt_at = now + timezone.timedelta(seconds=_retry_delay(attempts))
+    changes = {"status": OutboundEmail.STATUS_QUEUED}
+    if queued.expires_at is not None and next_attempt_at >= queued.expires_at:
+        changes = {"status": OutboundEmail.STATUS_FAILED, "body": ""}
+        next_attempt_at = now
+        logger.error("Giving up on queued mail %s: it expires before the next attempt", queued.pk)
+    elif attempts >= max_attempts:
+        changes["status"], next_attempt_at = OutboundEmail.STATUS_FAILED, now
+        logger.error("Giving up on queued mail %s after %s attempts", queued.pk, attempts)
+    OutboundEmail.objects.filter(pk=queued.pk).update(
+        attempts=attempts, next_attempt_at=next_attempt_at, last_error=str(exc)[:2000], **changes
+    )
+
+
+def process_queue(batch_size=None):
+    """Claim and deliver one batch; return (claimed, sent)."""
+    batch = claim_batch(batch_size)
+    return len(batch), deliver(batch)
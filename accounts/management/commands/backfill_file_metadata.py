@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import UploadedFile
+from accounts.sniffing import sniff, UnsupportedContent
+
+
+class Command(BaseCommand):
+    help = "Sniff uploads that predate content sniffing and store their type, size, page count and dimensions."
+
+    def handle(self, *args, **opts):
+        updated = unsupported = missing = 0
+        pending = UploadedFile.objects.filter(mime_type="").exclude(file="").only("pk", "file")
+        for obj in pending.iterator(chunk_size=500):
+            storage = obj.file.storage
+            if not storage.exists(obj.file.name):
+                missing += 1
+                continue
+            with storage.open(obj.file.name, "rb") as fh:
+                try:
+                    info = sniff(fh)
+                except UnsupportedContent:
+                    unsupported += 1
+                    self.stderr.write(f"Upload {obj.pk} is neither PDF nor JPEG: {obj.file.name}")
+                    continue
+            UploadedFile.objects.filter(pk=obj.pk).update(size=storage.size(obj.file.name), **info)
+            updated += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} upload(s); {unsupported} unsupported, {missing} missing file(s)."
+        ))
@@ -0,0 +1,213 @@
+import json
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.bench import benchmark_database, percentiles_ms, seed_uploads, seed_users
+from accounts.models import UploadedFile
+
+PASSWORD = "bench-password"
+METRICS = ("p50", "p95", "p99", "queries", "peak_kib")
+
+
+def _consume(response):
+    """Read the whole body, as a client would, and return the response."""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every accounts endpoint end to end (authors & sellers, My Books, MyUploadsList, "
+        "LoginAndMyFiles and both download views) through the test Client, on a throwaway test "
+        "database seeded with --users users and --uploads uploads. Reports p50/p95/p99 latency, "
+        "queries per request and peak traced memory per request. --output saves the run as JSON; "
+        "--compare checks it against a saved run and fails on regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Users to seed (default: 1000)")
+        parser.add_argument("--uploads", type=int, default=1000, help="Uploads for the benchmark user (default: 1000)")
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per endpoint (default: 200)")
+        parser.add_argument(
+            "--login-requests",
+            type=int,
+            default=20,
+            help="Timed LoginAndMyFiles requests; each one hashes a password (default: 20)",
+        )
+        parser.add_argument("--file-size", type=int, default=256 * 1024, help="Bytes in the downloaded file (default: 262144)")
+        parser.add_argument("--endpoints", nargs="+", help="Only run these endpoints (names as printed)")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--compare", help="A JSON file from an earlier --output run to compare against")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Allowed relative slowdown of p95 and peak memory before --compare fails (default: 0.2)",
+        )
+
+    def handle(self, *args, **opts):
+        baseline = None
+        if opts["compare"]:
+            try:
+                with open(opts["compare"], encoding="utf-8") as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read {opts['compare']}: {exc}")
+
+        # Uploaded files go to a scratch MEDIA_ROOT, not the real one.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with benchmark_database():
+                results = self._run(opts)
+
+        run = {
+            "meta": {
+                "users": opts["users"],
+                "uploads": opts["uploads"],
+                "requests": opts["requests"],
+                "login_requests": opts["login_requests"],
+                "file_size": opts["file_size"],
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "results": results,
+        }
+        self._print(results)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                json.dump(run, fh, indent=2)
+            self.stdout.write(f"Results written to {opts['output']}.")
+        if baseline is not None:
+            self._compare(baseline, run, opts["threshold"])
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def _endpoints(self, opts):
+        """Name -> (client, method, url, request kwargs) for each endpoint, after seeding."""
+        User = get_user_model()
+        seed_users(opts["users"])
+        user = User.objects.create_user("bench", "bench@example.com", PASSWORD)
+        seed_uploads(user, max(opts["uploads"] - 1, 0))
+        book = UploadedFile(user=user, title="Benchmark download", visibility="private")
+        book.file = ContentFile(b"%PDF-1.4\n" + b"\0" * max(opts["file_size"] - 9, 0), name="bench.pdf")
+        book.save()
+
+        session = Client()
+        session.force_login(user)
+        api = Client(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        credentials = {"username": "bench", "password": PASSWORD}
+        return {
+            "authors_sellers": (session, "get", reverse("accounts:authors_sellers"), {}),
+            "my_books_dashboard": (session, "get", reverse("accounts:my_books"), {}),
+            "MyUploadsList": (api, "get", reverse("api:my_uploads"), {}),
+            "LoginAndMyFiles": (Client(), "post", reverse("api:login_and_files"), {"data": credentials}),
+            "MyUploadDownload": (api, "get", reverse("api:my_upload_download", args=[book.pk]), {}),
+            "download_my_book": (session, "get", reverse("accounts:download_my_book", args=[book.pk]), {}),
+        }
+
+    def _run(self, opts):
+        endpoints = self._endpoints(opts)
+        selected = opts["endpoints"] or list(endpoints)
+        unknown = sorted(set(selected) - set(endpoints))
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(unknown)}. Choose from {', '.join(endpoints)}.")
+
+        results = {}
+        for name in selected:
+            client, method, url, kwargs = endpoints[name]
+            request = getattr(client, method)
+            count = opts["login_requests"] if name == "LoginAndMyFiles" else opts["requests"]
+            caches["default"].clear()
+
+            # Warm up (fills caches, compiles templates), then count one steady-state request.
+            for _ in range(3):
+                response = _consume(request(url, **kwargs))
+                if response.status_code != 200:
+                    raise CommandError(f"{name}: {method.upper()} {url} returned {response.status_code}")
+            with CaptureQueriesContext(connection) as queries:
+                _consume(request(url, **kwargs))
+            # Read now: connection.queries is reset at the start of every request.
+            per_request = len(queries)
+
+            samples = []
+            for _ in range(count):
+                started = time.perf_counter()
+                _consume(request(url, **kwargs))
+                samples.append(time.perf_counter() - started)
+
+            # Memory is traced in a separate pass; tracemalloc would skew the timings.
+            peaks = []
+            tracemalloc.start()
+            for _ in range(min(count, 5)):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                _consume(request(url, **kwargs))
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+
+            results[name] = {
+                **percentiles_ms(samples),
+                "mean": statistics.fmean(samples) * 1000,
+                "queries": per_request,
+                "peak_kib": max(peaks) / 1024,
+                "requests": count,
+            }
+        return results
+
+    def _print(self, results):
+        self.stdout.write(f"{'endpoint':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>9}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<20} {row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f} "
+                f"{row['queries']:>8} {row['peak_kib']:>9.0f}"
+            )
+
+    def _compare(self, baseline, run, threshold):
+        old_meta, new_meta = baseline.get("meta", {}), run["meta"]
+        for key in ("users", "uploads", "file_size", "database"):
+            if old_meta.get(key) != new_meta.get(key):
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline {key}={old_meta.get(key)!r} differs from this run ({new_meta.get(key)!r}); "
+                    "the numbers may not be comparable."
+                ))
+
+        self.stdout.write(f"\n{'endpoint':<20} " + " ".join(f"{name:>18}" for name in METRICS))
+        regressions = []
+        for name, row in run["results"].items():
+            old = baseline.get("results", {}).get(name)
+            if old is None:
+                self.stdout.write(f"{name:<20} (not in baseline)")
+                continue
+            cells = []
+            for metric in METRICS:
+                before, after = old[metric], row[metric]
+                change = (after - before) / before if before else 0.0
+                cells.append(f"{after:>9.1f} ({change:+6.0%})")
+            self.stdout.write(f"{name:<20} " + " ".join(f"{cell:>18}" for cell in cells))
+
+            # p95 and memory are noisy, so they get a tolerance; query counts are exact.
+            if row["queries"] > old["queries"]:
+                regressions.append(f"{name}: queries per request {old['queries']} -> {row['queries']}")
+            for metric in ("p95", "peak_kib"):
+                if old[metric] and row[metric] > old[metric] * (1 + threshold):
+                    regressions.append(f"{name}: {metric} {old[metric]:.1f} -> {row[metric]:.1f}")
+
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {threshold:.0%} against {baseline['meta'].get('created', 'the baseline')}."))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from accounts.bench import benchmark_database, seed_users, time_call, median_ms
+from accounts.search import search_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark Authors & Sellers search: the old four-way icontains scan vs. the indexed "
+        "search backend, at growing user counts, on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10000, 100000, 1000000],
+            help="User counts to measure at (default: 10000 100000 1000000)",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query (default: 5)")
+        parser.add_argument("--limit", type=int, default=50, help="Results fetched per search (default: 50)")
+
+    def handle(self, *args, **opts):
+        sizes = sorted(opts["sizes"])
+        repeat = opts["repeat"]
+        limit = opts["limit"]
+        User = get_user_model()
+
+        def scan(q):
+            return list(
+                User.objects.filter(public_visibility=True)
+                .filter(
+                    Q(username__icontains=q)
+                    | Q(first_name__icontains=q)
+                    | Q(last_name__icontains=q)
+                    | Q(email__icontains=q)
+                )
+                .order_by("-date_joined")[:limit]
+            )
+
+        def indexed(q):
+            return list(search_users(User.objects.filter(public_visibility=True), q)[:limit])
+
+        with benchmark_database():
+            seeded = 0
+            self.stdout.write("users      query            scan ms   index ms   speedup")
+            for size in sizes:
+                seeded += seed_users(size - seeded, start=seeded)
+                # A common surname, a first-name prefix and a single unique username.
+                for q in ("okafor", "fat", f"julia{size - 1}"):
+                    scan_ms = median_ms(time_call(lambda: scan(q), repeat))
+                    index_ms = median_ms(time_call(lambda: indexed(q), repeat))
+                    self.stdout.write(
+                        f"{size:<10} {q:<16} {scan_ms:>8.2f} {index_ms:>10.2f} {scan_ms / max(index_ms, 1e-6):>8.1f}x"
+                    )
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+
+from accounts.bench import benchmark_database, seed_uploads, time_call, median_ms
+from accounts.models import UploadedFile
+from accounts.serializers import UploadedFileSerializer, UploadedFileFastSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark UploadedFileSerializer vs. UploadedFileFastSerializer for the "
+        "MyUploadsList page and LoginAndMyFiles listing shapes, on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Uploads to seed (default: 10000)")
+        parser.add_argument("--page-size", type=int, default=50, help="MyUploadsList page size (default: 50)")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (default: 5)")
+
+    def handle(self, *args, **opts):
+        rows = opts["rows"]
+        page_size = opts["page_size"]
+        repeat = opts["repeat"]
+        with benchmark_database():
+            user = get_user_model().objects.create_user("bench", "bench@example.com", "bench-password")
+            seed_uploads(user, rows)
+            listing = UploadedFile.objects.filter(user=user).order_by("-created_at", "-id")
+            cases = [
+                ("MyUploadsList page", listing[:page_size], page_size),
+                ("LoginAndMyFiles", listing, rows),
+            ]
+
+            self.stdout.write("case                  serializer   median ms    rows/s")
+            for label, qs, count in cases:
+                slow = UploadedFileSerializer(qs, many=True).data
+                fast = UploadedFileFastSerializer().serialize(qs)
+                if list(slow) != fast:
+                    raise CommandError(f"{label}: fast serializer output differs from UploadedFileSerializer")
+                for name, func in (
+                    ("drf", lambda: UploadedFileSerializer(qs, many=True).data),
+                    ("fast", lambda: UploadedFileFastSerializer().serialize(qs)),
+                ):
+                    ms = median_ms(time_call(func, repeat))
+                    self.stdout.write(f"{label:<21} {name:<10} {ms:>11.2f} {count / (ms / 1000):>9.0f}")
+        self.stdout.write(self.style.SUCCESS("Done. Outputs were verified identical before timing."))
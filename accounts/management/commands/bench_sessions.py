@@ -0,0 +1,58 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.bench import benchmark_database, seed_uploads
+from accounts.sessions import local_sessions
+
+ENGINES = [
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+    "django.contrib.sessions.backends.signed_cookies",
+    "accounts.sessions",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark signed-in requests to the My Books dashboard with each session engine "
+        "(requests/second and queries per request), on a throwaway test database. Uses the "
+        "configured CACHES; set REDIS_URL to measure against a real network cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per engine (default: 500)")
+        parser.add_argument("--uploads", type=int, default=20, help="Uploads shown on the dashboard (default: 20)")
+        parser.add_argument("--engines", nargs="+", default=ENGINES, help="SESSION_ENGINE values to compare")
+
+    def handle(self, *args, **opts):
+        count = opts["requests"]
+        url = reverse("accounts:my_books")
+        with benchmark_database():
+            user = get_user_model().objects.create_user("bench", "bench@example.com", "bench-password")
+            seed_uploads(user, opts["uploads"])
+            self.stdout.write("engine                                            req/s   queries/req")
+            for engine in opts["engines"]:
+                with override_settings(SESSION_ENGINE=engine):
+                    caches["default"].clear()
+                    local_sessions.clear()
+                    client = Client()
+                    client.force_login(user)
+                    # Warm up, then count queries on a steady-state request.
+                    assert client.get(url).status_code == 200
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url)
+                    # Read now: connection.queries is reset at the start of every request.
+                    per_request = len(queries)
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        client.get(url)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(f"{engine:<48} {count / elapsed:>6.0f} {per_request:>13}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,105 @@
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.email_backends import close_pooled_connections
+
+BACKENDS = {
+    "stock": "django.core.mail.backends.smtp.EmailBackend",
+    "pooled": "accounts.email_backends.PooledSMTPBackend",
+}
+
+
+class _CountingHandler:
+    def __init__(self):
+        self.received = 0
+        self._lock = threading.Lock()
+
+    async def handle_DATA(self, server, session, envelope):
+        with self._lock:
+            self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the stock SMTP backend against PooledSMTPBackend on a local aiosmtpd server. "
+        "Each message is sent the way send_mail does it: a new backend instance per message. "
+        "Pass --tls-cert/--tls-key to require STARTTLS and measure the handshake cost too."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500, help="Messages sent per backend (default: 500)")
+        parser.add_argument("--threads", type=int, default=1, help="Concurrent senders (default: 1)")
+        parser.add_argument("--tls-cert", help="PEM certificate for STARTTLS; also trusted by the client")
+        parser.add_argument("--tls-key", help="PEM private key for --tls-cert")
+
+    def handle(self, *args, **opts):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            raise CommandError("bench_smtp needs the aiosmtpd package: pip install aiosmtpd")
+        count = opts["messages"]
+        threads = max(1, opts["threads"])
+        use_tls = bool(opts["tls_cert"])
+        handler = _CountingHandler()
+        server_kwargs = {}
+        client_context = None
+        if use_tls:
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(opts["tls_cert"], opts["tls_key"])
+            server_kwargs = {"tls_context": server_context, "require_starttls": True}
+            client_context = ssl.create_default_context(cafile=opts["tls_cert"])
+            client_context.check_hostname = False
+
+        controller = Controller(handler, hostname="127.0.0.1", port=_free_port(), **server_kwargs)
+        controller.start()
+        try:
+            self.stdout.write(f"messages={count} threads={threads} starttls={use_tls}")
+            self.stdout.write("backend    seconds   msgs/s")
+            results = {}
+            for label, path in BACKENDS.items():
+                close_pooled_connections()
+
+                def send_one(i, path=path):
+                    backend = get_connection(
+                        path,
+                        host=controller.hostname,
+                        port=controller.port,
+                        username="",
+                        password="",
+                        use_tls=use_tls,
+                        use_ssl=False,
+                        timeout=10,
+                        fail_silently=False,
+                    )
+                    if client_context is not None:
+                        backend.ssl_context = client_context
+                    EmailMessage(f"Benchmark {i}", "body", "bench@example.com", ["to@example.com"],
+                                 connection=backend).send()
+
+                before = handler.received
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    list(pool.map(send_one, range(count)))
+                elapsed = time.perf_counter() - started
+                delivered = handler.received - before
+                if delivered != count:
+                    self.stderr.write(f"{label}: server received {delivered} of {count} messages")
+                results[label] = count / elapsed
+                self.stdout.write(f"{label:<10} {elapsed:>7.2f} {results[label]:>8.0f}")
+            close_pooled_connections()
+        finally:
+            controller.stop()
+        self.stdout.write(self.style.SUCCESS(f"Pooled speedup: {results['pooled'] / results['stock']:.1f}x"))
@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.test import Client
+
+from accounts.bench import benchmark_database, seed_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare peak memory of the buffered LoginAndMyFiles response vs. the NDJSON "
+        "streaming mode, on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000, help="Uploads to seed (default: 100000)")
+
+    def _measure(self, func):
+        # Time an untraced run; tracemalloc slows allocation-heavy code down a lot.
+        started = time.perf_counter()
+        size = func()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size, elapsed, peak
+
+    def handle(self, *args, **opts):
+        rows = opts["rows"]
+        with benchmark_database():
+            user = get_user_model().objects.create_user("bench", "bench@example.com", "bench-password")
+            seed_uploads(user, rows)
+            client = Client()
+            credentials = {"username": "bench", "password": "bench-password"}
+
+            def buffered():
+                response = client.post("/api/auth/login-and-files/", credentials)
+                return len(response.content)
+
+            def streamed():
+                response = client.post("/api/auth/login-and-files/?stream=1", credentials)
+                return sum(len(chunk) for chunk in response.streaming_content)
+
+            self.stdout.write(f"{rows} uploads")
+            self.stdout.write("mode        bytes         seconds   peak MiB")
+            for name, func in (("buffered", buffered), ("streaming", streamed)):
+                size, elapsed, peak = self._measure(func)
+                self.stdout.write(f"{name:<11} {size:<13} {elapsed:>7.2f} {peak / 2**20:>10.1f}")
+        self.stdout.write(self.style.SUCCESS("Done. Peak is Python heap usage measured with tracemalloc."))
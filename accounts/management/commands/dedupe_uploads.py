@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import UploadedFile
+from accounts.storage import acquire_blob
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing uploads into content-addressed storage, sharing one blob per distinct "
+        "file, and report the disk space reclaimed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Hash files and report savings without moving anything")
+
+    def handle(self, *args, **opts):
+        dry_run = opts["dry_run"]
+        storage = UploadedFile._meta.get_field("file").storage
+        if not hasattr(storage, "digest_from_name"):
+            raise CommandError("STORAGES['uploads'] is not a content-addressed storage.")
+
+        migrated = missing = 0
+        bytes_before = bytes_after = 0
+        seen = set()
+        # Several rows can share one legacy file (import_data creates such rows),
+        # so migrate per file: every row on it moves in one step, and the old
+        # file is removed only once nothing points at it any more.
+        names = UploadedFile.objects.exclude(file="").order_by().values_list("file", flat=True).distinct()
+        for old_name in list(names):
+            if storage.digest_from_name(old_name):
+                continue
+            rows = UploadedFile.objects.filter(file=old_name)
+            if not storage.exists(old_name):
+                for pk in rows.values_list("pk", flat=True):
+                    missing += 1
+                    self.stderr.write(f"Missing file for upload {pk}: {old_name}")
+                continue
+            size = storage.size(old_name)
+            bytes_before += size
+            # Hash the bytes on disk; a stored content_hash may be stale.
+            digest = hashlib.sha256()
+            with storage.open(old_name, "rb") as fh:
+                for chunk in fh.chunks():
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+            new_name = storage.blob_name(digest, old_name)
+            if digest not in seen and not storage.exists(new_name):
+                bytes_after += size
+            seen.add(digest)
+            if dry_run:
+                migrated += rows.count()
+                continue
+
+            with storage.open(old_name, "rb") as fh:
+                new_name = storage.save(old_name, fh)
+            with transaction.atomic():
+                rows.filter(filename="").update(filename=os.path.basename(old_name))
+                count = rows.update(file=new_name, content_hash=digest)
+                acquire_blob(new_name, storage, count)
+            migrated += count
+            os.remove(storage.path(old_name))
+
+        reclaimed = bytes_before - bytes_after
+        verb = "Would migrate" if dry_run else "Migrated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {migrated} upload(s) into {len(seen)} blob(s); "
+            f"{reclaimed} bytes ({reclaimed / 2**20:.1f} MiB) reclaimed. {missing} file(s) missing."
+        ))
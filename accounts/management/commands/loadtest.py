@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.bench import percentiles_ms
+
+
+def _parse_target(value):
+    label, sep, url = value.partition("=")
+    if not sep:
+        label, url = value, value
+    parts = urlsplit(url)
+    if parts.scheme != "http" or not parts.hostname:
+        raise CommandError(f"Target {value!r} must be an http:// URL, optionally prefixed with 'label='.")
+    return label, parts.hostname, parts.port or 80
+
+
+async def _request(host, port, method, path, headers, body=b"", read_delay=0.0, read_size=16 * 1024, timeout=30):
+    """One HTTP/1.1 request on a fresh connection; returns (status, body bytes, seconds).
+
+    With ``read_delay`` the body is read ``read_size`` bytes at a time with a
+    pause in between, like a client on a slow link.
+    """
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if body:
+            lines.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        status = int(head.split(b" ", 2)[1])
+        received = []
+        while chunk := await asyncio.wait_for(reader.read(read_size), timeout):
+            received.append(chunk)
+            if read_delay:
+                await asyncio.sleep(read_delay)
+        return status, b"".join(received), time.perf_counter() - started
+    finally:
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test running servers with many concurrent, optionally slow-reading clients and "
+        "compare how many requests each completes. Start the same project under WSGI and ASGI, e.g. "
+        "`gunicorn -w 4 social_book.wsgi -b :8000` and `ASYNC_VIEWS=True uvicorn --workers 4 "
+        "social_book.asgi:application --port 8001`, then run `manage.py loadtest --target "
+        "wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001 --username U --password P "
+        "--path /api/uploads/1/download/`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target", action="append", required=True, help="[label=]http://host:port to test; repeat to compare"
+        )
+        parser.add_argument("--path", default="/api/uploads/", help="Path to request (default: /api/uploads/)")
+        parser.add_argument("--token", help="JWT access token sent as Authorization: Bearer")
+        parser.add_argument("--username", help="Obtain a token from /auth/jwt/create/ on each target")
+        parser.add_argument("--password", help="Password for --username")
+        parser.add_argument("--connections", type=int, default=200, help="Concurrent clients (default: 200)")
+        parser.add_argument("--duration", type=float, default=20.0, help="Seconds per target (default: 20)")
+        parser.add_argument(
+            "--read-delay",
+            type=float,
+            default=0.0,
+            help="Seconds each client waits between 16 KiB reads, to simulate slow links (default: 0)",
+        )
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds (default: 30)")
+
+    def handle(self, *args, **opts):
+        if opts["username"] and opts["password"] is None:
+            raise CommandError("--username needs --password.")
+        results = [asyncio.run(self._run_target(opts, *_parse_target(target))) for target in opts["target"]]
+        self.stdout.write(
+            f"{'target':<12} {'done':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'MB/s':>7}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['label']:<12} {row['done']:>7} {row['rps']:>8.1f} {row['p50']:>8.1f} "
+                f"{row['p95']:>8.1f} {row['p99']:>8.1f} {row['errors']:>7} {row['mbps']:>7.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    async def _token(self, opts, host, port):
+        if opts["token"] or not opts["username"]:
+            return opts["token"]
+        body = json.dumps({"username": opts["username"], "password": opts["password"]}).encode()
+        status, payload, _ = await _request(
+            host, port, "POST", "/auth/jwt/create/", {"Content-Type": "application/json"}, body, timeout=opts["timeout"]
+        )
+        if status != 200:
+            raise CommandError(f"Could not obtain a token from {host}:{port} (HTTP {status}).")
+        return json.loads(payload)["access"]
+
+    async def _run_target(self, opts, label, host, port):
+        token = await self._token(opts, host, port)
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        deadline = time.perf_counter() + opts["duration"]
+        latencies, errors, received = [], 0, 0
+
+        async def client():
+            nonlocal errors, received
+            while time.perf_counter() < deadline:
+                try:
+                    status, body, seconds = await _request(
+                        host, port, "GET", opts["path"], headers,
+                        read_delay=opts["read_delay"], timeout=opts["timeout"],
+                    )
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    # Back off briefly so a refusing server isn't hammered in a tight loop.
+                    await asyncio.sleep(0.05)
+                    continue
+                if status >= 400:
+                    errors += 1
+                    continue
+                latencies.append(seconds)
+                received += len(body)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(opts["connections"])))
+        elapsed = time.perf_counter() - started
+        return {
+            "label": label,
+            "done": len(latencies),
+            "rps": len(latencies) / elapsed,
+            **percentiles_ms(latencies),
+            "errors": errors,
+            "mbps": received / elapsed / 1e6,
+        }
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import ChunkedUpload
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads (and their partial files) that were started but never finalized."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24, help="Age in hours after which to purge (default: 24)")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+
+    def handle(self, *args, **opts):
+        cutoff = timezone.now() - timezone.timedelta(hours=opts["hours"])
+        stale = ChunkedUpload.objects.filter(created_at__lt=cutoff)
+        count = 0
+        for upload in stale.iterator():
+            count += 1
+            if not opts["dry_run"]:
+                upload.delete()
+        verb = "Would delete" if opts["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} stale chunked upload(s)."))
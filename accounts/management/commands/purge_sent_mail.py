@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.mail import expire_mail, purge_mail
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sent and failed messages from the outbound mail queue once they are older than "
+        "MAIL_QUEUE_RETENTION_DAYS, and fail unsent messages that have expired."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=None, help="Age in days after which to purge (default: MAIL_QUEUE_RETENTION_DAYS)"
+        )
+
+    def handle(self, *args, **opts):
+        expired = expire_mail()
+        deleted = purge_mail(opts["days"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} old message(s); {expired} expired unsent."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts import ratelimit
+
+
+class Command(BaseCommand):
+    help = (
+        "Show how many login attempts the rate limiter rejected and how many password hashes that saved. "
+        "The counters live in the cache, so this needs a cache shared with the web workers (set REDIS_URL)."
+    )
+
+    def handle(self, *args, **opts):
+        if not ratelimit.shared_cache():
+            self.stderr.write(self.style.WARNING(
+                "The rate limiter's cache is local to each process, so the web workers' counters are not "
+                "visible here. Set REDIS_URL (or RATE_LIMIT_CACHE_ALIAS) to a shared cache."
+            ))
+        for name, value in ratelimit.stats().items():
+            self.stdout.write(f"{name:<16} {value}")
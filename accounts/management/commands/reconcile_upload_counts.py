@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import UploadedFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount every user's uploads and fix CustomUser.upload_count where it drifted "
+        "(e.g. after bulk_create() or raw SQL, which bypass the signals)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drifted users without fixing them")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        actual = Coalesce(
+            Subquery(
+                UploadedFile.objects.filter(user=OuterRef("pk"))
+                .order_by()
+                .values("user")
+                .annotate(n=Count("pk"))
+                .values("n")
+            ),
+            0,
+        )
+        drifted = User.objects.annotate(actual=actual).exclude(upload_count=F("actual"))
+        rows = list(drifted.values_list("pk", "username", "upload_count", "actual"))
+        for pk, username, stored, counted in rows:
+            self.stdout.write(f"{username} (id {pk}): stored {stored}, actual {counted}")
+        if opts["dry_run"]:
+            self.stdout.write(f"{len(rows)} user(s) drifted; nothing changed (--dry-run).")
+            return
+        fixed = User.objects.filter(pk__in=[row[0] for row in rows]).update(upload_count=actual)
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} user(s)."))
@@ -0,0 +1,55 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from accounts.mail import process_queue
+
+logger = logging.getLogger(__name__)
+
+
+def _worker(batch_size):
+    try:
+        return process_queue(batch_size)
+    except Exception:
+        # One failed batch must not stop the other workers or the polling loop;
+        # its claimed messages become due again when their lease runs out.
+        logger.exception("Mail queue worker failed")
+        return 0, 0
+    finally:
+        # Each pool thread has its own DB connection; don't leak it.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver messages from the outbound mail queue. Each worker thread claims a batch "
+        "and sends it over one connection; failures are retried with exponential backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Sender threads (default: 4)")
+        parser.add_argument("--batch-size", type=int, default=50, help="Messages per connection (default: 50)")
+        parser.add_argument("--loop", action="store_true", help="Keep polling the queue instead of exiting when empty")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds between polls with --loop (default: 2)")
+
+    def handle(self, *args, **opts):
+        workers = max(1, opts["workers"])
+        batch_size = opts["batch_size"]
+        total_sent = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                close_old_connections()
+                results = list(pool.map(_worker, [batch_size] * workers))
+                claimed = sum(c for c, _ in results)
+                sent = sum(s for _, s in results)
+                total_sent += sent
+                if claimed:
+                    self.stdout.write(f"Sent {sent}/{claimed} queued message(s).")
+                    continue
+                if not opts["loop"]:
+                    break
+                time.sleep(opts["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Done. {total_sent} message(s) sent."))
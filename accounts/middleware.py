@@ -0,0 +1,281 @@
+"""Request-level performance instrumentation.
+
+``PerformanceMiddleware`` measures every request: total time, SQL query count
+and time, template render time and response size. A database execute wrapper
+(installed on each connection as it opens, see ``apps.py``) and the timed
+template backend (``accounts.template_backends.DjangoTemplates``) report into
+the current request's ``RequestStats``. It is held in a context variable, so
+this works for sync and async views alike, including ORM calls made from
+``sync_to_async`` threads.
+
+The measurements go out in three ways:
+
+* a ``Server-Timing`` header (SERVER_TIMING_HEADER, on by default with DEBUG),
+  so the browser's network panel shows the breakdown;
+* per-view Prometheus metrics at ``/metrics`` (restricted to
+  METRICS_ALLOWED_IPS), labelled by URL name, e.g. ``accounts:my_books``;
+* a warning log and the ``n_plus_one_total`` counter whenever a request runs the
+  same statement N_PLUS_ONE_THRESHOLD or more times, the usual sign of a
+  missing ``select_related``/``prefetch_related``;
+* a warning log and ``query_budget_exceeded_total`` when a view runs more
+  queries than its ``@query_budget`` (see accounts/query_budget.py).
+
+Metrics are kept per process. Under a multi-process server each scrape sees
+one worker's numbers; label them by instance in Prometheus.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .query_budget import budget_for
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("request_stats", default=None)
+# Collapse the placeholder lists of IN (...) and multi-row VALUES so batches
+# of different sizes count as the same statement.
+_PLACEHOLDER_RUN_RE = re.compile(r"%s(?:\s*,\s*%s)+")
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self._template_depth = 0
+
+    def repeated_statements(self, threshold):
+        """(sql, count) for statements run at least ``threshold`` times, most repeated first."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def current_stats():
+    """The ``RequestStats`` of the request being handled, or None outside one."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper: time each statement for the current request."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - started
+        stats.queries += 1
+        stats.statements[_PLACEHOLDER_RUN_RE.sub("%s, ...", sql)] += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """``connection_created`` receiver adding ``record_query`` to the connection's wrappers."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class timed_template:
+    """Context manager adding the enclosed render time to the current request.
+
+    Nested renders (a template tag rendering another template) are counted
+    once, by the outermost render.
+    """
+
+    def __enter__(self):
+        self.stats = _current.get()
+        if self.stats is not None:
+            self.stats._template_depth += 1
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            self.stats._template_depth -= 1
+            if not self.stats._template_depth:
+                self.stats.template_time += time.perf_counter() - self.started
+
+
+class MetricsRegistry:
+    """Per-view counters and a request duration histogram, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._requests = Counter()
+            self._durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+            self._duration_sums = Counter()
+            self._sums = defaultdict(Counter)
+
+    def observe(self, view, method, status, duration, stats, response_bytes, n_plus_one, over_budget=0):
+        with self._lock:
+            self._requests[(view, method, str(status))] += 1
+            buckets = self._durations[view]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self._duration_sums[view] += duration
+            sums = self._sums[view]
+            sums["db_queries_total"] += stats.queries
+            sums["db_seconds_total"] += stats.sql_time
+            sums["template_seconds_total"] += stats.template_time
+            sums["n_plus_one_total"] += n_plus_one
+            sums["query_budget_exceeded_total"] += over_budget
+            if response_bytes is not None:
+                sums["response_bytes_total"] += response_bytes
+
+    def add_response_bytes(self, view, count):
+        """Count streamed bytes, which are only known as the body is sent."""
+        with self._lock:
+            self._sums[view]["response_bytes_total"] += count
+
+    def render(self):
+        lines = [
+            "# HELP socialbook_requests_total Requests handled, by view, method and status.",
+            "# TYPE socialbook_requests_total counter",
+        ]
+        with self._lock:
+            for (view, method, status), count in sorted(self._requests.items()):
+                lines.append(f'socialbook_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            lines += [
+                "# HELP socialbook_request_duration_seconds Time to produce the response (streamed bodies excluded).",
+                "# TYPE socialbook_request_duration_seconds histogram",
+            ]
+            for view, buckets in sorted(self._durations.items()):
+                cumulative = 0
+                for bound, count in zip((*DURATION_BUCKETS, "+Inf"), buckets):
+                    cumulative += count
+                    lines.append(f'socialbook_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'socialbook_request_duration_seconds_sum{{view="{view}"}} {self._duration_sums[view]:.6f}')
+                lines.append(f'socialbook_request_duration_seconds_count{{view="{view}"}} {cumulative}')
+            for name, kind, help_text in _SUM_METRICS:
+                lines += [f"# HELP socialbook_{name} {help_text}", f"# TYPE socialbook_{name} {kind}"]
+                for view, sums in sorted(self._sums.items()):
+                    value = sums[name]
+                    lines.append(f'socialbook_{name}{{view="{view}"}} {value:.6f}' if isinstance(value, float)
+                                 else f'socialbook_{name}{{view="{view}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+_SUM_METRICS = [
+    ("db_queries_total", "counter", "SQL statements executed."),
+    ("db_seconds_total", "counter", "Time spent executing SQL."),
+    ("template_seconds_total", "counter", "Time spent rendering templates."),
+    ("response_bytes_total", "counter", "Response body bytes sent."),
+    ("n_plus_one_total", "counter", "Requests that repeated one statement N_PLUS_ONE_THRESHOLD or more times."),
+    ("query_budget_exceeded_total", "counter", "Requests that ran more queries than the view's query budget."),
+]
+
+registry = MetricsRegistry()
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    # Unmatched URLs share one label so scanners can't blow up the series count.
+    return match.view_name if match is not None else "<unresolved>"
+
+
+class PerformanceMiddleware:
+    """Measure each request; see the module docstring. Place it first in MIDDLEWARE."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    def _finish(self, request, response, stats, duration):
+        view = _view_name(request)
+        threshold = getattr(settings, "N_PLUS_ONE_THRESHOLD", 5)
+        repeated = stats.repeated_statements(threshold) if threshold else []
+        for sql, count in repeated:
+            logger.warning("Possible N+1 query in %s (%s %s): %d x %s", view, request.method, request.path, count, sql)
+        match = getattr(request, "resolver_match", None)
+        budget = budget_for(match.func) if match is not None else None
+        over_budget = budget is not None and stats.queries > budget
+        if over_budget and getattr(settings, "QUERY_BUDGET_LOG", True):
+            logger.warning(
+                "Query budget exceeded in %s (%s %s): %d queries, budget %d",
+                view, request.method, request.path, stats.queries, budget,
+            )
+
+        if response.streaming:
+            size = None
+            self._count_streamed(response, view)
+        else:
+            size = len(response.content)
+        registry.observe(
+            view, request.method, response.status_code, duration, stats, size, int(bool(repeated)), int(over_budget)
+        )
+
+        if getattr(settings, "SERVER_TIMING_HEADER", settings.DEBUG):
+            app_time = max(duration - stats.sql_time - stats.template_time, 0.0)
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries"',
+                f"tpl;dur={stats.template_time * 1000:.1f}",
+                f"app;dur={app_time * 1000:.1f}",
+                f"total;dur={duration * 1000:.1f}",
+            ])
+        return response
+
+    @staticmethod
+    def _count_streamed(response, view):
+        content = response.streaming_content
+
+        if response.is_async:
+            async def counted():
+                sent = 0
+                try:
+                    async for chunk in content:
+                        sent += len(chunk)
+                        yield chunk
+                finally:
+                    registry.add_response_bytes(view, sent)
+        else:
+            def counted():
+                sent = 0
+                try:
+                    for chunk in content:
+                        sent += len(chunk)
+                        yield chunk
+                finally:
+                    registry.add_response_bytes(view, sent)
+
+        response.streaming_content = counted()
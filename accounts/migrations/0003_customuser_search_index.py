@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from accounts.search import install_search_index, uninstall_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_uploadedfile"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
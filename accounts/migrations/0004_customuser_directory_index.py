@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_search_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['public_visibility', 'date_joined', 'id'], name='accounts_cu_pub_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_upload_counts(apps, schema_editor):
+    CustomUser = apps.get_model("accounts", "CustomUser")
+    UploadedFile = apps.get_model("accounts", "UploadedFile")
+    counts = (
+        UploadedFile.objects.filter(user=OuterRef("pk"))
+        .order_by()
+        .values("user")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    CustomUser.objects.update(upload_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='upload_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_upload_counts, migrations.RunPython.noop),
+    ]
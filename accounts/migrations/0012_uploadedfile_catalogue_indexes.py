@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_customuser_upload_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['visibility', 'created_at', 'id'], name='accounts_upl_vis_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['visibility', 'year_published', 'created_at'], name='accounts_upl_vis_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['visibility', 'cost', 'created_at'], name='accounts_upl_vis_cost_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:58
+
+import accounts.models
+from django.db import migrations, models
+from django.db.models import F, Max
+from django.utils import timezone
+
+# Rows updated per UPDATE statement when the stored age is restored.
+CHUNK_SIZE = 10000
+
+
+def restore_stored_age(apps, schema_editor):
+    """Reverse path: refill the re-added age column with set-based UPDATEs over id ranges."""
+    CustomUser = apps.get_model("accounts", "CustomUser")
+    year = timezone.localdate().year
+    last_id = CustomUser.objects.aggregate(last=Max("id"))["last"] or 0
+    for start in range(0, last_id + 1, CHUNK_SIZE):
+        CustomUser.objects.filter(
+            id__gte=start, id__lt=start + CHUNK_SIZE, birth_year__isnull=False, birth_year__lte=year
+        ).update(age=year - F("birth_year"))
+
+
+class Migration(migrations.Migration):
+    # Let each chunked UPDATE commit on its own instead of holding one huge transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0012_uploadedfile_catalogue_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='customuser',
+            managers=[
+                ('objects', accounts.models.CustomUserManager()),
+            ],
+        ),
+        migrations.RunPython(migrations.RunPython.noop, restore_stored_age),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='age',
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['public_visibility', 'birth_year', 'id'], name='accounts_cu_pub_birth_idx'),
+        ),
+    ]
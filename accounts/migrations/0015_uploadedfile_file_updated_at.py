@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_outboundemail_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='file_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
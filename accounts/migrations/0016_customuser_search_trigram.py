@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from accounts.search import install_search_index, uninstall_search_index
+
+
+def reinstall(apps, schema_editor):
+    # The FTS5 tokenizer is fixed when the table is created.
+    uninstall_search_index(schema_editor.connection)
+    install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0015_uploadedfile_file_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(reinstall, migrations.RunPython.noop),
+    ]
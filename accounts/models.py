@@ -1,26 +1,85 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+
+from django.db import models, transaction
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.utils import timezone
 from django.conf import settings
 
+from .storage import upload_storage
+from .sniffing import sniff, UnsupportedContent
+
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x1f\x7f]")
+
+
+def clean_filename(name):
+    """The last path component of a client-supplied file name, without control characters."""
+    return _CONTROL_CHARS_RE.sub("", os.path.basename(name.replace("\\", "/")))
+
+
+class CustomUserQuerySet(models.QuerySet):
+	"""Directory queries. Age is derived from birth_year in SQL rather than stored, so it never goes stale."""
+
+	def public(self):
+		"""Users listed in the public directory.
+
+		Spelled as IN (true) because SQLite cannot use the leading column of the
+		directory indexes for a bare boolean `WHERE public_visibility`.
+		"""
+		return self.filter(public_visibility__in=[True])
+
+	@staticmethod
+	def current_year():
+		return timezone.localdate().year
+
+	def with_age(self):
+		"""Annotate `age` (NULL without a birth_year, or with one in the future); usable in filter() and order_by()."""
+		year = self.current_year()
+		return self.annotate(age=models.Case(
+			models.When(birth_year__lte=year, then=models.Value(year) - models.F("birth_year")),
+			output_field=models.IntegerField(),
+		))
+
+	def age_between(self, min_age=None, max_age=None):
+		"""Filter on age through birth_year bounds, so the birth_year index can be used.
+
+		Bounds must satisfy 0 <= min_age <= max_age (DirectoryFilterForm checks
+		them). Users with a future birth year have no age and never match.
+		"""
+		if min_age is None and max_age is None:
+			return self
+		year = self.current_year()
+		qs = self.filter(birth_year__lte=year - (min_age or 0))
+		if max_age is not None:
+			qs = qs.filter(birth_year__gte=year - max_age)
+		return qs
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+	pass
+
 
 class CustomUser(AbstractUser):
 	
 	public_visibility = models.BooleanField(default=True)
 	birth_year = models.PositiveIntegerField(null=True, blank=True)
-	age = models.PositiveIntegerField(null=True, blank=True)
 	address = models.TextField(blank=True)
+	# Denormalized count of this user's UploadedFile rows, kept in step by accounts.signals
+	# (reconcile with `manage.py reconcile_upload_counts`).
+	upload_count = models.PositiveIntegerField(default=0, editable=False)
 
-	def save(self, *args, **kwargs):
-		# calculate age if birth_year is provided
-		if self.birth_year:
-			current_year = timezone.now().year
-			try:
-				self.age = max(0, current_year - int(self.birth_year))
-			except Exception:
-				# if invalid birth_year, leave age as-is
-				pass
-		super().save(*args, **kwargs)
+	objects = CustomUserManager()
+
+	class Meta(AbstractUser.Meta):
+		indexes = [
+			# Backs the keyset-paginated Authors & Sellers directory.
+			models.Index(fields=["public_visibility", "date_joined", "id"], name="accounts_cu_pub_joined_idx"),
+			# Backs age filters and the age sort, which run on birth_year.
+			models.Index(fields=["public_visibility", "birth_year", "id"], name="accounts_cu_pub_birth_idx"),
+		]
 
 # Create your models here.
 
@@ -38,11 +97,189 @@ class UploadedFile(models.Model):
     visibility = models.CharField(max_length=7, choices=VISIBILITY_CHOICES, default="public")
     cost = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     year_published = models.PositiveIntegerField(null=True, blank=True)
-    file = models.FileField(upload_to="uploads/%Y/%m/%d/")
+    file = models.FileField(upload_to="uploads/%Y/%m/%d/", storage=upload_storage)
+    # Name the file was uploaded under; the stored name is content-addressed.
+    filename = models.CharField(max_length=255, blank=True, editable=False)
+    # SHA-256 of the file contents; used as the download ETag.
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # When the current file was stored; the download's Last-Modified (created_at for older rows).
+    file_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Sniffed from the file content when it is uploaded (see accounts.sniffing)
+    mime_type = models.CharField(max_length=100, blank=True, editable=False)
+    size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Backs the keyset-paginated per-user uploads listing.
+            models.Index(fields=["user", "created_at", "id"], name="accounts_upl_user_created_idx"),
+            # Back the public catalogue: newest-first browsing and the year/cost range filters.
+            models.Index(fields=["visibility", "created_at", "id"], name="accounts_upl_vis_created_idx"),
+            models.Index(fields=["visibility", "year_published", "created_at"], name="accounts_upl_vis_year_idx"),
+            models.Index(fields=["visibility", "cost", "created_at"], name="accounts_upl_vis_cost_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.user})"
+
+    def save(self, *args, **kwargs):
+        stored = None
+        if self.file and not self.file._committed:
+            self.filename = clean_filename(self.file.name)
+            self.size = self.file.size
+            # Sniff every new file: a replacement must not keep the old file's metadata.
+            try:
+                info = sniff(self.file)
+            except UnsupportedContent:
+                info = {"mime_type": ""}
+            self.apply_file_info(info)
+            # Commit the file before the row (as FileField.pre_save would) so a
+            # content-addressed storage can hand back the digest it computed.
+            content = self.file.file
+            self.file.save(self.file.name, content, save=False)
+            stored = self.file.name
+            # accounts.signals stores it again should the blob vanish before the reference is taken.
+            self._stored_content = content
+            self.file_updated_at = timezone.now()
+        # A newly stored file always gets a fresh hash; the old one would keep the previous ETag valid.
+        if self.file and (stored is not None or not self.content_hash):
+            digest_from_name = getattr(self.file.storage, "digest_from_name", None)
+            self.content_hash = (digest_from_name and digest_from_name(self.file.name)) or self.compute_content_hash()
+        if stored is None:
+            return super().save(*args, **kwargs)
+        try:
+            # In a savepoint, so the row and its blob reference (accounts.signals)
+            # are written together and StoredBlob can be queried after a failure.
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except Exception:
+            # No row references the file just stored; the content-addressed
+            # storage keeps a shared blob that other rows still reference.
+            self.__dict__.pop("_stored_content", None)
+            self.file.storage.delete(stored)
+            raise
+
+    def apply_file_info(self, info):
+        """Copy metadata returned by accounts.sniffing.sniff onto this row."""
+        for name in ("mime_type", "page_count", "width", "height"):
+            setattr(self, name, info.get(name))
+
+    @property
+    def download_name(self):
+        return self.filename or self.file.name.split("/")[-1]
+
+    def compute_content_hash(self):
+        """Return the SHA-256 hex digest of the file, reading it in chunks."""
+        digest = hashlib.sha256()
+        for chunk in self.file.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+class StoredBlob(models.Model):
+    """A content-addressed file shared by every UploadedFile with the same content."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class ChunkedUpload(models.Model):
+    """A resumable upload in progress.
+
+    Chunks are appended to a temp file outside MEDIA_ROOT; finalizing verifies
+    the checksum and turns it into an UploadedFile. `metadata` holds the
+    UploadedFileForm fields submitted when the upload was started.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="chunked_uploads")
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    metadata = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size})"
+
+    @property
+    def temp_path(self):
+        directory = getattr(settings, "CHUNKED_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "social_book_chunks"))
+        return os.path.join(directory, f"{self.id}.part")
+
+    def append(self, stream, start, length, chunk_size=64 * 1024):
+        """Write `length` bytes read from `stream` at `start`; return the bytes written."""
+        os.makedirs(os.path.dirname(self.temp_path), exist_ok=True)
+        written = 0
+        with open(self.temp_path, "ab") as fh:
+            fh.truncate(start)
+            while written < length:
+                chunk = stream.read(min(chunk_size, length - written))
+                if not chunk:
+                    break
+                fh.write(chunk)
+                written += len(chunk)
+        return written
+
+    def compute_sha256(self, chunk_size=1024 * 1024):
+        digest = hashlib.sha256()
+        with open(self.temp_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def discard_file(self):
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, *args, **kwargs):
+        self.discard_file()
+        return super().delete(*args, **kwargs)
+
+
+class OutboundEmail(models.Model):
+    """A message in the outbound mail queue; delivered by the send_queued_mail command."""
+    STATUS_QUEUED = "queued"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When the message is next due; while sending, when the worker's claim expires.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Past this the message is useless (e.g. an expired login code): it is failed, not retried.
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="accounts_mail_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,103 @@
+"""One-time codes for the two-step login, kept in Django's cache.
+
+A challenge is stored under a random id with the cache's own TTL, so expiry
+needs no clock arithmetic and verification never touches the database. Only
+an HMAC of the code is cached. The raw code is kept as well when DEBUG is on,
+so the verify page can show it during development. Wrong guesses are counted
+with the cache's atomic ``incr``; after OTP_MAX_ATTEMPTS the challenge is
+discarded. The challenge id travels in a signed cookie instead of the session.
+
+Any cache backend works; use a shared one (Redis, Memcached) when the site
+runs more than one process. OTP_CACHE_ALIAS selects the CACHES entry.
+"""
+import secrets
+import string
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+COOKIE_NAME = "two_step_challenge"
+_SALT = "accounts.otp"
+
+
+class TooManyAttempts(Exception):
+    """The challenge was discarded after too many wrong codes."""
+
+
+def _cache():
+    return caches[getattr(settings, "OTP_CACHE_ALIAS", "default")]
+
+
+def _ttl():
+    return getattr(settings, "OTP_TTL_SECONDS", 300)
+
+
+def _keys(challenge_id):
+    return f"otp:{challenge_id}", f"otp:{challenge_id}:attempts"
+
+
+def _hash(challenge_id, code):
+    return salted_hmac(_SALT, f"{challenge_id}:{code}").hexdigest()
+
+
+def issue_challenge(user_id, digits=6):
+    """Create a challenge for ``user_id``; return (challenge_id, code)."""
+    challenge_id = secrets.token_urlsafe(24)
+    code = "".join(secrets.choice(string.digits) for _ in range(digits))
+    challenge = {"user_id": user_id, "code_hash": _hash(challenge_id, code)}
+    if settings.DEBUG:
+        challenge["dev_code"] = code
+    key, attempts_key = _keys(challenge_id)
+    _cache().set_many({key: challenge, attempts_key: 0}, timeout=_ttl())
+    return challenge_id, code
+
+
+def get_challenge(challenge_id):
+    """The cached challenge dict, or None once it has expired or been used."""
+    if not challenge_id:
+        return None
+    return _cache().get(_keys(challenge_id)[0])
+
+
+def check_code(challenge_id, challenge, code):
+    """Whether ``code`` answers ``challenge``. A correct code consumes the challenge.
+
+    Raises TooManyAttempts when the attempt budget is used up.
+    """
+    key, attempts_key = _keys(challenge_id)
+    cache = _cache()
+    try:
+        attempts = cache.incr(attempts_key)
+    except ValueError:
+        # The counter expired together with the challenge.
+        raise TooManyAttempts("Verification code expired.")
+    if attempts > getattr(settings, "OTP_MAX_ATTEMPTS", 5):
+        cache.delete_many([key, attempts_key])
+        raise TooManyAttempts("Too many invalid codes.")
+    if not constant_time_compare(_hash(challenge_id, code), challenge["code_hash"]):
+        return False
+    cache.delete_many([key, attempts_key])
+    return True
+
+
+def discard_challenge(challenge_id):
+    _cache().delete_many(_keys(challenge_id))
+
+
+def set_challenge_cookie(response, challenge_id):
+    response.set_signed_cookie(
+        COOKIE_NAME,
+        challenge_id,
+        salt=_SALT,
+        max_age=_ttl(),
+        httponly=True,
+        samesite="Lax",
+        secure=getattr(settings, "SESSION_COOKIE_SECURE", False),
+    )
+    return response
+
+
+def challenge_id_from(request):
+    """The challenge id from the signed cookie, or None if missing or tampered with."""
+    return request.get_signed_cookie(COOKIE_NAME, default=None, salt=_SALT, max_age=_ttl())
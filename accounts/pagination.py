@@ -0,0 +1,97 @@
+"""Keyset (cursor) pagination.
+
+Pages are addressed by the sort key of the last row already seen instead of an
+OFFSET, so a deep page costs the same index range scan as the first one. The
+ordering must end in a unique column (normally ``id``) to break ties.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client-supplied cursor cannot be decoded."""
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` by ``ordering``, e.g. ``("-date_joined", "-id")``.
+
+    Rows may be model instances or dicts (from ``.values()``); either way each
+    row must carry every ordering column.
+    """
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+        self._keys = [(name.lstrip("-"), name.startswith("-")) for name in self.ordering]
+
+    def encode_cursor(self, row):
+        values = []
+        for name, _ in self._keys:
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+        raw = json.dumps(values, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self._keys):
+                raise ValueError("cursor has the wrong shape")
+            opts = self.queryset.model._meta
+            return [opts.get_field(name).to_python(value) for (name, _), value in zip(self._keys, values)]
+        except Exception as exc:
+            raise InvalidCursor(str(exc)) from exc
+
+    def _after(self, values):
+        # (a, b) after (va, vb) in the ordering: a beyond va, or a == va and b beyond vb.
+        condition = Q()
+        for i, (name, descending) in enumerate(self._keys):
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[i]})
+            for j, (prev_name, _) in enumerate(self._keys[:i]):
+                step &= Q(**{prev_name: values[j]})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        """Return the page after ``cursor`` (the first page when it is empty).
+
+        Raises ``InvalidCursor`` for a malformed cursor.
+        """
+        return self._make_page(list(self._page_queryset(cursor)))
+
+    async def apage(self, cursor=None):
+        """Async variant of ``page()`` for async views, using the async ORM."""
+        return self._make_page([row async for row in self._page_queryset(cursor)])
+
+    def _page_queryset(self, cursor):
+        qs = self.queryset.order_by(*self.ordering)
+        if cursor:
+            qs = qs.filter(self._after(self.decode_cursor(cursor)))
+        return qs[: self.page_size + 1]
+
+    def _make_page(self, rows):
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            next_cursor = self.encode_cursor(rows[-1])
+        return KeysetPage(rows, next_cursor)
@@ -0,0 +1,41 @@
+"""Per-view SQL query budgets.
+
+``@query_budget(n)`` on a view function or class declares the most SQL
+statements one request to it may run, counting everything the request
+does: session and authentication lookups, the view itself, and any
+session save. A new per-row lookup then breaks a test, instead of going
+unnoticed until the page is slow.
+
+* accounts/tests.py requests every view with realistic data and fails when
+  one runs over its budget. It also fails when a routed view in
+  ``accounts`` has no budget at all.
+* PerformanceMiddleware checks live requests. It logs a warning and counts
+  ``query_budget_exceeded_total`` in /metrics when a view goes over, unless
+  QUERY_BUDGET_LOG is False.
+
+Put the decorator outermost, above ``login_required`` and the like, so the
+budget is on the callable the URLconf routes to.
+"""
+_registry = {}
+
+
+def query_budget(limit):
+    """Declare that one request to the decorated view runs at most ``limit`` queries."""
+    def decorator(view):
+        view.query_budget = limit
+        _registry[f"{view.__module__}.{view.__qualname__}"] = limit
+        return view
+    return decorator
+
+
+def budget_for(view):
+    """The budget of a routed view callable (a function or an ``as_view()`` result), or None."""
+    budget = getattr(view, "query_budget", None)
+    if budget is None and hasattr(view, "view_class"):
+        budget = getattr(view.view_class, "query_budget", None)
+    return budget
+
+
+def budgets():
+    """All declared budgets, keyed by the view's dotted path."""
+    return dict(_registry)
@@ -0,0 +1,168 @@
+"""Sliding-window rate limiting for the login endpoints.
+
+Password checks run PBKDF2, which is deliberately slow, so a credential
+stuffing burst can tie up every worker. Before ``authenticate()`` runs, the
+login views ask ``check_login`` whether the client IP or the username has
+used up its budget of failed attempts. If it has, they reject the request
+without hashing anything.
+
+Counts use the sliding-window approximation. Failures are counted in
+fixed buckets of one window each, and the previous bucket is weighted by how
+much of it still overlaps the window ending now. That costs two cache keys
+per identity and no per-attempt timestamps. Limits come from
+LOGIN_RATE_LIMITS, e.g. ``{"ip": "30/10m", "username": "10/10m"}``.
+
+Rejections are counted in the cache too; ``stats()`` reports them, including
+how many password hash computations were skipped.
+
+Both the limits and the counters are only as shared as the cache
+(RATE_LIMIT_CACHE_ALIAS, default "default"). The local-memory cache used
+without REDIS_URL is per process: each worker then enforces its own limits,
+and ``manage.py ratelimit_stats``, running in a process of its own, reads
+nothing. Use a shared cache in production.
+"""
+import hashlib
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+DEFAULT_LIMITS = {"ip": "30/10m", "username": "10/10m"}
+_RATE_RE = re.compile(r"^(\d+)/(\d*)([smhd])$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_STATS_KEYS = ("rejected", "hashes_avoided")
+
+
+def parse_rate(rate):
+    """Parse "10/5m" into (10, 300)."""
+    match = _RATE_RE.match(rate.strip())
+    if not match:
+        raise ValueError(f"Invalid rate {rate!r}; expected e.g. '10/5m'.")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * _UNIT_SECONDS[unit]
+
+
+def _cache():
+    return caches[getattr(settings, "RATE_LIMIT_CACHE_ALIAS", "default")]
+
+
+class SlidingWindowLimiter:
+    """At most ``limit`` hits per ``window`` seconds for each identity in ``scope``."""
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def _key(self, ident, bucket):
+        digest = hashlib.sha256(str(ident).lower().encode()).hexdigest()[:32]
+        return f"rl:{self.scope}:{digest}:{bucket}"
+
+    def _buckets(self, now):
+        bucket, offset = divmod(now, self.window)
+        return int(bucket), offset
+
+    def _counts(self, ident, now):
+        bucket, offset = self._buckets(now)
+        current_key, previous_key = self._key(ident, bucket), self._key(ident, bucket - 1)
+        counts = _cache().get_many([current_key, previous_key])
+        return counts.get(previous_key, 0), counts.get(current_key, 0), offset
+
+    def count(self, ident, now=None):
+        """Hits within the window ending ``now``, with the previous bucket prorated."""
+        previous, current, offset = self._counts(ident, time.time() if now is None else now)
+        return previous * (1 - offset / self.window) + current
+
+    def retry_after(self, ident, now=None):
+        """Seconds until ``ident`` is allowed again; 0 when it is allowed now."""
+        previous, current, offset = self._counts(ident, time.time() if now is None else now)
+        if previous * (1 - offset / self.window) + current < self.limit:
+            return 0
+        # Seconds into the current bucket at which the count drops below the
+        # limit, multiplied out before dividing so whole seconds stay exact.
+        if current < self.limit:
+            # Wait for enough of the previous bucket to slide out of the window.
+            allowed_at = self.window * (previous - self.limit + current) / previous
+        else:
+            # Wait for the next bucket, where the current one becomes the prorated previous.
+            allowed_at = self.window * (2 * current - self.limit) / current
+        # The boundary itself is still over the limit, hence the extra second.
+        return math.floor(allowed_at - offset) + 1
+
+    def hit(self, ident, now=None):
+        bucket, _ = self._buckets(time.time() if now is None else now)
+        key = self._key(ident, bucket)
+        cache = _cache()
+        cache.add(key, 0, timeout=self.window * 2)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr().
+            cache.set(key, 1, timeout=self.window * 2)
+
+
+def client_ip(request):
+    """The client address from RATE_LIMIT_IP_HEADER (REMOTE_ADDR unless behind a trusted proxy)."""
+    header = getattr(settings, "RATE_LIMIT_IP_HEADER", "REMOTE_ADDR")
+    value = request.META.get(header) or request.META.get("REMOTE_ADDR", "")
+    return value.split(",")[0].strip()
+
+
+def login_limiters(scope="login"):
+    limits = getattr(settings, "LOGIN_RATE_LIMITS", DEFAULT_LIMITS)
+    return {kind: SlidingWindowLimiter(f"{scope}:{kind}", *parse_rate(rate)) for kind, rate in limits.items()}
+
+
+def _identities(request, username):
+    return {"ip": client_ip(request), "username": username or ""}
+
+
+def check_login(request, username, scope="login", hashes=1):
+    """Return seconds to wait if the client or username is over its limit, else 0.
+
+    Call before any password hashing; ``hashes`` is how many hash computations
+    a rejection saves (0 for code checks).
+    """
+    identities = _identities(request, username)
+    wait = max(
+        (limiter.retry_after(identities[kind]) for kind, limiter in login_limiters(scope).items() if identities.get(kind)),
+        default=0,
+    )
+    if wait:
+        _bump("rejected")
+        if hashes:
+            _bump("hashes_avoided", hashes)
+    return wait
+
+
+def record_failure(request, username, scope="login"):
+    """Count a failed attempt against the client IP and the username."""
+    identities = _identities(request, username)
+    for kind, limiter in login_limiters(scope).items():
+        if identities.get(kind):
+            limiter.hit(identities[kind])
+
+
+def _bump(name, amount=1):
+    cache = _cache()
+    key = f"rl:stats:{name}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.set(key, amount, timeout=None)
+
+
+def shared_cache():
+    """Whether the limiter's cache is visible to other processes."""
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def stats():
+    """Rejection counters since the cache was last cleared."""
+    values = _cache().get_many([f"rl:stats:{name}" for name in _STATS_KEYS])
+    return {name: values.get(f"rl:stats:{name}", 0) for name in _STATS_KEYS}
@@ -0,0 +1,169 @@
+"""Indexed user search for the Authors & Sellers directory.
+
+The directory used to OR four ``icontains`` lookups together, which is a full
+table scan with ``LIKE '%q%'`` on every search. Searches now go through an
+index maintained by the database itself:
+
+- SQLite: an external-content FTS5 table kept in sync with
+  ``accounts_customuser`` by triggers, so ``CustomUser.save`` (and bulk writes)
+  update it in the same transaction. It uses the trigram tokenizer (SQLite
+  3.34+) so a query still matches anywhere inside a value, as ``icontains``
+  did: "smith" finds both "johnsmith" and "Goldsmith". Results are ranked by
+  bm25.
+- PostgreSQL: a GIN ``pg_trgm`` expression index over the searchable columns,
+  ranked by ``word_similarity``.
+
+Any other backend falls back to the original ``icontains`` scan.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+USER_TABLE = "accounts_customuser"
+FTS_TABLE = "accounts_customuser_fts"
+SEARCH_COLUMNS = ("username", "first_name", "last_name", "email")
+
+_SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_ai": "AFTER INSERT ON {user} BEGIN {insert}; END",
+    f"{FTS_TABLE}_ad": "AFTER DELETE ON {user} BEGIN {delete}; END",
+    f"{FTS_TABLE}_au": "AFTER UPDATE OF {columns} ON {user} BEGIN {delete}; {insert}; END",
+}
+
+_PG_INDEX = "accounts_customuser_search_trgm"
+_PG_DOCUMENT = "lower({})".format(
+    " || ' ' || ".join(f'"{USER_TABLE}"."{column}"' for column in SEARCH_COLUMNS)
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# The trigram index cannot match anything shorter than one trigram.
+_TRIGRAM_LENGTH = 3
+
+
+def _sqlite_statements():
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+    parts = {
+        "user": USER_TABLE,
+        "columns": columns,
+        "insert": f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values})",
+        "delete": (
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values})"
+        ),
+    }
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columns}, content='{USER_TABLE}', content_rowid='id', "
+        f"tokenize='trigram')"
+    ]
+    for name, body in _SQLITE_TRIGGERS.items():
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS {name} {body.format(**parts)}")
+    return statements
+
+
+def install_search_index(connection, rebuild=True):
+    """Create the search index for ``connection`` if it does not exist yet.
+
+    Safe to call repeatedly. On SQLite, ``rebuild`` repopulates the FTS table
+    from ``accounts_customuser``; it is needed when the index is first created
+    or when its triggers were lost (SQLite drops triggers when a migration
+    rebuilds the user table).
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for statement in _sqlite_statements():
+                cursor.execute(statement)
+            if rebuild:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == "postgresql":
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {_PG_INDEX} ON {USER_TABLE} "
+                f"USING gin (({_PG_DOCUMENT}) gin_trgm_ops)"
+            )
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for name in _SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == "postgresql":
+            cursor.execute(f"DROP INDEX IF EXISTS {_PG_INDEX}")
+
+
+def ensure_search_index(connection):
+    """Reinstall the SQLite triggers (and rebuild the index) if they went missing."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            [f"{FTS_TABLE}%"],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+    if FTS_TABLE not in existing:
+        # Not migrated yet; the migration installs the index.
+        return
+    if not set(_SQLITE_TRIGGERS) <= existing:
+        install_search_index(connection, rebuild=True)
+
+
+def _fts5_query(tokens):
+    # Quote every token so user input cannot inject FTS5 syntax; with the
+    # trigram tokenizer each quoted token is a substring match.
+    return " ".join('"{}"'.format(token.replace('"', '""')) for token in tokens)
+
+
+def _icontains(query):
+    return (
+        Q(username__icontains=query)
+        | Q(first_name__icontains=query)
+        | Q(last_name__icontains=query)
+        | Q(email__icontains=query)
+    )
+
+
+def _like_pattern(query):
+    escaped = query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_users(queryset, query):
+    """Filter ``queryset`` of users down to matches for ``query``, best match first.
+
+    Other filters on ``queryset`` still apply; callers should slice the result
+    since ranking is only meaningful for the top matches.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == "sqlite":
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return queryset.none()
+        # Tokens too short for the index are matched by scanning what the
+        # indexed tokens leave over (or the whole table if there are none).
+        for token in tokens:
+            if len(token) < _TRIGRAM_LENGTH:
+                queryset = queryset.filter(_icontains(token))
+        match = _fts5_query([token for token in tokens if len(token) >= _TRIGRAM_LENGTH])
+        if not match:
+            return queryset.order_by("-date_joined")
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {USER_TABLE}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+            select={"search_rank": f"{FTS_TABLE}.rank"},
+            order_by=["search_rank", "-date_joined"],
+        )
+    if vendor == "postgresql":
+        return queryset.extra(
+            where=[f"({_PG_DOCUMENT} LIKE %s OR {_PG_DOCUMENT} %%> %s)"],
+            params=[_like_pattern(query), query.lower()],
+            select={"search_rank": f"word_similarity(%s, {_PG_DOCUMENT})"},
+            select_params=[query.lower()],
+            order_by=["-search_rank", "-date_joined"],
+        )
+    return queryset.filter(_icontains(query)).order_by("-date_joined")
@@ -1,10 +1,49 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import UploadedFile
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+from .models import UploadedFile, ChunkedUpload
 
 
 class UploadedFileSerializer(serializers.ModelSerializer):
+    """Serialize an UploadedFile.
+
+    Pass `fields=[...]` to return only a subset of the fields (sparse fieldsets).
+    """
     file_url = serializers.SerializerMethodField()
 
+    # Model columns each output field needs; used to trim the SELECT for sparse fieldsets.
+    source_columns = {"file_url": "file"}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def parse_fields(cls, value):
+        """Parse a comma-separated `fields` parameter; None means all fields.
+
+        Raises serializers.ValidationError for unknown field names.
+        """
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = sorted(set(fields) - set(cls.Meta.fields))
+        if unknown:
+            raise serializers.ValidationError({"fields": f"Unknown field(s): {', '.join(unknown)}"})
+        return fields
+
+    @classmethod
+    def columns_for(cls, fields):
+        """Model columns to load for the given output fields."""
+        return [cls.source_columns.get(name, name) for name in fields]
+
     class Meta:
         model = UploadedFile
         fields = [
@@ -15,6 +54,11 @@ class UploadedFileSerializer(serializers.ModelSerializer):
             "cost",
             "year_published",
             "file_url",
+            "mime_type",
+            "size",
+            "page_count",
+            "width",
+            "height",
             "created_at",
         ]
 
@@ -22,4 +66,135 @@ class UploadedFileSerializer(serializers.ModelSerializer):
         try:
             return obj.file.url
         except Exception:
-            return None
\ No newline at end of file
+            return None
+
+
+class UploadedFileFastSerializer:
+    """Read-only, values()-based serializer for UploadedFile listings.
+
+    Produces exactly what UploadedFileSerializer does, but from plain
+    `QuerySet.values()` rows and without DRF's per-field machinery, which
+    dominates listing latency. `file_url` is built by string concatenation
+    from MEDIA_URL when uploads live on a FileSystemStorage.
+    """
+    _cent = Decimal("0.01")
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or UploadedFileSerializer.Meta.fields)
+        storage = UploadedFile._meta.get_field("file").storage
+        self._storage = storage
+        self._media_url = storage.base_url if isinstance(storage, FileSystemStorage) else None
+        self._timezone = timezone.get_current_timezone()
+        # Resolve the per-field conversion once instead of per row.
+        converters = {"file_url": self.file_url, "cost": self._cost, "created_at": self._datetime}
+        self._plan = [
+            (name, UploadedFileSerializer.source_columns.get(name, name), converters.get(name))
+            for name in self.fields
+        ]
+
+    def values(self, queryset):
+        """`queryset` as values() rows carrying the selected fields and the listing sort keys."""
+        columns = {column for _, column, _ in self._plan} | {"id", "created_at"}
+        return queryset.values(*columns)
+
+    def file_url(self, name):
+        if not name:
+            return None
+        if self._media_url is None:
+            try:
+                return self._storage.url(name)
+            except Exception:
+                return None
+        return self._media_url + filepath_to_uri(name).lstrip("/")
+
+    def _cost(self, value):
+        return None if value is None else "{:f}".format(value.quantize(self._cent))
+
+    def _datetime(self, value):
+        # Same rendering as DRF's DateTimeField: current timezone, ISO 8601, "Z" for UTC.
+        if value.tzinfo is not None:
+            value = value.astimezone(self._timezone)
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+    def to_representation(self, row):
+        return {
+            name: row[column] if convert is None else convert(row[column])
+            for name, column, convert in self._plan
+        }
+
+    def serialize(self, queryset):
+        """Serialize every row of `queryset` into a list."""
+        return [self.to_representation(row) for row in self.values(queryset)]
+
+
+class CatalogueFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the public catalogue; every filter is optional."""
+    year_min = serializers.IntegerField(required=False, min_value=0)
+    year_max = serializers.IntegerField(required=False, min_value=0)
+    cost_min = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, min_value=0)
+    cost_max = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, min_value=0)
+
+    def validate(self, attrs):
+        for low, high in (("year_min", "year_max"), ("cost_min", "cost_max")):
+            if low in attrs and high in attrs and attrs[low] > attrs[high]:
+                raise serializers.ValidationError({low: f"Must not exceed {high}."})
+        return attrs
+
+    def filter(self, queryset):
+        """Apply the validated ranges to ``queryset``."""
+        lookups = {
+            "year_min": "year_published__gte",
+            "year_max": "year_published__lte",
+            "cost_min": "cost__gte",
+            "cost_max": "cost__lte",
+        }
+        return queryset.filter(**{lookups[name]: value for name, value in self.validated_data.items()})
+
+
+class PublicUserSerializer(serializers.ModelSerializer):
+    """Fields shown for a user on the public Authors & Sellers directory.
+
+    `age` comes from the `with_age()` annotation on the queryset.
+    """
+    age = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = get_user_model()
+        fields = [
+            "id",
+            "username",
+            "first_name",
+            "last_name",
+            "email",
+            "age",
+            "birth_year",
+            "address",
+            "date_joined",
+        ]
+
+
+class ChunkedUploadInitSerializer(serializers.Serializer):
+    """Protocol fields for starting a chunked upload; book metadata is validated by UploadedFileForm."""
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.ChoiceField(choices=["application/pdf", "image/jpeg"])
+    total_size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$", required=False, allow_blank=True)
+
+    def validate_filename(self, value):
+        # The name ends up in the download's Content-Disposition header.
+        if any(char in value for char in "/\\\r\n\x00"):
+            raise serializers.ValidationError("Enter a file name, not a path, without line breaks or NUL characters.")
+        return value
+
+    def validate_total_size(self, value):
+        limit = getattr(settings, "CHUNKED_UPLOAD_MAX_SIZE", 1024 ** 3)
+        if value > limit:
+            raise serializers.ValidationError(f"Uploads are limited to {limit} bytes.")
+        return value
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ["id", "filename", "content_type", "total_size", "offset", "created_at"]
@@ -0,0 +1,110 @@
+"""Session engine: write-through cached sessions with an in-process LRU in front.
+
+SESSION_ENGINE = "accounts.sessions" behaves like Django's ``cached_db``
+engine. Writes go to the database and the shared cache. Reads also check a
+small per-process LRU first, so a signed-in page view usually loads its
+session without a cache round trip, let alone a database query.
+
+Entries in the LRU live for SESSION_LOCAL_CACHE_TTL seconds. A change made by
+another process, such as a logout, is therefore seen here within that time.
+Keep the TTL short; the process that handles the change always sees it at
+once. Pair the engine with a shared cache (REDIS_URL) when running several
+processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+class LocalLRU:
+    """Thread-safe LRU of serialized session data with a per-entry TTL."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        ttl = getattr(settings, "SESSION_LOCAL_CACHE_TTL", 5)
+        size = getattr(settings, "SESSION_LOCAL_CACHE_SIZE", 10000)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_sessions = LocalLRU()
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = "accounts.sessions"
+
+    # Entries are kept serialized so each request decodes a private copy to mutate.
+    def _remember(self, data):
+        local_sessions.set(self.cache_key, self.serializer().dumps(data))
+
+    def load(self):
+        if self.session_key is not None:
+            cached = local_sessions.get(self.cache_key)
+            if cached is not None:
+                return self.serializer().loads(cached)
+        data = super().load()
+        if data and self.session_key is not None:
+            self._remember(data)
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        self._remember(self._session)
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        if key is not None:
+            local_sessions.delete(self.cache_key_prefix + key)
+        super().delete(session_key)
+
+    async def aload(self):
+        if self.session_key is not None:
+            cached = local_sessions.get(self.cache_key)
+            if cached is not None:
+                return self.serializer().loads(cached)
+        data = await super().aload()
+        if data and self.session_key is not None:
+            self._remember(data)
+        return data
+
+    async def asave(self, must_create=False):
+        await super().asave(must_create)
+        self._remember(self._session)
+
+    async def adelete(self, session_key=None):
+        key = session_key or self.session_key
+        if key is not None:
+            local_sessions.delete(self.cache_key_prefix + key)
+        await super().adelete(session_key)
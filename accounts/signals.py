@@ -0,0 +1,72 @@
+"""Signal handlers keeping denormalized upload state in sync with UploadedFile rows."""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_uploads_version
+from .models import UploadedFile
+from .storage import acquire_blob, release_blob
+
+
+@receiver(pre_save, sender=UploadedFile)
+def remember_previous_file(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "file" not in update_fields:
+        return
+    if instance._state.adding:
+        instance._previous_file = ""
+    else:
+        previous = sender.objects.filter(pk=instance.pk).values_list("file", flat=True).first()
+        instance._previous_file = previous or ""
+
+
+@receiver(post_save, sender=UploadedFile)
+def move_upload_blob(sender, instance, **kwargs):
+    # A new row, or a new file on an existing one, takes a reference on its
+    # blob and gives up the one on the blob it replaced.
+    previous = instance.__dict__.pop("_previous_file", None)
+    content = instance.__dict__.pop("_stored_content", None)
+    current = instance.file.name or ""
+    if previous is None or previous == current:
+        return
+    if current:
+        acquire_blob(current, instance.file.storage, content=content)
+    if previous:
+        release_blob(previous, instance.file.storage)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_upload_blob(sender, instance, **kwargs):
+    if instance.file:
+        release_blob(instance.file.name, instance.file.storage)
+
+
+def _adjust_upload_count(instance, delta):
+    User = get_user_model()
+    users = User.objects.filter(pk=instance.user_id)
+    if delta < 0:
+        users = users.filter(upload_count__gt=0)
+    users.update(upload_count=F("upload_count") + delta)
+    # Keep an already-loaded user (e.g. request.user) consistent for the rest of the request.
+    if UploadedFile.user.is_cached(instance):
+        instance.user.upload_count = max(0, instance.user.upload_count + delta)
+
+
+@receiver(post_save, sender=UploadedFile)
+def count_created_upload(sender, instance, created, **kwargs):
+    if created:
+        _adjust_upload_count(instance, 1)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def count_deleted_upload(sender, instance, **kwargs):
+    _adjust_upload_count(instance, -1)
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+def invalidate_uploads_fragments(sender, instance, **kwargs):
+    # After commit, so a concurrent request cannot cache the pre-change list under the new version.
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_uploads_version(user_id))
@@ -0,0 +1,102 @@
+"""Server-side content sniffing for uploaded books.
+
+The client-supplied content type is not trusted. Instead the first few KB of
+the file are checked for PDF or JPEG magic bytes, and basic metadata is pulled
+out without reading the whole file:
+
+- PDF page count from the linearization dictionary at the start of the file,
+  or else from the page tree root in a bounded window at the end of the file.
+- JPEG width/height by walking segment headers (seeking over their payloads)
+  up to the first SOF marker.
+"""
+import re
+
+HEAD_BYTES = 8 * 1024
+PDF_TAIL_BYTES = 64 * 1024
+# JPEG segments walked before giving up on finding a SOF marker.
+_JPEG_MAX_SEGMENTS = 256
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field.
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD8, *range(0xD0, 0xD8)}
+
+_PDF_LINEARIZED_RE = re.compile(rb"/Linearized\b.{0,512}?/N\s+(\d+)", re.S)
+_PDF_PAGES_COUNT_RES = (
+    re.compile(rb"/Type\s*/Pages\b[^>]{0,256}?/Count\s+(\d+)", re.S),
+    re.compile(rb"/Count\s+(\d+)[^>]{0,256}?/Type\s*/Pages\b", re.S),
+)
+
+
+class UnsupportedContent(ValueError):
+    """The file is not a PDF or JPEG."""
+
+
+def sniff(file):
+    """Identify ``file`` (any seekable binary file object) and extract its metadata.
+
+    Returns a dict with ``mime_type``, ``page_count``, ``width`` and ``height``
+    (None where not applicable or not found). Raises UnsupportedContent for
+    anything that is not a PDF or JPEG. The file position is reset to 0.
+    """
+    file.seek(0)
+    head = file.read(HEAD_BYTES)
+    try:
+        if head.startswith(b"%PDF-"):
+            return {
+                "mime_type": "application/pdf",
+                "page_count": _pdf_page_count(file, head),
+                "width": None,
+                "height": None,
+            }
+        if head.startswith(b"\xff\xd8\xff"):
+            width, height = _jpeg_dimensions(file)
+            return {"mime_type": "image/jpeg", "page_count": None, "width": width, "height": height}
+    finally:
+        file.seek(0)
+    raise UnsupportedContent("File content is neither PDF nor JPEG.")
+
+
+def _pdf_page_count(file, head):
+    match = _PDF_LINEARIZED_RE.search(head)
+    if match:
+        return int(match[1])
+    file.seek(0, 2)
+    size = file.tell()
+    file.seek(max(0, size - PDF_TAIL_BYTES))
+    tail = file.read(PDF_TAIL_BYTES)
+    counts = [int(m[1]) for window in (head, tail) for regex in _PDF_PAGES_COUNT_RES for m in regex.finditer(window)]
+    # The root of the page tree carries the total; intermediate nodes count less.
+    return max(counts) if counts else None
+
+
+def _jpeg_dimensions(file):
+    file.seek(2)
+    for _ in range(_JPEG_MAX_SEGMENTS):
+        byte = file.read(1)
+        if not byte:
+            break
+        if byte != b"\xff":
+            continue
+        marker = file.read(1)
+        while marker == b"\xff":
+            marker = file.read(1)
+        if not marker:
+            break
+        code = marker[0]
+        if code in _JPEG_STANDALONE_MARKERS:
+            continue
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            break
+        length = int.from_bytes(length_bytes, "big")
+        if code in _JPEG_SOF_MARKERS:
+            frame = file.read(5)
+            if len(frame) < 5:
+                break
+            height = int.from_bytes(frame[1:3], "big")
+            width = int.from_bytes(frame[3:5], "big")
+            return width, height
+        if code == 0xDA:
+            # Start of scan: image data follows, no frame header found.
+            break
+        file.seek(length - 2, 1)
+    return None, None
@@ -0,0 +1,130 @@
+"""Content-addressed storage for uploaded books.
+
+Files are hashed while they are streamed in and stored once per SHA-256
+digest under ``blobs/ab/cd/<digest><ext>``, so identical PDFs uploaded by many
+users share one blob on disk. Every UploadedFile row pointing at a blob holds
+a reference on its StoredBlob row; the file is removed when the last reference
+goes away (see ``acquire_blob`` / ``release_blob``).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+BLOB_PREFIX = "blobs/"
+_BLOB_RE = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[A-Za-z0-9]+)?$")
+
+
+def upload_storage():
+    """Storage for UploadedFile.file, configured as STORAGES["uploads"]."""
+    return storages["uploads"]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names every file after the SHA-256 of its content."""
+
+    def digest_from_name(self, name):
+        """The SHA-256 hex digest encoded in a blob name, or None for other names."""
+        match = _BLOB_RE.match(name or "")
+        return match[1] if match else None
+
+    def blob_name(self, digest, original_name=""):
+        ext = os.path.splitext(original_name)[1].lower()
+        return f"{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+    def get_available_name(self, name, max_length=None):
+        # The requested name is only used for its extension; _save picks the real one.
+        return name
+
+    def _save(self, name, content):
+        incoming = os.path.join(self.location, BLOB_PREFIX, "incoming")
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        if hasattr(content, "temporary_file_path"):
+            # Already on local disk (large uploads, finalized chunked uploads): hash in place.
+            source = content.temporary_file_path()
+            for chunk in content.chunks():
+                digest.update(chunk)
+        else:
+            fd, source = tempfile.mkstemp(dir=incoming)
+            with os.fdopen(fd, "wb") as fh:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    fh.write(chunk)
+        target = self.blob_name(digest.hexdigest(), name)
+        full_path = self.path(target)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if os.path.exists(full_path):
+            # Deduplicated: the blob is already stored.
+            if not hasattr(content, "temporary_file_path"):
+                os.remove(source)
+        else:
+            file_move_safe(source, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return target
+
+    def delete(self, name):
+        # Blobs are shared; only release_blob may remove one, once unreferenced.
+        if self.digest_from_name(name):
+            from .models import StoredBlob
+
+            if StoredBlob.objects.filter(digest=self.digest_from_name(name), ref_count__gt=0).exists():
+                return
+        super().delete(name)
+
+
+def acquire_blob(name, storage, count=1, content=None):
+    """Record ``count`` more UploadedFile references to the blob called ``name``.
+
+    ``content`` is the file that was just stored as ``name``. When storing it
+    was deduplicated against a blob whose last reference went away before this
+    one was taken, the blob is gone by now and is stored again from ``content``.
+    """
+    from .models import StoredBlob
+
+    digest = getattr(storage, "digest_from_name", lambda _: None)(name)
+    if not digest:
+        return
+    with transaction.atomic():
+        # Take the reference before looking for the file: the updated row stays
+        # locked until commit, so _delete_blob cannot remove the file meanwhile.
+        updated = StoredBlob.objects.filter(digest=digest).update(ref_count=F("ref_count") + count)
+        if content is not None and not storage.exists(name):
+            storage.save(name, content)
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.create(digest=digest, name=name, size=storage.size(name), ref_count=count)
+        except IntegrityError:
+            # Created concurrently by another upload of the same content.
+            StoredBlob.objects.filter(digest=digest).update(ref_count=F("ref_count") + count)
+
+
+def release_blob(name, storage):
+    """Drop one reference to the blob called ``name``; delete it once unreferenced."""
+    from .models import StoredBlob
+
+    digest = getattr(storage, "digest_from_name", lambda _: None)(name)
+    if not digest:
+        return
+    StoredBlob.objects.filter(digest=digest, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+    if StoredBlob.objects.filter(digest=digest, ref_count=0).exists():
+        transaction.on_commit(lambda: _delete_blob(digest, name, storage))
+
+
+def _delete_blob(digest, name, storage):
+    from .models import StoredBlob
+
+    # Deleting the row waits on an acquire_blob that still holds it, and then
+    # finds it referenced again; the file goes in the same transaction.
+    with transaction.atomic():
+        deleted, _ = StoredBlob.objects.filter(digest=digest, ref_count=0).delete()
+        if deleted:
+            storage.delete(name)
@@ -0,0 +1,88 @@
+"""NDJSON streaming for bulk upload listings.
+
+Listing endpoints normally build the whole ``serializer.data`` list before
+rendering it. In streaming mode rows are read with ``QuerySet.iterator()`` and
+written one JSON object per line, so memory stays flat however many rows the
+user has.
+"""
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Lets DRF content negotiation accept NDJSON; non-streamed data renders as one line."""
+    media_type = NDJSON_CONTENT_TYPE
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(_encode_lines([data]))
+
+
+STREAMING_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+
+def wants_stream(request):
+    """True when the client asked for streaming via `?stream=1`, `?format=ndjson` or an NDJSON Accept header."""
+    if request.query_params.get("stream", "").lower() in {"1", "true", "yes"}:
+        return True
+    renderer = getattr(request, "accepted_renderer", None)
+    return getattr(renderer, "format", None) == NDJSONRenderer.format
+
+
+def iter_serialized(queryset, serializer, chunk_size=None):
+    """Yield ``serializer.to_representation`` for each row, fetching rows in chunks."""
+    if chunk_size is None:
+        chunk_size = getattr(settings, "UPLOAD_STREAM_CHUNK_SIZE", 2000)
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(obj)
+
+
+async def aiter_serialized(queryset, serializer, chunk_size=None):
+    """Async ``iter_serialized`` using ``QuerySet.aiterator()``."""
+    if chunk_size is None:
+        chunk_size = getattr(settings, "UPLOAD_STREAM_CHUNK_SIZE", 2000)
+    async for obj in queryset.aiterator(chunk_size=chunk_size):
+        yield serializer.to_representation(obj)
+
+
+def _encode_line(row):
+    return json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+def _encode_lines(rows):
+    for row in rows:
+        yield _encode_line(row)
+
+
+async def _aencode_lines(rows):
+    async for row in rows:
+        yield _encode_line(row)
+
+
+def ndjson_response(rows, header=None):
+    """Stream ``rows`` (dicts) as NDJSON, optionally preceded by a ``header`` object line.
+
+    ``rows`` may be an async iterable (without ``header``) for async views.
+    """
+    if hasattr(rows, "__aiter__"):
+        lines = _aencode_lines(rows)
+    else:
+        lines = _encode_lines(rows if header is None else _prepend(header, rows))
+    response = StreamingHttpResponse(lines, content_type=NDJSON_CONTENT_TYPE)
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
@@ -0,0 +1,24 @@
+"""Django template backend that reports render time to PerformanceMiddleware."""
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates, Template, reraise
+
+from .middleware import timed_template
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed_template():
+            return super().render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """The standard backend, with each render timed for the current request."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
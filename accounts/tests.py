@@ -1,3 +1,1341 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import smtplib
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, include, path, resolve, reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, caching, downloads, email_backends, otp, ratelimit, search, sessions
+from .api_views import PublicUserList
+from .bench import seed_uploads, seed_users
+from .forms import CustomUserCreationForm
+from .mail import enqueue_mail, process_queue
+from .models import CustomUser, OutboundEmail, StoredBlob, UploadedFile
+from .query_budget import budget_for, budgets
+from .search import search_users
+from .serializers import UploadedFileFastSerializer, UploadedFileSerializer
+from .storage import acquire_blob, upload_storage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CHUNK_DIR = tempfile.mkdtemp()
+PDF = b"%PDF-1.4\n1 0 obj << /Type /Page >> endobj\n%%EOF\n"
+PASSWORD = "Budget-pw-2024"
+
+
+class AsyncURLConf:
+    """The async views at their usual URLs, as ASYNC_VIEWS=True routes them."""
+    urlpatterns = [
+        path("accounts/", include("accounts.urls")),
+        path("api/uploads/", async_views.my_uploads_list),
+        path("api/uploads/<int:pk>/", async_views.my_upload_detail),
+        path("api/uploads/<int:pk>/download/", async_views.my_upload_download),
+        path("accounts/async-download/<int:pk>/", async_views.download_my_book),
+    ]
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(CHUNK_DIR, ignore_errors=True)
+
+
+def _routed_views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern):
+            yield str(pattern.pattern), pattern.callback
+        else:
+            for route, callback in _routed_views(pattern.url_patterns):
+                yield str(pattern.pattern) + route, callback
+
+
+def _read(response):
+    if not response.streaming:
+        return response.content
+    if response.is_async:
+        async def join():
+            return b"".join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(join)()
+    return b"".join(response.streaming_content)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    """Each view stays within its @query_budget (see accounts/query_budget.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(30)
+        cls.user = CustomUser.objects.create_user(
+            "reader", "reader@example.com", PASSWORD, birth_year=1990, first_name="Rea"
+        )
+        cls.staff = CustomUser.objects.create_user("staff", "staff@example.com", PASSWORD, is_staff=True)
+        cls.other = CustomUser.objects.create_user("other", "other@example.com", PASSWORD)
+        seed_uploads(cls.user, 30)
+        cls.book = cls._upload(cls.user, "Owned book", "private", b"owned")
+        cls.public_book = cls._upload(cls.other, "Someone else's book", "public", b"public")
+        cls.private_book = cls._upload(cls.other, "Private book", "private", b"private")
+
+    @classmethod
+    def _upload(cls, user, title, visibility, marker):
+        upload = UploadedFile(user=user, title=title, visibility=visibility, year_published=2001)
+        upload.file = ContentFile(PDF + marker, name=f"{marker.decode()}.pdf")
+        upload.save()
+        return upload
+
+    def setUp(self):
+        # Budgets hold for the cold path: nothing cached yet.
+        caches["default"].clear()
+        self.client.force_login(self.user)
+        self.api = self.client_class(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.anonymous = self.client_class()
+
+    def assertWithinBudget(self, request, url, *args, status=200, **kwargs):
+        """Make ``request(url, ...)`` and check its status and its query count against the view's budget."""
+        budget = budget_for(resolve(urlsplit(url).path).func)
+        self.assertIsNotNone(budget, f"{url} has no query budget")
+        with CaptureQueriesContext(connection) as queries:
+            response = request(url, *args, **kwargs)
+            _read(response)
+        self.assertEqual(response.status_code, status, f"{url}: unexpected status")
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{url} ran {len(queries)} queries, over its budget of {budget}:\n"
+            + "\n".join(query["sql"] for query in queries),
+        )
+        return response
+
+    def test_every_routed_view_has_a_budget(self):
+        missing = [
+            route
+            for route, callback in _routed_views(get_resolver().url_patterns)
+            if callback.__module__.startswith("accounts.") and budget_for(callback) is None
+        ]
+        self.assertEqual(missing, [])
+
+    def test_async_views_have_budgets(self):
+        for _, callback in _routed_views(AsyncURLConf.urlpatterns[1:]):
+            self.assertIsNotNone(budget_for(callback))
+        self.assertIn("accounts.api_views.MyUploadDetail", budgets())
+
+    def test_authors_sellers(self):
+        url = reverse("accounts:authors_sellers")
+        self.assertWithinBudget(self.anonymous.get, url)
+        self.assertWithinBudget(self.client.get, url, {"q": "alice", "min_age": 10, "max_age": 90, "sort": "age"})
+        response = self.assertWithinBudget(self.client.get, url)
+        self.assertWithinBudget(self.client.get, url, {"cursor": response.context["next_cursor"]})
+
+    def test_dashboards(self):
+        self.assertWithinBudget(self.client.get, reverse("accounts:my_books"))
+        self.assertWithinBudget(self.client.get, reverse("accounts:upload_books"))
+        self.assertWithinBudget(
+            self.client.post,
+            reverse("accounts:upload_books"),
+            {"title": "Uploaded", "visibility": "public", "cost": "1.50", "file": SimpleUploadedFile("new.pdf", PDF + b"new")},
+            status=302,
+        )
+
+    def test_download_my_book(self):
+        self.assertWithinBudget(self.client.get, reverse("accounts:download_my_book", args=[self.book.pk]))
+        self.assertWithinBudget(self.client.get, reverse("accounts:download_my_book", args=[self.public_book.pk]))
+        self.assertWithinBudget(
+            self.client.get, reverse("accounts:download_my_book", args=[self.private_book.pk]), status=404
+        )
+
+    def test_register_and_logout(self):
+        url = reverse("accounts:register")
+        self.assertWithinBudget(self.anonymous.get, url)
+        self.assertWithinBudget(
+            self.anonymous.post,
+            url,
+            {"username": "newcomer", "email": "new@example.com", "birth_year": 1995,
+             "password1": PASSWORD, "password2": PASSWORD},
+            status=302,
+        )
+        self.assertWithinBudget(self.client.get, reverse("accounts:logout"), status=302)
+
+    def test_two_step_login(self):
+        login_url = reverse("accounts:login_two_step")
+        verify_url = reverse("accounts:login_two_step_verify")
+        self.assertWithinBudget(self.anonymous.get, login_url)
+        self.assertWithinBudget(self.anonymous.post, login_url, {"username": "reader", "password": "wrong"})
+        self.assertWithinBudget(self.anonymous.post, login_url, {"username": "reader", "password": PASSWORD}, status=302)
+        code = re.search(r"\d{6}", OutboundEmail.objects.latest("pk").body)[0]
+        self.assertWithinBudget(self.anonymous.get, verify_url)
+        self.assertWithinBudget(self.anonymous.post, verify_url, {"code": "000000" if code != "000000" else "111111"})
+        self.assertWithinBudget(self.anonymous.post, verify_url, {"code": code}, status=302)
+
+    def test_staff_and_metrics_views(self):
+        self.client.force_login(self.staff)
+        self.assertWithinBudget(self.client.get, reverse("accounts:fragment_cache_stats"))
+        self.assertWithinBudget(self.anonymous.get, reverse("metrics"))
+
+    @override_settings(MY_UPLOADS_PAGE_SIZE=10)
+    def test_my_uploads_list(self):
+        url = reverse("api:my_uploads")
+        response = self.assertWithinBudget(self.api.get, url, {"fields": "id,title"})
+        self.assertWithinBudget(self.api.get, response.json()["next"])
+        self.assertWithinBudget(self.api.get, url, {"stream": "1"})
+
+    def test_upload_detail_and_download(self):
+        self.assertWithinBudget(self.api.get, reverse("api:my_upload_detail", args=[self.book.pk]))
+        self.assertWithinBudget(self.api.get, reverse("api:my_upload_detail", args=[self.public_book.pk]), status=404)
+        self.assertWithinBudget(self.api.get, reverse("api:my_upload_download", args=[self.book.pk]))
+        self.assertWithinBudget(self.api.get, reverse("api:my_upload_download", args=[self.public_book.pk]))
+        self.assertWithinBudget(self.api.get, reverse("api:my_upload_download", args=[self.private_book.pk]), status=404)
+
+    def test_hidden_and_missing_uploads_look_the_same(self):
+        for name in ("api:my_upload_detail", "api:my_upload_download"):
+            hidden = self.api.get(reverse(name, args=[self.private_book.pk]))
+            missing = self.api.get(reverse(name, args=[10 ** 9]))
+            self.assertEqual((hidden.status_code, hidden.json()), (missing.status_code, missing.json()))
+        hidden = self.client.get(reverse("accounts:download_my_book", args=[self.private_book.pk]))
+        missing = self.client.get(reverse("accounts:download_my_book", args=[10 ** 9]))
+        self.assertEqual((hidden.status_code, hidden.content), (404, missing.content))
+
+    def test_login_and_files(self):
+        url = reverse("api:login_and_files")
+        self.assertWithinBudget(self.anonymous.post, url, {"username": "reader", "password": PASSWORD})
+        self.assertWithinBudget(self.anonymous.post, url, {"username": "reader", "password": "wrong"}, status=401)
+
+    def test_public_listings(self):
+        self.assertWithinBudget(self.anonymous.get, reverse("api:authors_sellers"), {"min_age": 18})
+        response = self.assertWithinBudget(self.anonymous.get, reverse("api:catalogue"), {"year_min": 1990})
+        self.assertIn("results", response.json())
+
+    def test_chunked_upload(self):
+        data = PDF + b"chunked"
+        response = self.assertWithinBudget(
+            self.api.post,
+            reverse("api:chunked_upload_create"),
+            {"filename": "chunked.pdf", "content_type": "application/pdf", "total_size": len(data),
+             "sha256": hashlib.sha256(data).hexdigest(), "title": "Chunked", "visibility": "private", "cost": "0"},
+            status=201,
+        )
+        url = reverse("api:chunked_upload", args=[response.json()["id"]])
+        self.assertWithinBudget(self.api.put, url, data, content_type="application/octet-stream")
+        self.assertWithinBudget(self.api.get, url)
+        self.assertWithinBudget(
+            self.api.post, reverse("api:chunked_upload_finalize", args=[response.json()["id"]]), status=201
+        )
+
+    @override_settings(ROOT_URLCONF=AsyncURLConf)
+    def test_async_views(self):
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        get = async_to_sync(self.async_client.get)
+        self.assertWithinBudget(get, "/api/uploads/", headers=headers)
+        self.assertWithinBudget(get, "/api/uploads/", {"stream": "1"}, headers=headers)
+        self.assertWithinBudget(get, f"/api/uploads/{self.book.pk}/", headers=headers)
+        self.assertWithinBudget(get, f"/api/uploads/{self.book.pk}/download/", headers=headers)
+        self.async_client.force_login(self.user)
+        self.assertWithinBudget(get, f"/accounts/async-download/{self.public_book.pk}/")
+        self.assertWithinBudget(get, f"/accounts/async-download/{self.private_book.pk}/", status=404)
+
+    def test_middleware_logs_views_over_budget(self):
+        url = reverse("api:authors_sellers")
+        with mock.patch.object(PublicUserList, "query_budget", 0):
+            with self.assertLogs("accounts.middleware", "WARNING") as logs:
+                self.anonymous.get(url)
+        self.assertIn("Query budget exceeded in api:authors_sellers", logs.output[0])
+        with mock.patch.object(PublicUserList, "query_budget", 0), override_settings(QUERY_BUDGET_LOG=False):
+            with self.assertNoLogs("accounts.middleware", "WARNING"):
+                self.anonymous.get(url)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_DIR=CHUNK_DIR)
+class ChunkedUploadTests(TestCase):
+    """The resumable upload protocol in api_views.ChunkedUpload*."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("uploader", "uploader@example.com", PASSWORD)
+        self.api = self.client_class(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.data = PDF + b"chunked"
+
+    def start(self, **fields):
+        fields = {"filename": "book.pdf", "content_type": "application/pdf", "total_size": len(self.data),
+                  "title": "Chunked", "visibility": "private", "cost": "0", **fields}
+        return self.api.post(reverse("api:chunked_upload_create"), fields)
+
+    def put(self, upload_id, body, content_range=None):
+        headers = {"HTTP_CONTENT_RANGE": content_range} if content_range else {}
+        return self.api.put(
+            reverse("api:chunked_upload", args=[upload_id]), body, content_type="application/octet-stream", **headers
+        )
+
+    def test_filename_must_not_be_a_path_or_contain_control_characters(self):
+        for name in ("../../etc/passwd", "dir\\book.pdf", "book.pdf\r\nX-Injected: 1", "book\x00.pdf"):
+            response = self.start(filename=name)
+            self.assertEqual(response.status_code, 400, name)
+            self.assertIn("filename", response.json())
+        self.assertEqual(self.start(filename="A book, vol. 1.pdf").status_code, 201)
+
+    def test_chunk_at_the_wrong_offset_is_rejected_with_the_server_offset(self):
+        upload_id = self.start().json()["id"]
+        self.assertEqual(self.put(upload_id, self.data[:10]).json()["offset"], 10)
+        response = self.put(upload_id, self.data[20:], f"bytes 20-{len(self.data) - 1}/{len(self.data)}")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 10)
+        response = self.put(upload_id, self.data[10:], f"bytes 10-{len(self.data) - 1}/{len(self.data)}")
+        self.assertEqual(response.json()["offset"], len(self.data))
+
+    def test_checksum_mismatch_at_finalize_resets_the_upload(self):
+        upload_id = self.start(sha256=hashlib.sha256(b"something else").hexdigest()).json()["id"]
+        self.put(upload_id, self.data)
+        response = self.api.post(reverse("api:chunked_upload_finalize", args=[upload_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["offset"], 0)
+        self.assertEqual(self.api.get(reverse("api:chunked_upload", args=[upload_id])).json()["offset"], 0)
+        self.assertFalse(UploadedFile.objects.filter(user=self.user).exists())
+
+        self.put(upload_id, self.data)
+        response = self.api.post(
+            reverse("api:chunked_upload_finalize", args=[upload_id]), {"sha256": hashlib.sha256(self.data).hexdigest()}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UploadedFile.objects.get(user=self.user).filename, "book.pdf")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DownloadTests(TestCase):
+    """Download responses from accounts.downloads."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("downloader", "downloader@example.com", PASSWORD)
+        cls.upload = UploadedFile(user=cls.user, title="Les Misérables", visibility="private")
+        cls.upload.file = ContentFile(PDF, name='shelf/Les "Misérables"\r\nX-Injected: 1.pdf')
+        cls.upload.save()
+
+    def setUp(self):
+        self.api = self.client_class(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.url = reverse("api:my_upload_download", args=[self.upload.pk])
+
+    def test_filename_is_stored_as_a_bare_name(self):
+        self.assertEqual(self.upload.filename, 'Les "Misérables"X-Injected: 1.pdf')
+
+    def test_content_disposition_is_quoted(self):
+        response = self.api.get(self.url)
+        self.assertEqual(
+            response["Content-Disposition"], "attachment; filename*=utf-8''Les%20%22Mis%C3%A9rables%22X-Injected%3A%201.pdf"
+        )
+        self.assertNotIn("X-Injected", response.headers)
+
+    def get(self, **headers):
+        return self.api.get(self.url, headers=headers)
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_read(response), PDF)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], f'"{self.upload.content_hash}"')
+        self.assertEqual(response["Content-Length"], str(len(PDF)))
+
+    def test_ranges(self):
+        size = len(PDF)
+        for header, start, end in (
+            ("bytes=0-3", 0, 3),
+            ("bytes=5-", 5, size - 1),
+            ("bytes=10-100000", 10, size - 1),
+            ("bytes=-4", size - 4, size - 1),
+            ("bytes=-100000", 0, size - 1),
+        ):
+            response = self.get(Range=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{size}", header)
+            self.assertEqual(_read(response), PDF[start:end + 1], header)
+        # Several ranges are not supported: the whole file is sent.
+        self.assertEqual(self.get(Range="bytes=0-1,4-5").status_code, 200)
+
+    def test_unsatisfiable_ranges(self):
+        for header in (f"bytes={len(PDF)}-", "bytes=-0"):
+            response = self.get(Range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], f"bytes */{len(PDF)}")
+            # The error is not presented as the file itself, but still carries the validators.
+            self.assertNotIn("Content-Disposition", response)
+            self.assertEqual(response["ETag"], f'"{self.upload.content_hash}"')
+
+    def test_conditional_requests(self):
+        first = self.get()
+        for headers in ({"If-None-Match": first["ETag"]}, {"If-Modified-Since": first["Last-Modified"]}):
+            response = self.get(**headers)
+            self.assertEqual(response.status_code, 304, headers)
+            self.assertEqual(response["ETag"], first["ETag"])
+        self.assertEqual(self.get(**{"If-None-Match": '"stale"'}).status_code, 200)
+
+    def test_if_range(self):
+        etag, last_modified = self.get()["ETag"], self.get()["Last-Modified"]
+        self.assertEqual(self.get(Range="bytes=0-3", **{"If-Range": etag}).status_code, 206)
+        self.assertEqual(self.get(Range="bytes=0-3", **{"If-Range": last_modified}).status_code, 206)
+        # The client's copy is out of date: send the whole new representation.
+        self.assertEqual(self.get(Range="bytes=0-3", **{"If-Range": '"stale"'}).status_code, 200)
+        self.assertEqual(self.get(Range="bytes=0-3", **{"If-Range": "Sat, 01 Jan 2000 00:00:00 GMT"}).status_code, 200)
+
+    @override_settings(DOWNLOAD_BACKEND="accounts.downloads.XAccelRedirectBackend")
+    def test_x_accel_redirect(self):
+        for prefix in ("/protected/", "/protected"):
+            with self.settings(DOWNLOAD_ACCEL_REDIRECT_PREFIX=prefix):
+                # nginx answers range requests itself.
+                response = self.get(Range="bytes=0-3")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Accel-Redirect"], f"/protected/{self.upload.file.name}")
+            self.assertEqual(response.content, b"")
+            self.assertNotIn("Content-Range", response)
+            self.assertEqual(response["Content-Type"], "application/pdf")
+            self.assertEqual(response["ETag"], f'"{self.upload.content_hash}"')
+        not_modified = self.get(**{"If-None-Match": response["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertNotIn("X-Accel-Redirect", not_modified)
+
+    @override_settings(DOWNLOAD_ACCEL_REDIRECT_PREFIX="/protected/")
+    def test_x_accel_redirect_quotes_the_name(self):
+        obj = UploadedFile(file="shelf/Les Misérables #1?.pdf")
+        response = downloads.XAccelRedirectBackend().serve(None, obj, None, None)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/shelf/Les%20Mis%C3%A9rables%20%231%3F.pdf")
+
+    @override_settings(DOWNLOAD_BACKEND="accounts.downloads.XSendfileBackend")
+    def test_x_sendfile(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Sendfile"], upload_storage().path(self.upload.file.name))
+        self.assertEqual(response.content, b"")
+        self.assertTrue(response["Content-Disposition"].startswith("attachment; "))
+        not_modified = self.get(**{"If-Modified-Since": response["Last-Modified"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertNotIn("X-Sendfile", not_modified)
+
+    @override_settings(ROOT_URLCONF=AsyncURLConf, DOWNLOAD_BACKEND="accounts.downloads.XSendfileBackend")
+    def test_async_x_sendfile(self):
+        headers = {"Authorization": self.api.defaults["HTTP_AUTHORIZATION"]}
+        response = async_to_sync(self.async_client.get)(f"/api/uploads/{self.upload.pk}/download/", headers=headers)
+        self.assertEqual(response["X-Sendfile"], upload_storage().path(self.upload.file.name))
+
+    def test_replaced_file_gets_new_validators(self):
+        first = self.get()
+        self.upload.file = ContentFile(PDF + b"revised", name="revised.pdf")
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timezone.timedelta(days=1)):
+            self.upload.save()
+        response = self.get(**{"If-None-Match": first["ETag"], "If-Modified-Since": first["Last-Modified"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_read(response), PDF + b"revised")
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertNotEqual(response["Last-Modified"], first["Last-Modified"])
+
+    def test_head_range(self):
+        response = self.api.head(self.url, headers={"Range": "bytes=0-3"})
+        self.assertEqual((response.status_code, response["Content-Length"], response.content), (206, "4", b""))
+
+    @override_settings(ROOT_URLCONF=AsyncURLConf)
+    def test_async_range(self):
+        headers = {"Authorization": self.api.defaults["HTTP_AUTHORIZATION"], "Range": "bytes=-4"}
+        response = async_to_sync(self.async_client.get)(f"/api/uploads/{self.upload.pk}/download/", headers=headers)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(_read(response), PDF[-4:])
+
+    def test_file_is_opened_only_once_the_body_is_sent(self):
+        opened = []
+
+        def open_file():
+            opened.append(io.BytesIO(PDF))
+            return opened[-1]
+
+        async def disconnect():
+            # Closed before the first chunk, then after it.
+            await downloads._aiter_range(open_file, 0, len(PDF)).aclose()
+            body = downloads._aiter_range(open_file, 0, len(PDF))
+            await anext(body)
+            await body.aclose()
+
+        async_to_sync(disconnect)()
+        downloads._iter_range(open_file, 0, len(PDF)).close()
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BlobReferenceTests(TestCase):
+    """StoredBlob reference counts follow the UploadedFile rows that point at each blob."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("sharer", "sharer@example.com", PASSWORD)
+
+    def upload(self, data, **fields):
+        upload = UploadedFile(user=self.user, title="Shared", **fields)
+        upload.file = ContentFile(data, name="shared.pdf")
+        upload.save()
+        return upload
+
+    def blob(self, upload):
+        return StoredBlob.objects.filter(digest=upload.content_hash).first()
+
+    def test_shared_blob_is_kept_until_the_last_reference_goes(self):
+        first, second = self.upload(PDF + b"shared"), self.upload(PDF + b"shared")
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self.blob(first).ref_count, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.blob(second).ref_count, 1)
+        self.assertTrue(second.file.storage.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.blob(second))
+        self.assertFalse(second.file.storage.exists(second.file.name))
+
+    def test_replacing_the_file_moves_the_reference(self):
+        upload = self.upload(PDF + b"old")
+        old_name, old_hash = upload.file.name, upload.content_hash
+        upload.file = ContentFile(PDF + b"new", name="new.pdf")
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.save()
+        self.assertEqual(self.blob(upload).ref_count, 1)
+        self.assertFalse(StoredBlob.objects.filter(digest=old_hash).exists())
+        self.assertFalse(upload.file.storage.exists(old_name))
+
+    def test_blob_removed_during_a_deduplicated_upload_is_stored_again(self):
+        first = self.upload(PDF + b"racing")
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+
+        def acquire_after_the_delete(*args, **kwargs):
+            # The last reference goes away after the second upload found the
+            # blob already stored but before it took its reference.
+            for callback in callbacks:
+                callback()
+            self.assertFalse(first.file.storage.exists(first.file.name))
+            return acquire_blob(*args, **kwargs)
+
+        with mock.patch("accounts.signals.acquire_blob", acquire_after_the_delete):
+            second = self.upload(PDF + b"racing")
+        self.assertEqual(self.blob(second).ref_count, 1)
+        with second.file.open("rb") as fh:
+            self.assertEqual(fh.read(), PDF + b"racing")
+
+    def test_replacing_the_file_resniffs_its_metadata(self):
+        upload = self.upload(PDF)
+        self.assertEqual(upload.mime_type, "application/pdf")
+        jpeg = b"\xff\xd8\xff\xc0\x00\x11\x08\x00\x20\x00\x40" + b"\x00" * 12 + b"\xff\xd9"
+        upload.file = ContentFile(jpeg, name="cover.jpg")
+        upload.save()
+        upload.refresh_from_db()
+        self.assertEqual(
+            (upload.mime_type, upload.page_count, upload.width, upload.height), ("image/jpeg", None, 64, 32)
+        )
+
+    def test_failed_save_does_not_leave_an_unreferenced_blob(self):
+        kept = self.upload(PDF + b"kept")
+        for data in (PDF + b"orphan", PDF + b"kept"):
+            upload = UploadedFile(user=self.user, title=None)
+            upload.file = ContentFile(data, name="book.pdf")
+            with self.assertRaises(IntegrityError):
+                upload.save()
+        orphan = upload.file.storage.blob_name(hashlib.sha256(PDF + b"orphan").hexdigest(), ".pdf")
+        self.assertFalse(upload.file.storage.exists(orphan))
+        self.assertTrue(kept.file.storage.exists(kept.file.name))
+        self.assertEqual(self.blob(kept).ref_count, 1)
+
+
+class MailQueueTests(TestCase):
+    """The outbound mail queue in accounts.mail and its commands."""
+
+    def test_body_is_blanked_once_sent(self):
+        queued = enqueue_mail("Your verification code", "Your verification code is: 123456", ["a@example.com"])
+        self.assertEqual(process_queue(), (1, 1))
+        self.assertEqual(mail.outbox[0].body, "Your verification code is: 123456")
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.body), (OutboundEmail.STATUS_SENT, ""))
+
+    @override_settings(MAIL_QUEUE_RETRY_BASE_SECONDS=200, MAIL_QUEUE_MAX_ATTEMPTS=5)
+    def test_message_is_not_retried_past_its_ttl(self):
+        queued = enqueue_mail("Code", "Your verification code is: 123456", ["a@example.com"], ttl=300)
+        with mock.patch("accounts.mail.get_connection") as get_connection, self.assertLogs("accounts.mail", "WARNING"):
+            get_connection.return_value.open.side_effect = OSError("connection refused")
+            process_queue()
+            queued.refresh_from_db()
+            self.assertEqual((queued.status, queued.attempts), (OutboundEmail.STATUS_QUEUED, 1))
+            # The second retry would come 400 seconds later, after the 300 second TTL.
+            OutboundEmail.objects.filter(pk=queued.pk).update(next_attempt_at=timezone.now())
+            process_queue()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.body), (OutboundEmail.STATUS_FAILED, 2, ""))
+
+        stale = enqueue_mail("Code", "Your verification code is: 654321", ["a@example.com"], ttl=300)
+        OutboundEmail.objects.filter(pk=stale.pk).update(expires_at=timezone.now())
+        with self.assertLogs("accounts.mail", "WARNING"):
+            self.assertEqual(process_queue(), (0, 0))
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.body), (OutboundEmail.STATUS_FAILED, ""))
+        self.assertEqual(mail.outbox, [])
+
+    def test_purge_deletes_finished_messages_past_retention(self):
+        old_sent, old_queued, recent = (enqueue_mail("Hi", "Hello", ["a@example.com"]) for _ in range(3))
+        OutboundEmail.objects.filter(pk=old_sent.pk).update(status=OutboundEmail.STATUS_SENT)
+        OutboundEmail.objects.filter(pk__in=[old_sent.pk, old_queued.pk]).update(
+            created_at=timezone.now() - timezone.timedelta(days=8)
+        )
+        call_command("purge_sent_mail", stdout=io.StringIO())
+        self.assertQuerySetEqual(OutboundEmail.objects.order_by("pk"), [old_queued, recent])
+
+    def test_worker_failure_does_not_stop_the_command(self):
+        calls = iter([RuntimeError("database went away"), (1, 1)])
+
+        def flaky(batch_size):
+            result = next(calls, (0, 0))
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        out = io.StringIO()
+        with mock.patch("accounts.management.commands.send_queued_mail.process_queue", flaky):
+            with self.assertLogs("accounts.management.commands.send_queued_mail", "ERROR"):
+                call_command("send_queued_mail", workers=2, stdout=out)
+        self.assertIn("Done. 1 message(s) sent.", out.getvalue())
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP in PooledSMTPBackendTests."""
+
+    def __init__(self, host, port, **kwargs):
+        self.sock = object()
+        self.alive = True
+        self.error = None
+        self.sent = 0
+        self.noops = 0
+        self.quit_called = False
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.error is not None:
+            raise self.error
+        self.sent += 1
+
+    def noop(self):
+        self.noops += 1
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return 250, b"OK"
+
+    def quit(self):
+        self.quit_called = True
+        self.sock = None
+
+    def close(self):
+        self.sock = None
+
+
+@override_settings(EMAIL_POOL_SIZE=4, EMAIL_POOL_HEALTHCHECK_AFTER=5, EMAIL_POOL_IDLE_TIMEOUT=60)
+class PooledSMTPBackendTests(TestCase):
+    """Connection reuse in accounts.email_backends.PooledSMTPBackend."""
+
+    def setUp(self):
+        self.connections = []
+
+        def connect(*args, **kwargs):
+            self.connections.append(FakeSMTP(*args, **kwargs))
+            return self.connections[-1]
+
+        email_backends.close_pooled_connections()
+        self.addCleanup(email_backends.close_pooled_connections)
+        patcher = mock.patch.object(email_backends.PooledSMTPBackend, "connection_class", property(lambda _: connect))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, fail_silently=False, after=0):
+        backend = mail.get_connection(
+            "accounts.email_backends.PooledSMTPBackend",
+            host="smtp.example.com", port=25, username="", password="", use_tls=False, use_ssl=False,
+            fail_silently=fail_silently,
+        )
+        message = mail.EmailMessage("Subject", "Body", "from@example.com", ["to@example.com"], connection=backend)
+        with mock.patch("accounts.email_backends.time.monotonic", return_value=time.monotonic() + after):
+            return message.send(fail_silently=fail_silently)
+
+    def pooled(self):
+        return len(email_backends.get_pool(("smtp.example.com", 25, "", False, False)))
+
+    def test_connection_is_reused(self):
+        self.send()
+        self.send()
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual((self.connections[0].sent, self.connections[0].noops), (2, 0))
+        self.assertFalse(self.connections[0].quit_called)
+        self.assertEqual(self.pooled(), 1)
+
+    def test_idle_connection_is_probed_before_reuse(self):
+        self.send()
+        self.send(after=10)
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].noops, 1)
+
+        self.connections[0].alive = False
+        self.send(after=20)
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(self.connections[0].quit_called)
+        self.assertEqual(self.connections[1].sent, 1)
+
+    def test_idle_timeout_quits_the_connection(self):
+        self.send()
+        self.send(after=61)
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(self.connections[0].quit_called)
+        self.assertEqual(self.connections[0].noops, 0)
+
+    def test_broken_connection_is_not_pooled(self):
+        self.send()
+        self.connections[0].error = TimeoutError("timed out")
+        with self.assertRaises(TimeoutError):
+            self.send()
+        self.assertEqual(self.pooled(), 0)
+
+    def test_silenced_failure_keeps_only_a_live_connection(self):
+        self.send()
+        connection = self.connections[0]
+        connection.error = smtplib.SMTPException("lost sync")
+        connection.alive = False
+        self.assertEqual(self.send(fail_silently=True), 0)
+        self.assertEqual(self.pooled(), 0)
+
+        self.send()
+        connection = self.connections[1]
+        connection.error = smtplib.SMTPRecipientsRefused({"to@example.com": (550, b"No such user")})
+        self.assertEqual(self.send(fail_silently=True), 0)
+        self.assertEqual(self.pooled(), 1)
+        connection.error = None
+        self.send()
+        self.assertEqual((len(self.connections), connection.sent), (2, 2))
+
+    def test_pool_is_not_shared_across_fork(self):
+        self.send()
+        with mock.patch("accounts.email_backends.os.getpid", return_value=os.getpid() + 1):
+            self.send()
+        self.assertEqual(len(self.connections), 2)
+        # The parent's socket is left alone rather than sent a QUIT from the child.
+        self.assertFalse(self.connections[0].quit_called)
+
+
+@override_settings(LOGIN_RATE_LIMITS={"ip": "100/10m", "username": "2/10m"})
+class RateLimitTests(TestCase):
+    """The sliding-window login limiter in accounts.ratelimit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("limited", "limited@example.com", PASSWORD)
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_retry_after_waits_for_the_window_to_slide(self):
+        limiter = ratelimit.SlidingWindowLimiter("test", 10, 600)
+        start = 600 * 1000
+        for _ in range(10):
+            limiter.hit("full", now=start + 300)
+        # The current bucket alone is at the limit: wait until it is the prorated previous bucket.
+        self.assertEqual(limiter.retry_after("full", now=start + 300), 301)
+        self.assertGreaterEqual(limiter.count("full", now=start + 600), 10)
+        self.assertLess(limiter.count("full", now=start + 601), 10)
+
+        for _ in range(10):
+            limiter.hit("sliding", now=start - 590)
+        self.assertEqual(limiter.retry_after("sliding", now=start + 60), 0)
+        limiter.hit("sliding", now=start + 60)
+        limiter.hit("sliding", now=start + 60)
+        # 10 * 0.9 + 2 = 11; enough of the previous bucket has slid out at elapsed = 0.2.
+        self.assertEqual(limiter.retry_after("sliding", now=start + 60), 61)
+        self.assertLess(limiter.count("sliding", now=start + 121), 10)
+
+    def test_login_is_rejected_with_retry_after_before_authenticate(self):
+        url = reverse("accounts:login_two_step")
+        for _ in range(2):
+            self.client.post(url, {"username": "limited", "password": "wrong"})
+        with mock.patch("accounts.views.authenticate") as authenticate:
+            response = self.client.post(url, {"username": "limited", "password": PASSWORD})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        authenticate.assert_not_called()
+        self.assertEqual(ratelimit.stats(), {"rejected": 1, "hashes_avoided": 1})
+
+        with mock.patch("accounts.api_views.authenticate") as authenticate:
+            response = self.client.post(reverse("api:login_and_files"), {"username": "limited", "password": PASSWORD})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        authenticate.assert_not_called()
+
+    def test_code_check_is_rejected_with_retry_after(self):
+        self.client.post(reverse("accounts:login_two_step"), {"username": "limited", "password": PASSWORD})
+        url = reverse("accounts:login_two_step_verify")
+        code = re.search(r"\d{6}", OutboundEmail.objects.latest("pk").body)[0]
+        wrong = "000000" if code != "000000" else "111111"
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {"code": wrong}).status_code, 200)
+        response = self.client.post(url, {"code": code})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_stats_command_warns_about_a_per_process_cache(self):
+        err = io.StringIO()
+        call_command("ratelimit_stats", stdout=io.StringIO(), stderr=err)
+        self.assertIn("local to each process", err.getvalue())
+
+
+class DirectoryAgeTests(TestCase):
+    """Age annotation, age filters and the age sort of the Authors & Sellers directory."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.year = timezone.localdate().year
+        for age in (10, 20, 30, 40):
+            CustomUser.objects.create_user(f"aged{age}", birth_year=cls.year - age)
+        CustomUser.objects.create_user("ageless")
+        # Only possible through a bypassed form; such a user has no age.
+        CustomUser.objects.create_user("unborn", birth_year=cls.year + 1)
+
+    def usernames(self, qs):
+        return sorted(qs.values_list("username", flat=True))
+
+    def test_with_age(self):
+        ages = dict(CustomUser.objects.with_age().values_list("username", "age"))
+        self.assertEqual(ages, {"aged10": 10, "aged20": 20, "aged30": 30, "aged40": 40, "ageless": None, "unborn": None})
+
+    def test_age_between_is_inclusive_and_skips_users_without_an_age(self):
+        users = CustomUser.objects.all()
+        self.assertEqual(self.usernames(users.age_between(20, 30)), ["aged20", "aged30"])
+        self.assertEqual(self.usernames(users.age_between(max_age=15)), ["aged10"])
+        self.assertEqual(self.usernames(users.age_between(min_age=0)), ["aged10", "aged20", "aged30", "aged40"])
+        self.assertEqual(users.age_between().count(), 6)
+
+    def test_invalid_bounds(self):
+        url = reverse("api:authors_sellers")
+        for params in ({"min_age": -1}, {"min_age": 40, "max_age": 20}, {"max_age": 10 ** 20}, {"min_age": "old"}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+        # The web page shows the form errors and lists everyone instead.
+        response = self.client.get(reverse("accounts:authors_sellers"), {"min_age": 40, "max_age": 20})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["users"]), 6)
+        self.assertTrue(response.context["filter_form"].errors)
+
+    def test_future_birth_year_is_rejected(self):
+        form = CustomUserCreationForm({
+            "username": "newborn", "email": "newborn@example.com", "birth_year": self.year + 1,
+            "password1": PASSWORD, "password2": PASSWORD,
+        })
+        self.assertIn("birth_year", form.errors)
+
+    @override_settings(AUTHORS_SELLERS_PAGE_SIZE=2)
+    def test_age_sort_pages_through_everyone_with_an_age(self):
+        for sort, expected in (("age", ["aged10", "aged20", "aged30", "aged40"]),
+                               ("-age", ["aged40", "aged30", "aged20", "aged10"])):
+            seen, url, params = [], reverse("api:authors_sellers"), {"sort": sort}
+            while url:
+                body = self.client.get(url, params).json()
+                seen += [user["username"] for user in body["results"]]
+                url, params = body["next"], None
+            self.assertEqual(seen, expected)
+
+
+class UserSearchTests(TestCase):
+    """The FTS5 user index in accounts.search follows inserts, updates and deletes."""
+
+    def found(self, query):
+        return list(search_users(CustomUser.objects.all(), query).values_list("username", flat=True))
+
+    def test_index_follows_writes(self):
+        user = CustomUser.objects.create_user("zephyrine", "zeph@example.com", first_name="Quillon")
+        self.assertEqual(self.found("zeph"), ["zephyrine"])
+        self.assertEqual(self.found("quill"), ["zephyrine"])
+
+        user.first_name = "Marisol"
+        user.save()
+        self.assertEqual(self.found("quill"), [])
+        self.assertEqual(self.found("maris"), ["zephyrine"])
+
+        CustomUser.objects.filter(pk=user.pk).update(last_name="Thorncastle")
+        self.assertEqual(self.found("thorn"), ["zephyrine"])
+
+        user.delete()
+        self.assertEqual(self.found("zeph"), [])
+
+    def test_matches_inside_words(self):
+        CustomUser.objects.create_user("johnsmith", "john@example.com")
+        CustomUser.objects.create_user("ada", "ada@example.com", last_name="Goldsmith")
+        CustomUser.objects.create_user("smithers", "smithers@example.com")
+        self.assertCountEqual(self.found("smith"), ["johnsmith", "ada", "smithers"])
+        self.assertEqual(self.found("OLDSMI"), ["ada"])
+
+    def test_short_tokens_are_matched_by_a_scan(self):
+        CustomUser.objects.create_user("johnsmith", "john@example.com")
+        CustomUser.objects.create_user("ada", "ada@example.com", last_name="Goldsmith")
+        self.assertCountEqual(self.found("jo"), ["johnsmith"])
+        self.assertEqual(self.found("da smith"), ["ada"])
+
+    def test_query_syntax_is_not_interpreted(self):
+        CustomUser.objects.create_user("nearby", "near@example.com")
+        self.assertEqual(self.found('near" OR NEAR(*'), [])
+        self.assertEqual(self.found("NEAR"), ["nearby"])
+        self.assertEqual(self.found("***"), [])
+
+    def test_lost_triggers_are_reinstalled(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {search.FTS_TABLE}_ai")
+        CustomUser.objects.create_user("latecomer")
+        self.assertEqual(self.found("latecomer"), [])
+        search.ensure_search_index(connection)
+        self.assertEqual(self.found("latecomer"), ["latecomer"])
+        CustomUser.objects.create_user("newcomer")
+        self.assertEqual(self.found("newcomer"), ["newcomer"])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FastSerializerTests(TestCase):
+    """UploadedFileFastSerializer produces what UploadedFileSerializer does."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user("serialized")
+        with_file = UploadedFile(user=user, title="With file", cost=Decimal("12.5"), year_published=1999)
+        with_file.file = ContentFile(PDF, name="with file.pdf")
+        with_file.save()
+        UploadedFile.objects.create(user=user, title="No file", description="Ünïcode", visibility="private", cost=0)
+        UploadedFile.objects.create(user=user, title="Pricey", cost=Decimal("999999.99"), year_published=2024)
+        cls.uploads = UploadedFile.objects.order_by("pk")
+
+    def assertSameOutput(self, fields=None):
+        expected = [dict(UploadedFileSerializer(obj, fields=fields).data) for obj in self.uploads]
+        self.assertEqual(UploadedFileFastSerializer(fields).serialize(self.uploads), expected)
+
+    def test_all_fields(self):
+        self.assertSameOutput()
+
+    def test_sparse_fields(self):
+        self.assertSameOutput(["id", "file_url", "cost"])
+        self.assertSameOutput(["created_at"])
+
+    @override_settings(TIME_ZONE="Asia/Kolkata")
+    def test_datetimes_in_another_timezone(self):
+        self.assertSameOutput(["id", "created_at"])
+
+
+@override_settings(OTP_MAX_ATTEMPTS=3, OTP_TTL_SECONDS=300)
+class OTPTests(TestCase):
+    """Two-step login challenges in accounts.otp."""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.challenge_id, self.code = otp.issue_challenge(42)
+        self.wrong = "000000" if self.code != "000000" else "111111"
+
+    def check(self, code):
+        return otp.check_code(self.challenge_id, otp.get_challenge(self.challenge_id), code)
+
+    def test_only_a_hash_of_the_code_is_cached(self):
+        challenge = otp.get_challenge(self.challenge_id)
+        self.assertEqual(challenge["user_id"], 42)
+        self.assertNotIn(self.code, str(challenge))
+
+    def test_correct_code_consumes_the_challenge(self):
+        self.assertFalse(self.check(self.wrong))
+        self.assertTrue(self.check(self.code))
+        self.assertIsNone(otp.get_challenge(self.challenge_id))
+        with self.assertRaises(otp.TooManyAttempts):
+            otp.check_code(self.challenge_id, {"code_hash": ""}, self.code)
+
+    def test_attempt_limit_discards_the_challenge(self):
+        for _ in range(3):
+            self.assertFalse(self.check(self.wrong))
+        with self.assertRaisesMessage(otp.TooManyAttempts, "Too many invalid codes."):
+            self.check(self.code)
+        self.assertIsNone(otp.get_challenge(self.challenge_id))
+
+    def test_challenge_and_cookie_expire_after_the_ttl(self):
+        response = otp.set_challenge_cookie(HttpResponse(), self.challenge_id)
+        self.client.cookies[otp.COOKIE_NAME] = response.cookies[otp.COOKIE_NAME].value
+        self.assertEqual(response.cookies[otp.COOKIE_NAME]["max-age"], 300)
+        verify_url = reverse("accounts:login_two_step_verify")
+        self.assertEqual(self.client.get(verify_url).status_code, 200)
+        with mock.patch("time.time", return_value=time.time() + 301):
+            self.assertIsNone(otp.get_challenge(self.challenge_id))
+            self.assertRedirects(self.client.get(verify_url), reverse("accounts:login_two_step"))
+
+
+@override_settings(SESSION_ENGINE="accounts.sessions", SESSION_LOCAL_CACHE_TTL=5, SESSION_LOCAL_CACHE_SIZE=100)
+class SessionStoreTests(TestCase):
+    """The per-process LRU in front of the cached_db sessions in accounts.sessions."""
+
+    def setUp(self):
+        caches["default"].clear()
+        sessions.local_sessions.clear()
+        self.addCleanup(sessions.local_sessions.clear)
+
+    def saved_session(self, **data):
+        store = sessions.SessionStore()
+        store.update(data)
+        store.save()
+        return store
+
+    def cached(self, session_key):
+        return sessions.local_sessions.get(sessions.SessionStore.cache_key_prefix + session_key)
+
+    def test_load_is_served_from_the_lru(self):
+        key = self.saved_session(theme="dark").session_key
+        hits, misses = sessions.local_sessions.hits, sessions.local_sessions.misses
+        with self.assertNumQueries(0), mock.patch.object(caches["default"], "get") as cache_get:
+            self.assertEqual(sessions.SessionStore(key).load(), {"theme": "dark"})
+        cache_get.assert_not_called()
+        self.assertEqual(sessions.local_sessions.hits, hits + 1)
+
+        # A miss falls back to the shared cache and refills the LRU.
+        sessions.local_sessions.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(key).load(), {"theme": "dark"})
+        self.assertEqual(sessions.local_sessions.misses, misses + 1)
+        self.assertIsNotNone(self.cached(key))
+
+    def test_loaded_data_is_a_private_copy(self):
+        key = self.saved_session(cart=[1]).session_key
+        sessions.SessionStore(key).load()["cart"].append(2)
+        self.assertEqual(sessions.SessionStore(key).load(), {"cart": [1]})
+
+    def test_entries_expire_after_the_ttl(self):
+        key = self.saved_session(theme="dark").session_key
+        later = time.monotonic() + 6
+        with mock.patch("accounts.sessions.time.monotonic", return_value=later):
+            self.assertIsNone(self.cached(key))
+            # Expired entries are dropped, not just skipped.
+            self.assertNotIn(sessions.SessionStore.cache_key_prefix + key, sessions.local_sessions._entries)
+
+    @override_settings(SESSION_LOCAL_CACHE_SIZE=2)
+    def test_least_recently_used_entry_is_evicted(self):
+        first, second = self.saved_session(n=1).session_key, self.saved_session(n=2).session_key
+        self.cached(first)
+        third = self.saved_session(n=3).session_key
+        self.assertIsNone(self.cached(second))
+        self.assertIsNotNone(self.cached(first))
+        self.assertIsNotNone(self.cached(third))
+
+    def test_flush_and_cycle_key_drop_the_old_key(self):
+        store = self.saved_session(theme="dark")
+        old_key = store.session_key
+        store.cycle_key()
+        self.assertIsNone(self.cached(old_key))
+        self.assertEqual(sessions.SessionStore(old_key).load(), {})
+        new_key = store.session_key
+        store.flush()
+        self.assertIsNone(self.cached(new_key))
+        self.assertEqual(sessions.SessionStore(new_key).load(), {})
+
+    def test_login_and_logout_drop_the_old_key(self):
+        user = CustomUser.objects.create_user("sessioned", "sessioned@example.com", PASSWORD)
+        session = self.client.session
+        session["theme"] = "dark"
+        session.save()
+        anonymous_key = session.session_key
+        self.client.force_login(user)
+        signed_in_key = self.client.session.session_key
+        self.assertNotEqual(signed_in_key, anonymous_key)
+        self.assertIsNone(self.cached(anonymous_key))
+        self.assertIsNotNone(self.cached(signed_in_key))
+        self.client.get(reverse("accounts:logout"))
+        self.assertIsNone(self.cached(signed_in_key))
+        self.assertEqual(sessions.SessionStore(signed_in_key).load(), {})
+
+    def test_async_load_and_save(self):
+        store = sessions.SessionStore()
+        store["theme"] = "dark"
+        async_to_sync(store.asave)()
+        key = store.session_key
+        self.assertIsNotNone(self.cached(key))
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(sessions.SessionStore(key).aload)(), {"theme": "dark"})
+        sessions.local_sessions.clear()
+        self.assertEqual(async_to_sync(sessions.SessionStore(key).aload)(), {"theme": "dark"})
+        self.assertIsNotNone(self.cached(key))
+        async_to_sync(store.adelete)()
+        self.assertIsNone(self.cached(key))
+
+
+class UploadCountTests(TestCase):
+    """CustomUser.upload_count is kept by accounts.signals and repaired by reconcile_upload_counts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("counted")
+
+    def count(self):
+        return CustomUser.objects.get(pk=self.user.pk).upload_count
+
+    def test_create_and_delete_adjust_the_count(self):
+        first = UploadedFile.objects.create(user=self.user, title="First")
+        UploadedFile.objects.create(user=self.user, title="Second")
+        self.assertEqual(self.count(), 2)
+        first.delete()
+        self.assertEqual(self.count(), 1)
+        # Queryset deletes send post_delete for every row too.
+        UploadedFile.objects.filter(user=self.user).delete()
+        self.assertEqual(self.count(), 0)
+
+    def test_loaded_user_is_kept_in_step(self):
+        upload = UploadedFile.objects.create(user=self.user, title="Cached owner")
+        self.assertEqual(upload.user.upload_count, 1)
+
+    def test_count_never_goes_negative(self):
+        upload = UploadedFile.objects.create(user=self.user, title="Drifted")
+        CustomUser.objects.filter(pk=self.user.pk).update(upload_count=0)
+        upload.delete()
+        self.assertEqual(self.count(), 0)
+
+    def test_reconcile_fixes_drift(self):
+        UploadedFile.objects.bulk_create([UploadedFile(user=self.user, title=f"Bulk {i}") for i in range(3)])
+        other = CustomUser.objects.create_user("overcounted")
+        CustomUser.objects.filter(pk=other.pk).update(upload_count=5)
+        out = io.StringIO()
+        call_command("reconcile_upload_counts", dry_run=True, stdout=out)
+        self.assertIn(f"counted (id {self.user.pk}): stored 0, actual 3", out.getvalue())
+        self.assertIn("2 user(s) drifted", out.getvalue())
+        self.assertEqual(self.count(), 0)
+
+        call_command("reconcile_upload_counts", stdout=io.StringIO())
+        self.assertEqual(self.count(), 3)
+        self.assertEqual(CustomUser.objects.get(pk=other.pk).upload_count, 0)
+
+
+class UploadsFragmentCacheTests(TestCase):
+    """The per-user uploads fragment cache in accounts.caching."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("cached")
+        cls.other = CustomUser.objects.create_user("bystander")
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_version_changes_after_save_and_delete_commit(self):
+        version, other_version = caching.uploads_version(self.user.pk), caching.uploads_version(self.other.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = UploadedFile.objects.create(user=self.user, title="Versioned")
+            # Not before the commit, or a concurrent request could cache the old list under the new version.
+            self.assertEqual(caching.uploads_version(self.user.pk), version)
+        self.assertNotEqual(caching.uploads_version(self.user.pk), version)
+
+        version = caching.uploads_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.title = "Renamed"
+            upload.save()
+        self.assertNotEqual(caching.uploads_version(self.user.pk), version)
+
+        version = caching.uploads_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.delete()
+        self.assertNotEqual(caching.uploads_version(self.user.pk), version)
+        self.assertEqual(caching.uploads_version(self.other.pk), other_version)
+
+    def test_my_books_serves_the_cached_list_until_uploads_change(self):
+        UploadedFile.objects.create(user=self.user, title="First book")
+        self.client.force_login(self.user)
+        url = reverse("accounts:my_books")
+        self.assertContains(self.client.get(url), "First book")
+        self.assertContains(self.client.get(url), "First book")
+        self.assertEqual(caching.stats()["hits"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadedFile.objects.create(user=self.user, title="Fresh arrival")
+        self.assertContains(self.client.get(url), "Fresh arrival")
+        self.assertEqual(caching.stats()["misses"], 2)
+
+
+@override_settings(CATALOGUE_CACHE_TTL=30)
+class CatalogueTests(TestCase):
+    """The public catalogue filters and the stampede-protected cache in front of them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("catalogued")
+        for title, year, cost in (
+            ("Old and free", 1950, "0"),
+            ("Nineties", 1995, "9.99"),
+            ("Millennium", 2000, "10.00"),
+            ("Unknown year", None, "25.50"),
+        ):
+            UploadedFile.objects.create(user=cls.user, title=title, visibility="public", year_published=year, cost=cost)
+        UploadedFile.objects.create(user=cls.user, title="Hidden", visibility="private", year_published=1995)
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def titles(self, **params):
+        response = self.client.get(reverse("api:catalogue"), {"fields": "title", **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(row["title"] for row in response.json()["results"])
+
+    def test_year_filters_are_inclusive(self):
+        self.assertEqual(self.titles(year_min=1995), ["Millennium", "Nineties"])
+        self.assertEqual(self.titles(year_max=1995), ["Nineties", "Old and free"])
+        self.assertEqual(self.titles(year_min=1995, year_max=1995), ["Nineties"])
+
+    def test_cost_filters_are_inclusive(self):
+        self.assertEqual(self.titles(cost_max="9.99"), ["Nineties", "Old and free"])
+        self.assertEqual(self.titles(cost_min="10", cost_max="25.50"), ["Millennium", "Unknown year"])
+        self.assertEqual(self.titles(cost_min="10", year_max=2000), ["Millennium"])
+
+    def test_invalid_ranges_are_rejected(self):
+        for params in ({"year_min": 2000, "year_max": 1990}, {"cost_min": "5", "cost_max": "1"}, {"cost_min": "-1"}):
+            response = self.client.get(reverse("api:catalogue"), params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_value_is_computed_once_while_fresh(self):
+        compute = mock.Mock(return_value="page")
+        self.assertEqual(caching.get_or_compute("k", compute, ttl=30), "page")
+        self.assertEqual(caching.get_or_compute("k", compute, ttl=30), "page")
+        self.assertEqual(compute.call_count, 1)
+        self.assertIsNone(caches["default"].get("k:lock"))
+
+    def test_stale_value_is_served_while_another_caller_recomputes(self):
+        caching.get_or_compute("k", lambda: "old", ttl=30)
+        later = time.time() + 31
+        with mock.patch("accounts.caching.time.time", return_value=later):
+            caches["default"].add("k:lock", 1)
+            compute = mock.Mock(return_value="new")
+            self.assertEqual(caching.get_or_compute("k", compute, ttl=30), "old")
+            compute.assert_not_called()
+            # Once the lock is free, the next caller refreshes the entry.
+            caches["default"].delete("k:lock")
+            self.assertEqual(caching.get_or_compute("k", compute, ttl=30), "new")
+        self.assertEqual(caching.get_or_compute("k", compute, ttl=30), "new")
+        self.assertEqual(compute.call_count, 1)
+
+    def test_caller_without_a_value_waits_for_the_lock_holder(self):
+        caches["default"].add("k:lock", 1)
+
+        def lock_holder_finishes(seconds):
+            caches["default"].set("k", {"value": "computed elsewhere", "fresh_until": time.time() + 30})
+
+        compute = mock.Mock(return_value="computed here")
+        with mock.patch("accounts.caching.time.sleep", side_effect=lock_holder_finishes) as sleep:
+            self.assertEqual(caching.get_or_compute("k", compute, ttl=30), "computed elsewhere")
+        self.assertEqual(sleep.call_count, 1)
+        compute.assert_not_called()
+
+    def test_caller_computes_itself_when_the_lock_holder_is_too_slow(self):
+        caches["default"].add("k:lock", 1)
+        with mock.patch("accounts.caching.time.sleep") as sleep:
+            self.assertEqual(caching.get_or_compute("k", lambda: "computed here", ttl=30), "computed here")
+        self.assertEqual(sleep.call_count, 20)
+        # The lock still belongs to the slow caller.
+        self.assertEqual(caches["default"].get("k:lock"), 1)
+
+    def test_lock_is_released_when_compute_fails(self):
+        with self.assertRaises(RuntimeError):
+            caching.get_or_compute("k", mock.Mock(side_effect=RuntimeError), ttl=30)
+        self.assertIsNone(caches["default"].get("k:lock"))
+        self.assertEqual(caching.get_or_compute("k", lambda: "page", ttl=30), "page")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImportDataTests(TestCase):
+    """`manage.py import_data` imports valid rows and reports the rest."""
+
+    def run_import(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8") as fh:
+            fh.write(content)
+        self.addCleanup(os.remove, fh.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_data", fh.name, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue().splitlines()
+
+    def test_invalid_user_rows_are_reported_and_skipped(self):
+        CustomUser.objects.create_user("taken")
+        out, errors = self.run_import(
+            "username,email,birth_year,password\n"
+            "ada,ada@example.com,1990,\n"
+            "bad name!,x@example.com,,\n"
+            "old,old@example.com,1800,\n"
+            "taken,t@example.com,,\n"
+            "ada,again@example.com,,\n"
+            "raw,raw@example.com,,hunter2\n",
+            ".csv",
+            kind="users",
+            batch_size=2,
+        )
+        self.assertIn("Imported 1 users", out)
+        self.assertIn("5 row(s) rejected", out)
+        self.assertEqual([line.split(":")[0] for line in errors], ["line 3", "line 4", "line 5", "line 6", "line 7"])
+        self.assertIn("birth_year: Birth year must be >= 1900", errors[1])
+        self.assertIn("'ada' already exists", errors[3])
+        self.assertIn("password: Must be an encoded password hash", errors[4])
+        ada = CustomUser.objects.get(username="ada")
+        self.assertEqual((ada.birth_year, ada.has_usable_password()), (1990, False))
+
+    def test_invalid_upload_rows_are_reported_and_skipped(self):
+        owner = CustomUser.objects.create_user("owner")
+        stored = UploadedFile(user=owner, title="Stored")
+        stored.file = ContentFile(PDF, name="stored.pdf")
+        stored.save()
+        rows = [
+            {"username": "owner", "title": "Imported", "cost": "2.50", "file": stored.file.name},
+            {"username": "nobody", "title": "Orphan"},
+            {"username": "owner", "title": "Missing file", "file": "blobs/nowhere.pdf"},
+            {"username": "owner", "title": "Bad", "visibility": "secret", "year_published": 1200},
+            {"username": "owner", "title": "Escape", "file": "../../etc/passwd"},
+            {"username": "owner", "title": "Absolute", "file": "/etc/passwd"},
+        ]
+        content = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+        out, errors = self.run_import(content, ".ndjson", kind="uploads")
+        self.assertIn("Imported 1 uploads", out)
+        self.assertEqual(
+            [line.split(":")[0] for line in errors], ["line 2", "line 3", "line 4", "line 5", "line 6", "line 7"]
+        )
+        self.assertIn("no user 'nobody'", errors[0])
+        self.assertIn("is not in upload storage", errors[1])
+        self.assertIn("visibility:", errors[2])
+        self.assertIn("year_published:", errors[2])
+        self.assertIn("file: Must be a relative path inside upload storage.", errors[3])
+        self.assertIn("file: Must be a relative path inside upload storage.", errors[4])
+        self.assertIn("unreadable row", errors[5])
+        imported = UploadedFile.objects.get(title="Imported")
+        self.assertEqual((imported.file.name, imported.content_hash), (stored.file.name, stored.content_hash))
+        self.assertEqual(CustomUser.objects.get(pk=owner.pk).upload_count, 2)
+        self.assertEqual(StoredBlob.objects.get(digest=stored.content_hash).ref_count, 2)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DedupeUploadsTests(TestCase):
+    """`manage.py dedupe_uploads` moves legacy files into content-addressed blobs."""
+
+    def test_rows_sharing_a_legacy_file_all_move(self):
+        user = CustomUser.objects.create_user("legacy")
+        storage = upload_storage()
+        legacy = "uploads/2020/legacy.pdf"
+        os.makedirs(os.path.dirname(storage.path(legacy)), exist_ok=True)
+        with open(storage.path(legacy), "wb") as fh:
+            fh.write(PDF + b"legacy")
+        first = UploadedFile.objects.create(user=user, title="First", file=legacy)
+        second = UploadedFile.objects.create(user=user, title="Second", file=legacy)
+        UploadedFile.objects.filter(pk=second.pk).update(content_hash="0" * 64)
+
+        call_command("dedupe_uploads", stdout=io.StringIO(), stderr=io.StringIO())
+
+        digest = hashlib.sha256(PDF + b"legacy").hexdigest()
+        for upload in (first, second):
+            upload.refresh_from_db()
+            self.assertEqual((upload.file.name, upload.content_hash, upload.filename),
+                             (storage.blob_name(digest, legacy), digest, "legacy.pdf"))
+        self.assertEqual(StoredBlob.objects.get(digest=digest).ref_count, 2)
+        self.assertTrue(storage.exists(first.file.name))
+        self.assertFalse(os.path.exists(storage.path(legacy)))
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import views, async_views
 
 app_name = "accounts"
 
@@ -20,5 +21,11 @@ urlpatterns = [
     # My Books dashboard (requires user to have uploads)
     path("my-books/", views.my_books_dashboard, name="my_books"),
     # Session-authenticated download for My Books page
-    path("download/<int:pk>/", views.download_my_book, name="download_my_book"),
+    path(
+        "download/<int:pk>/",
+        async_views.download_my_book if getattr(settings, "ASYNC_VIEWS", False) else views.download_my_book,
+        name="download_my_book",
+    ),
+    # Staff-only hit/miss counters for the cached uploads lists
+    path("cache-stats/", views.fragment_cache_stats, name="fragment_cache_stats"),
 ]
@@ -7,20 +7,23 @@ from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.views import LoginView
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from .models import UploadedFile
-from .forms import UploadedFileForm, TwoStepLoginForm, TwoStepCodeForm
+from .search import search_users
+from .pagination import KeysetPaginator, KeysetPage, InvalidCursor
+from .access import downloadable_upload
+from .downloads import serve_upload
+from .query_budget import query_budget
+from .mail import enqueue_mail
+from . import caching, middleware, otp, ratelimit
+from .caching import cached_uploads_fragment
+from .forms import UploadedFileForm, TwoStepLoginForm, TwoStepCodeForm, DirectoryFilterForm
 from functools import wraps
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.urls import reverse
-from django.shortcuts import get_object_or_404
-from django.http import FileResponse
-import mimetypes
 from django.conf import settings
 from django.utils import timezone
-import random
-import string
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,6 +50,7 @@ def _apply_bootstrap_attrs(form):
             attrs["placeholder"] = field.label
 
 
+@query_budget(11)
 def register(request):
     """Register a new user. On success, log the user in and redirect to home.
 
@@ -66,6 +70,7 @@ def register(request):
     return render(request, "accounts/register.html", {"form": form})
 
 
+@query_budget(4)
 def logout_view(request):
     """Log the user out and redirect to home. Accepts GET for convenience in the navbar link."""
     logout(request)
@@ -83,25 +88,65 @@ class ThemedLoginView(LoginView):
         return form
 
 
+# Keyset orderings for the directory sorts; age sorts run on birth_year so they can use its index.
+DIRECTORY_ORDERINGS = {
+    "": ("-date_joined", "-id"),
+    "age": ("-birth_year", "-id"),
+    "-age": ("birth_year", "id"),
+}
+
+
+def public_users_page(q="", cursor=None, min_age=None, max_age=None, sort=""):
+    """Return one page of the public Authors & Sellers directory.
+
+    Browsing uses keyset pagination on (date_joined, id), or on (birth_year, id)
+    when sorting by age; a search returns a single page of the best matches.
+    Users carry an `age` annotation derived from birth_year. Raises
+    InvalidCursor for a bad cursor.
+    """
+    User = get_user_model()
+    qs = User.objects.public().age_between(min_age, max_age).with_age()
+    if q:
+        limit = getattr(settings, "AUTHORS_SELLERS_SEARCH_LIMIT", 50)
+        return KeysetPage(list(search_users(qs, q)[:limit]), None)
+    if sort:
+        # Users without a birth year (or with one in the future) have no age to sort by.
+        qs = qs.filter(birth_year__lte=qs.current_year())
+    page_size = getattr(settings, "AUTHORS_SELLERS_PAGE_SIZE", 24)
+    return KeysetPaginator(qs, DIRECTORY_ORDERINGS[sort or ""], page_size).page(cursor)
+
+
+@query_budget(3)
 def authors_sellers(request):
     """List users who opted into public visibility.
 
-    Supports simple search via query parameter `q` across username, first_name, last_name, and email.
+    Supports search via query parameter `q` across username, first_name, last_name, and email.
+    Searches go through the indexed backend in `accounts.search` and return the best matches first;
+    without `q` the directory is paginated newest-first with an opaque `cursor` parameter.
+    `min_age`/`max_age` filter and `sort=age|-age` orders by age (see DirectoryFilterForm).
     """
-    User = get_user_model()
-    qs = User.objects.filter(public_visibility=True)
     q = request.GET.get("q", "").strip()
-    if q:
-        qs = qs.filter(
-            Q(username__icontains=q)
-            | Q(first_name__icontains=q)
-            | Q(last_name__icontains=q)
-            | Q(email__icontains=q)
+    filter_form = DirectoryFilterForm(request.GET)
+    filters = filter_form.cleaned_data if filter_form.is_valid() else {}
+    try:
+        page = public_users_page(
+            q,
+            request.GET.get("cursor"),
+            min_age=filters.get("min_age"),
+            max_age=filters.get("max_age"),
+            sort=filters.get("sort", ""),
         )
-    qs = qs.order_by("-date_joined")
-    return render(request, "accounts/authors_sellers.html", {"users": qs, "q": q})
+    except InvalidCursor:
+        return redirect("accounts:authors_sellers")
+    _apply_bootstrap_attrs(filter_form)
+    return render(
+        request,
+        "accounts/authors_sellers.html",
+        {"users": page, "q": q, "next_cursor": page.next_cursor, "filter_form": filter_form},
+    )
 
 
+@query_budget(13)
 @login_required
 def upload_books_dashboard(request):
     """Upload Books dashboard: upload a new file and list user's uploads."""
@@ -119,44 +164,62 @@ def upload_books_dashboard(request):
     # Apply bootstrap styles similar to other forms
     _apply_bootstrap_attrs(form)
 
+    # Lazy queryset: only evaluated when the cached fragment is missing or stale
     uploads = UploadedFile.objects.filter(user=request.user)
-    return render(request, "accounts/upload_books.html", {"form": form, "uploads": uploads})
+    uploads_html = cached_uploads_fragment(request, "accounts/_upload_books_list.html", {"uploads": uploads})
+    return render(request, "accounts/upload_books.html", {"form": form, "uploads_html": uploads_html})
 
 
 def require_user_has_uploads(view_func):
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
-        has_uploads = UploadedFile.objects.filter(user=request.user).exists()
-        if not has_uploads:
+        # Denormalized on the user row, so no query against the uploads table.
+        if not request.user.upload_count:
             return HttpResponseRedirect(reverse("accounts:upload_books"))
         return view_func(request, *args, **kwargs)
     return _wrapped
 
 
+@query_budget(3)
 @login_required
 @require_user_has_uploads
 def my_books_dashboard(request):
     uploads = UploadedFile.objects.filter(user=request.user).order_by("-created_at")
-    return render(request, "accounts/my_books.html", {"uploads": uploads})
+    uploads_html = cached_uploads_fragment(request, "accounts/_my_books_list.html", {"uploads": uploads})
+    return render(request, "accounts/my_books.html", {"uploads_html": uploads_html})
+
+
+@query_budget(2)
+@staff_member_required
+def fragment_cache_stats(request):
+    """Hit/miss counters for the cached uploads fragments, as JSON (staff only)."""
+    return JsonResponse(caching.stats())
+
+
+@query_budget(0)
+def metrics(request):
+    """Per-view request metrics in the Prometheus text format, for METRICS_ALLOWED_IPS only."""
+    if ratelimit.client_ip(request) not in getattr(settings, "METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"]):
+        return HttpResponseForbidden()
+    return HttpResponse(middleware.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
+@query_budget(3)
 @login_required
 def download_my_book(request, pk):
-    obj = get_object_or_404(UploadedFile, pk=pk)
     # Allow owner; optionally allow public visibility files
-    if obj.user != request.user and obj.visibility != "public":
-        return HttpResponseRedirect(reverse("accounts:my_books"))
+    obj = downloadable_upload(request.user, pk)
+    if obj is None:
+        # Missing or hidden: the same 404 either way, as from the API.
+        raise Http404("No upload matches the given query.")
 
     if not obj.file:
         return HttpResponseRedirect(reverse("accounts:my_books"))
 
-    file_handle = obj.file.open("rb")
-    content_type, _ = mimetypes.guess_type(obj.file.name)
-    response = FileResponse(file_handle, content_type=content_type or "application/octet-stream")
-    response["Content-Disposition"] = f"attachment; filename={obj.file.name.split('/')[-1]}"
-    return response
+    return serve_upload(request, obj)
 
 
+@query_budget(2)
 def two_step_login(request):
     """Step 1: Accept username/password, authenticate, generate OTP, and redirect to verify."""
     if request.method == "POST":
@@ -165,8 +228,16 @@ def two_step_login(request):
         if form.is_valid():
             username = form.cleaned_data["username"]
             password = form.cleaned_data["password"]
+            # Reject before authenticate() so throttled attempts never pay for password hashing
+            wait = ratelimit.check_login(request, username)
+            if wait:
+                messages.error(request, f"Too many failed login attempts. Try again in {wait} seconds.")
+                response = render(request, "accounts/two_step_login.html", {"form": form}, status=429)
+                response["Retry-After"] = str(wait)
+                return response
             user = authenticate(request, username=username, password=password)
             if user is None or not getattr(user, "is_active", True):
+                ratelimit.record_failure(request, username)
                 messages.error(request, "Invalid credentials or inactive account.")
             else:
                 # Require an email address to deliver the verification code
@@ -177,32 +248,31 @@ def two_step_login(request):
                         "No email is associated with this account. Please add an email to receive the verification code.",
                     )
                 else:
-                    # generate 6-digit code and store in session with expiry (5 minutes)
-                    code = "".join(random.choices(string.digits, k=6))
-                    request.session["two_step_user_id"] = user.id
-                    request.session["two_step_code"] = code
-                    request.session["two_step_expires_at"] = (timezone.now() + timezone.timedelta(minutes=5)).isoformat()
-
-                    # Send the code via email
-                    from django.core.mail import send_mail
+                    # Generate a 6-digit code; the challenge lives in the cache, keyed by a cookie
+                    challenge_id, code = otp.issue_challenge(user.id)
+                    verify_redirect = otp.set_challenge_cookie(redirect("accounts:login_two_step_verify"), challenge_id)
+
+                    # Queue the code for delivery; the send_queued_mail worker sends it
                     try:
-                        send_mail(
+                        enqueue_mail(
                             subject="Your verification code",
                             message=f"Your verification code is: {code}",
                             from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
                             recipient_list=[email],
-                            fail_silently=False,
+                            # No use retrying once the code has expired.
+                            ttl=getattr(settings, "OTP_TTL_SECONDS", 300),
                         )
                         messages.info(request, "Verification code sent to your email.")
-                        return redirect("accounts:login_two_step_verify")
+                        return verify_redirect
                     except Exception as e:
-                        logger.exception("Failed to send verification email for user '%s'", username)
+                        logger.exception("Failed to queue verification email for user '%s'", username)
                         if getattr(settings, "DEBUG", False):
                             messages.warning(
                                 request,
                                 "Email delivery failed in development; proceeding to verification page.",
                             )
-                            return redirect("accounts:login_two_step_verify")
+                            return verify_redirect
+                        otp.discard_challenge(challenge_id)
                         messages.error(request, "Could not send verification email. Please try again later.")
     else:
         form = TwoStepLoginForm()
@@ -210,27 +280,15 @@ def two_step_login(request):
     return render(request, "accounts/two_step_login.html", {"form": form})
 
 
+@query_budget(9)
 def two_step_verify(request):
     """Step 2: Verify the code and complete login."""
-    user_id = request.session.get("two_step_user_id")
-    session_code = request.session.get("two_step_code")
-    expires_at = request.session.get("two_step_expires_at")
+    challenge_id = otp.challenge_id_from(request)
+    challenge = otp.get_challenge(challenge_id)
 
-    if not user_id or not session_code or not expires_at:
-        messages.error(request, "Verification session expired or not started.")
-        return redirect("accounts:login_two_step")
-
-    # Expiry check
-    try:
-        expires_dt = timezone.datetime.fromisoformat(expires_at)
-        if timezone.is_naive(expires_dt):
-            expires_dt = timezone.make_aware(expires_dt)
-    except Exception:
-        expires_dt = timezone.now()
-    if timezone.now() > expires_dt:
-        for k in ("two_step_user_id", "two_step_code", "two_step_expires_at"):
-            request.session.pop(k, None)
-        messages.error(request, "Verification code expired. Please log in again.")
+    if challenge is None:
+        # Never started, or the code's TTL ran out in the cache.
+        messages.error(request, "Verification session expired or not started. Please log in again.")
         return redirect("accounts:login_two_step")
 
     if request.method == "POST":
@@ -238,21 +296,30 @@ def two_step_verify(request):
         _apply_bootstrap_attrs(form)
         if form.is_valid():
             code = form.cleaned_data["code"].strip()
-            if code == session_code:
+            otp_user = str(challenge["user_id"])
+            wait = ratelimit.check_login(request, otp_user, scope="otp", hashes=0)
+            if wait:
+                messages.error(request, f"Too many invalid codes. Try again in {wait} seconds.")
+                response = render(request, "accounts/two_step_verify.html", {"form": form}, status=429)
+                response["Retry-After"] = str(wait)
+                return response
+            try:
+                verified = otp.check_code(challenge_id, challenge, code)
+            except otp.TooManyAttempts as e:
+                messages.error(request, f"{e} Please log in again.")
+                return redirect("accounts:login_two_step")
+            if verified:
                 User = get_user_model()
                 try:
-                    user = User.objects.get(id=user_id)
+                    user = User.objects.get(id=challenge["user_id"])
                 except User.DoesNotExist:
                     user = None
-                for k in ("two_step_user_id", "two_step_code", "two_step_expires_at"):
-                    request.session.pop(k, None)
                 if user:
                     # Send login notification to a specific recipient if configured
                     notify_recipient = getattr(settings, "LOGIN_NOTIFICATION_RECIPIENT", None)
                     if notify_recipient:
-                        from django.core.mail import send_mail
                         try:
-                            send_mail(
+                            enqueue_mail(
                                 subject="User Login Notification",
                                 message=(
                                     f"User '{user.username}' logged in successfully at "
@@ -260,17 +327,19 @@ def two_step_verify(request):
                                 ),
                                 from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
                                 recipient_list=[notify_recipient],
-                                fail_silently=True,
                             )
                         except Exception:
                             # Silently ignore notification failures to not block login
                             pass
                     login(request, user)
                     messages.success(request, "Login successful.")
-                    return redirect("home")
+                    response = redirect("home")
+                    response.delete_cookie(otp.COOKIE_NAME)
+                    return response
                 else:
                     messages.error(request, "User not found.")
             else:
+                ratelimit.record_failure(request, otp_user, scope="otp")
                 messages.error(request, "Invalid verification code.")
     else:
         form = TwoStepCodeForm()
@@ -279,6 +348,6 @@ def two_step_verify(request):
     # In development, you may want to show the code for testing
     dev_hint = None
     if getattr(settings, "DEBUG", False):
-        dev_hint = session_code
+        dev_hint = challenge.get("dev_code")
 
     return render(request, "accounts/two_step_verify.html", {"form": form, "dev_code": dev_hint})
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    "accounts.middleware.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -58,7 +61,8 @@ ROOT_URLCONF = "social_book.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django's backend with render timing for PerformanceMiddleware
+        "BACKEND": "accounts.template_backends.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -72,6 +76,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "social_book.wsgi.application"
+ASGI_APPLICATION = "social_book.asgi.application"
+# Route the upload list/detail/download endpoints to the async views (accounts/async_views.py).
+# Only worth it under an ASGI server such as uvicorn; under WSGI they run through async_to_sync.
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False") == "True"
 
 
 
@@ -82,6 +90,57 @@ DATABASES = {
     }
 }
 
+# Cache: set REDIS_URL (e.g. redis://localhost:6379/0) to share it between processes.
+# The local-memory fallback is per process, so use Redis whenever more than one worker runs.
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "social-book"}}
+
+# Session engine. "accounts.sessions" is cached_db with a short-lived per-process LRU in front;
+# only use it (or cached_db) with a shared cache, i.e. when REDIS_URL is set.
+SESSION_ENGINE = os.getenv(
+    "SESSION_ENGINE",
+    "accounts.sessions" if REDIS_URL else "django.contrib.sessions.backends.db",
+)
+SESSION_LOCAL_CACHE_SIZE = int(os.getenv("SESSION_LOCAL_CACHE_SIZE", "10000"))
+# Seconds another process's change (e.g. a logout) can take to be seen by this one
+SESSION_LOCAL_CACHE_TTL = int(os.getenv("SESSION_LOCAL_CACHE_TTL", "5"))
+
+# Rendered uploads lists (My Books, Upload Books) are cached per user; see accounts/caching.py
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv("FRAGMENT_CACHE_TIMEOUT", "3600"))
+
+# Public catalogue API: page size and how long pages are cached (and may be cached by proxies)
+CATALOGUE_PAGE_SIZE = int(os.getenv("CATALOGUE_PAGE_SIZE", "50"))
+CATALOGUE_CACHE_TTL = int(os.getenv("CATALOGUE_CACHE_TTL", "30"))
+
+# Two-step login codes live in this cache (see accounts/otp.py), not in the session
+OTP_CACHE_ALIAS = os.getenv("OTP_CACHE_ALIAS", "default")
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "300"))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+
+# Failed logins allowed per client IP and per username within a sliding window ("count/period",
+# period in s/m/h/d, e.g. "10/5m"). Over the limit, login views answer 429 without hashing.
+# Counts live in the default cache, so limits and `manage.py ratelimit_stats` need REDIS_URL
+# once more than one process serves requests.
+LOGIN_RATE_LIMITS = {
+    "ip": os.getenv("LOGIN_RATE_LIMIT_IP", "30/10m"),
+    "username": os.getenv("LOGIN_RATE_LIMIT_USERNAME", "10/10m"),
+}
+# Request header holding the client IP; set to e.g. HTTP_X_REAL_IP behind a trusted proxy
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER", "REMOTE_ADDR")
+
+# Request instrumentation (accounts/middleware.py). Prometheus scrapes /metrics from these
+# client IPs (resolved like the rate limiter's, via RATE_LIMIT_IP_HEADER).
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip.strip()]
+# Server-Timing response header with the db/template/app breakdown; exposes timings, so off in production
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", str(DEBUG)) == "True"
+# Log a possible N+1 when one request runs the same statement this many times (0 disables)
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Log requests that run more queries than their view's @query_budget (see accounts/query_budget.py)
+QUERY_BUDGET_LOG = os.getenv("QUERY_BUDGET_LOG", "True") == "True"
+
 
 
 
@@ -131,6 +190,25 @@ AUTH_USER_MODEL = "accounts.CustomUser"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    # UploadedFile.file: stores each distinct file once, named by its SHA-256
+    "uploads": {"BACKEND": os.getenv("UPLOAD_STORAGE_BACKEND", "accounts.storage.ContentAddressedStorage")},
+}
+
+# How authorized downloads are transferred once access has been checked:
+#   accounts.downloads.FileResponseBackend   - stream from Python (development)
+#   accounts.downloads.XAccelRedirectBackend - nginx X-Accel-Redirect
+#   accounts.downloads.XSendfileBackend      - Apache/lighttpd X-Sendfile
+DOWNLOAD_BACKEND = os.getenv("DOWNLOAD_BACKEND", "accounts.downloads.FileResponseBackend")
+# Internal nginx location aliasing MEDIA_ROOT, used by XAccelRedirectBackend
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.getenv("DOWNLOAD_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+
+# Resumable chunked uploads: partial files live here (outside MEDIA_ROOT) until finalized
+CHUNKED_UPLOAD_DIR = os.getenv("CHUNKED_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "social_book_chunks"))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.getenv("CHUNKED_UPLOAD_MAX_SIZE", str(1024 ** 3)))
+
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
@@ -151,5 +229,22 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", "10"))
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER or "noreply@socialbook.local")
+# With EMAIL_BACKEND=accounts.email_backends.PooledSMTPBackend, authenticated SMTP connections
+# are kept open and reused: up to EMAIL_POOL_SIZE idle per process, probed with NOOP after
+# EMAIL_POOL_HEALTHCHECK_AFTER idle seconds and closed after EMAIL_POOL_IDLE_TIMEOUT.
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", "4"))
+EMAIL_POOL_HEALTHCHECK_AFTER = int(os.getenv("EMAIL_POOL_HEALTHCHECK_AFTER", "5"))
+EMAIL_POOL_IDLE_TIMEOUT = int(os.getenv("EMAIL_POOL_IDLE_TIMEOUT", "60"))
+
+# Outbound mail is queued in the database and delivered by `manage.py send_queued_mail`.
+# MAIL_QUEUE_EAGER=True delivers right after the request commits (no worker; development only).
+MAIL_QUEUE_EAGER = os.getenv("MAIL_QUEUE_EAGER", "False") == "True"
+MAIL_QUEUE_BATCH_SIZE = int(os.getenv("MAIL_QUEUE_BATCH_SIZE", "50"))
+MAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv("MAIL_QUEUE_MAX_ATTEMPTS", "5"))
+# Retry delay doubles per failed attempt, starting at the base and capped at the max
+MAIL_QUEUE_RETRY_BASE_SECONDS = int(os.getenv("MAIL_QUEUE_RETRY_BASE_SECONDS", "30"))
+MAIL_QUEUE_RETRY_MAX_SECONDS = int(os.getenv("MAIL_QUEUE_RETRY_MAX_SECONDS", "3600"))
+# Sent and failed messages are deleted by `manage.py purge_sent_mail` after this many days
+MAIL_QUEUE_RETENTION_DAYS = int(os.getenv("MAIL_QUEUE_RETENTION_DAYS", "7"))
 
 LOGIN_NOTIFICATION_RECIPIENT = os.getenv("LOGIN_NOTIFICATION_RECIPIENT", None)
@@ -4,6 +4,7 @@ from django.urls import path, include
 from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
+from accounts.views import metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -11,6 +12,8 @@ urlpatterns = [
     path("auth/", include("djoser.urls")),
     path("auth/", include("djoser.urls.jwt")),
     path("api/", include("accounts.api_urls")),
+    # Prometheus scrape target (see accounts/middleware.py)
+    path("metrics", metrics, name="metrics"),
     path("", TemplateView.as_view(template_name="index.html"), name="home"),
 ]
 